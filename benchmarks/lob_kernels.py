@@ -0,0 +1,98 @@
+"""
+Python vs compiled LOB kernels (external_traders/lob_kernels.py).
+
+Times each @jit kernel of the noise trader module per call on its Python code (py_func) and compiled by numba, and
+an offline simulation made of them: a stream of sell orders hitting a bid side that is replenished by insertions.
+The simulation is timed as a Python loop over the Python kernels, as a Python loop over the compiled kernels, and
+as a loop compiled with numba that calls the kernels' dispatchers (get_compiled). Without numba only the Python
+timings are reported. The first call of each compiled function (the compilation) is not timed.
+
+    python -m benchmarks.lob_kernels --orders 10000
+"""
+import argparse
+import time
+import timeit
+
+import numpy as np
+
+from external_traders.lob_kernels import JIT_ENABLED
+from external_traders.noise_trader import get_noise_condition_price, get_exec_sell_trd, get_insert_sell
+
+LEVELS_N = 10
+
+
+def make_orders(n, seed=0):
+    rng = np.random.default_rng(seed)
+    bid_prices = 2000. - np.arange(LEVELS_N)
+    bid_sizes = rng.integers(1, 4, LEVELS_N).astype(np.float64)
+    order_prices = 2000. - rng.integers(0, 3, n).astype(np.float64)
+    order_sizes = rng.integers(1, 4, n).astype(np.float64)
+    return bid_prices, bid_sizes, order_prices, order_sizes
+
+
+def simulate(exec_sell, insert, bid_prices, bid_sizes, order_prices, order_sizes):
+    """Sells hit the bids; the executed size comes back on the best bid (seen from the sell side: a negated book)."""
+    bid_sizes = bid_sizes.copy()
+    volume = 0.
+    for i in range(len(order_prices)):
+        bid_sizes, exec_price, exec_size = exec_sell(bid_prices, bid_sizes, order_prices[i], order_sizes[i])
+        if exec_size == exec_size:  # not nan
+            volume += exec_size
+            _, bid_sizes = insert(-bid_prices, bid_sizes, -bid_prices[0], exec_size)
+    return volume
+
+
+def time_call(func, args, number):
+    return min(timeit.repeat(lambda: func(*args), number=number, repeat=5)) / number
+
+
+def time_run(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=10000, help='sell orders in the simulation')
+    args = parser.parse_args()
+
+    bid_prices, bid_sizes, order_prices, order_sizes = make_orders(args.orders)
+    cases = {
+        'get_noise_condition_price': (get_noise_condition_price, (bid_prices, bid_sizes, 3.)),
+        'get_exec_sell_trd': (get_exec_sell_trd, (bid_prices, bid_sizes.copy(), 1999., 2.)),
+        'get_insert_sell': (get_insert_sell, (-bid_prices, bid_sizes.copy(), -2001., 1.)),
+    }
+    print(f'numba: {"on" if JIT_ENABLED else "not installed or off (LOB_KERNELS_JIT=0)"}')
+    print(f'{"kernel (per call)":<40}{"python":>12}{"compiled":>12}{"speedup":>10}')
+    for name, (kernel, kernel_args) in cases.items():
+        python = time_call(kernel.py_func, kernel_args, 2000)
+        line = f'{name:<40}{python * 1e6:>10.2f}us'
+        if JIT_ENABLED:
+            kernel(*kernel_args)
+            compiled = time_call(kernel, kernel_args, 2000)
+            line += f'{compiled * 1e6:>10.2f}us{python / compiled:>9.1f}x'
+        print(line)
+
+    book = (bid_prices, bid_sizes, order_prices, order_sizes)
+    runs = {'python loop, python kernels': lambda: simulate(get_exec_sell_trd.py_func, get_insert_sell.py_func,
+                                                            *book)}
+    if JIT_ENABLED:
+        import numba
+        exec_sell, insert = get_exec_sell_trd.get_compiled(), get_insert_sell.get_compiled()
+        compiled_simulate = numba.njit(simulate)
+        compiled_simulate(exec_sell, insert, *book)
+        simulate(get_exec_sell_trd, get_insert_sell, *book)
+        runs['python loop, compiled kernels'] = lambda: simulate(get_exec_sell_trd, get_insert_sell, *book)
+        runs['compiled loop'] = lambda: compiled_simulate(exec_sell, insert, *book)
+
+    print(f'\n{"simulation of " + str(args.orders) + " orders":<40}{"seconds":>12}{"speedup":>10}')
+    baseline = None
+    for name, run in runs.items():
+        seconds = min(time_run(run) for _ in range(3))
+        baseline = baseline or seconds
+        print(f'{name:<40}{seconds:>12.4f}{baseline / seconds:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
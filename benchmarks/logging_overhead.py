@@ -0,0 +1,136 @@
+"""
+Logging overhead per processed order.
+
+The engine itself takes a few milliseconds per order and jitters more than logging costs, so timing whole orders with
+and without logging doesn't show much. Instead the benchmark:
+
+    1. runs a noise order flow through TradingSession.on_individual_message (the path every order takes) and counts
+       the log calls per order (all of them, as at DEBUG) and the records that get written at INFO
+    2. times one log call of the same kind (the 'received message' record with an order message) for each setup:
+           sync  - the old setup: a colored console handler and a file handler per module, writing on the loop thread
+           queue - the current setup: one QueueHandler, the writing happens on the listener thread
+       at INFO (written) and at WARNING (filtered out). At WARNING it also times the call with an eager f-string,
+       as the code had before
+    3. reports the logging time per order on the event loop: at INFO records per order * time per record, at
+       WARNING (nothing routine is written) log calls per order * time of a filtered out call
+
+The console goes to os.devnull, so the terminal speed doesn't count.
+
+    python -m benchmarks.logging_overhead --orders 500
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import timeit
+from types import SimpleNamespace
+
+import numpy as np
+
+from benchmarks.matching_throughput import make_session, noise_flow
+from main_platform import custom_logger
+from main_platform.custom_logger import CustomFormatter, LOG_FORMAT, start_log_listener, stop_log_listener
+
+PLATFORM_LOGGER_PREFIXES = ('main_platform', 'traders', 'external_traders', 'client_connector')
+LEVELS = {'INFO': logging.INFO, 'WARNING': logging.WARNING}
+BENCHMARK_LOGGER_NAME = 'main_platform.benchmark'
+
+
+class CountingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def get_platform_loggers():
+    return [logging.getLogger(name) for name in list(logging.Logger.manager.loggerDict)
+            if name.startswith(PLATFORM_LOGGER_PREFIXES)]
+
+
+def set_handlers(handlers_factory, level):
+    for logger in get_platform_loggers():
+        for handler in logger.handlers:
+            if handler is not custom_logger._queue_handler:
+                handler.close()
+        logger.handlers = handlers_factory(logger)
+        logger.setLevel(level)
+
+
+def sync_handlers(log_directory, devnull):
+    """The setup_custom_logger of before: two synchronous handlers per module logger."""
+    def factory(logger):
+        handlers = [logging.StreamHandler(devnull),
+                    logging.FileHandler(os.path.join(log_directory, f'{logger.name}.log'))]
+        for handler in handlers:
+            handler.setFormatter(CustomFormatter(LOG_FORMAT))
+        return handlers
+    return factory
+
+
+def queue_handlers(logger):
+    return [custom_logger._queue_handler]
+
+
+async def count_records_per_order(n_orders, seed, level):
+    counter = CountingHandler()
+    set_handlers(lambda logger: [counter], level)
+    rng = np.random.default_rng(seed)
+    session = await make_session(100, rng)
+    messages = [SimpleNamespace(body=json.dumps({'action': action, **message}).encode())
+                for action, message in noise_flow(rng, session, n_orders)]
+    counter.count = 0
+    for message in messages:
+        await session.on_individual_message(message)
+    return counter.count / n_orders
+
+
+def time_log_call(call, number):
+    return min(timeit.repeat(call, number=number, repeat=3)) / number * 1e6
+
+
+def time_record(number):
+    """Time (us) of one 'received message' log call, with lazy %-args and with an eager f-string."""
+    logger = logging.getLogger(BENCHMARK_LOGGER_NAME)
+    message = {'id': 'b0b6a4a8-5b5e-4b7a-9d53-8e6e2b7f0c11', 'trader_id': 'bench_trader_1', 'order_type': 1,
+               'price': 1995.0, 'amount': 1, 'timestamp': '2024-04-01T00:00:00+00:00'}
+    lazy = time_log_call(lambda: logger.info('TS %s received message: %s', 'session', message), number)
+    eager = time_log_call(lambda: logger.info(f'TS session received message: {message}'), number)
+    return lazy, eager
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Logging overhead per processed order')
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--calls', type=int, default=5000, help='log calls per timing')
+    args = parser.parse_args(argv)
+    logging.getLogger(BENCHMARK_LOGGER_NAME)  # so that it is one of the platform loggers
+
+    records_per_order = {'INFO': asyncio.run(count_records_per_order(args.orders, args.seed, logging.INFO)),
+                         # at WARNING the routine calls are still made, they are just filtered out
+                         'WARNING': asyncio.run(count_records_per_order(args.orders, args.seed, logging.DEBUG))}
+
+    with tempfile.TemporaryDirectory() as log_directory, open(os.devnull, 'w') as devnull:
+        for setup, factory in (('sync', sync_handlers(log_directory, devnull)), ('queue', queue_handlers)):
+            if setup == 'queue':
+                start_log_listener().handlers[0].setStream(devnull)  # the console handler
+            for level_name, level in LEVELS.items():
+                set_handlers(factory, level)
+                lazy_us, eager_us = time_record(args.calls)
+                per_order = records_per_order[level_name]
+                line = (f'{setup:>5} {level_name:>7}: {per_order:4.1f} calls/order, {lazy_us:6.2f} us/call, '
+                        f'{per_order * lazy_us:7.2f} us/order on the loop')
+                if level_name == 'WARNING':
+                    line += f' (with eager f-strings: {per_order * eager_us:7.2f} us/order)'
+                print(line)
+        stop_log_listener()  # writes out the backlog before the temporary directory goes away
+        set_handlers(queue_handlers, custom_logger.CUR_LEVEL)
+
+
+if __name__ == '__main__':
+    main()
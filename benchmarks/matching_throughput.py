@@ -0,0 +1,203 @@
+"""
+Throughput benchmark of the matching engine.
+
+Drives TradingSession matching directly (OfflineTradingSession: no broker, no Mongo, no bots) with synthetic order
+flow or with a recorded journal, and reports orders/s, fills/s and p50/p99/p999 latency per action for several
+sizes of the resting book.
+
+    python -m benchmarks.matching_throughput --flows noise informed cancel_heavy --book-sizes 100 1000 10000 \
+        --actions 1000 --output bench_results/matching.json
+    python -m benchmarks.matching_throughput --journal journals/<session_id>.journal --output replay.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+import uuid
+
+import numpy as np
+
+from main_platform.journal import read_journal, SESSION_RECORD_ACTION
+from main_platform.replay import OfflineTradingSession
+from structures import OrderType, OrderStatus
+
+N_TRADERS = 10
+MID_PRICE = 2000
+
+
+def get_trader_ids():
+    return [f'bench_trader_{i}' for i in range(N_TRADERS)]
+
+
+def new_order(trader_id, order_type: OrderType, price, amount=1):
+    return 'add_order', {'id': str(uuid.uuid4()), 'trader_id': trader_id, 'order_type': int(order_type),
+                         'price': float(price), 'amount': amount}
+
+
+def noise_flow(rng, session, n_actions):
+    """mostly passive orders within 10 levels around the mid, now and then one crossing the spread"""
+    trader_ids = get_trader_ids()
+    for _ in range(n_actions):
+        order_type = OrderType.BID if rng.random() < 0.5 else OrderType.ASK
+        if rng.random() < 0.8:
+            price = MID_PRICE - order_type * rng.integers(1, 11)
+        else:
+            price = MID_PRICE + order_type * rng.integers(1, 4)
+        yield new_order(trader_ids[rng.integers(N_TRADERS)], order_type, price)
+
+
+def informed_flow(rng, session, n_actions):
+    """one trader selling through the best bid, mixed with some passive noise to refill the book"""
+    trader_ids = get_trader_ids()
+    for _ in range(n_actions):
+        if rng.random() < 0.5:
+            yield new_order(trader_ids[0], OrderType.ASK, MID_PRICE - 20)
+        else:
+            yield new_order(trader_ids[1 + rng.integers(N_TRADERS - 1)], OrderType.BID,
+                            MID_PRICE - rng.integers(1, 11))
+
+
+def cancel_heavy_flow(rng, session, n_actions):
+    """every other action cancels one of the orders the flow posted before (if it is still there)"""
+    trader_ids = get_trader_ids()
+    posted = []
+    for _ in range(n_actions):
+        if posted and rng.random() < 0.5:
+            order_id, trader_id = posted.pop(rng.integers(len(posted)))
+            yield 'cancel_order', {'trader_id': trader_id, 'order_id': order_id}
+        else:
+            order_type = OrderType.BID if rng.random() < 0.5 else OrderType.ASK
+            action, message = new_order(trader_ids[rng.integers(N_TRADERS)], order_type,
+                                        MID_PRICE - order_type * rng.integers(1, 11))
+            posted.append((message['id'], message['trader_id']))
+            yield action, message
+
+
+FLOWS = {
+    'noise': noise_flow,
+    'informed': informed_flow,
+    'cancel_heavy': cancel_heavy_flow,
+}
+
+
+async def make_session(book_size, rng):
+    """An offline session with registered traders and `book_size` resting orders that don't cross."""
+    session = OfflineTradingSession(duration=1, default_price=MID_PRICE)
+    session.start()
+    for trader_id in get_trader_ids():
+        await session.process_action('register_me', {'trader_id': trader_id, 'trader_type': 'NOISE'})
+    for i in range(book_size):
+        order_type = OrderType.BID if i % 2 else OrderType.ASK
+        session.place_order({
+            'id': uuid.uuid4(),
+            'trader_id': get_trader_ids()[i % N_TRADERS],
+            'order_type': order_type,
+            'price': float(MID_PRICE - order_type * (5 + rng.integers(1, 50))),
+            'amount': 1.0,
+            'status': OrderStatus.BUFFERED.value,
+            'timestamp': session.creation_time,
+            'session_id': session.id,
+        })
+    return session
+
+
+async def run_actions(session, actions):
+    latencies = []
+    trades_before = len(session.trades)
+    started = time.perf_counter()
+    for action, message in actions:
+        action_started = time.perf_counter()
+        await session.process_action(action, message)
+        latencies.append(time.perf_counter() - action_started)
+    elapsed = time.perf_counter() - started
+    return summarize_run(latencies, len(session.trades) - trades_before, elapsed)
+
+
+def summarize_run(latencies, n_fills, elapsed):
+    latencies_us = np.array(latencies) * 1e6
+    return {
+        'actions': len(latencies),
+        'fills': n_fills,
+        'elapsed_s': elapsed,
+        'orders_per_s': len(latencies) / elapsed if elapsed else None,
+        'fills_per_s': n_fills / elapsed if elapsed else None,
+        'latency_us': {
+            'p50': float(np.percentile(latencies_us, 50)) if len(latencies_us) else None,
+            'p99': float(np.percentile(latencies_us, 99)) if len(latencies_us) else None,
+            'p999': float(np.percentile(latencies_us, 99.9)) if len(latencies_us) else None,
+        },
+    }
+
+
+async def benchmark_flow(flow_name, book_size, n_actions, seed):
+    rng = np.random.default_rng(seed)
+    session = await make_session(book_size, rng)
+    result = await run_actions(session, FLOWS[flow_name](rng, session, n_actions))
+    result.update({'flow': flow_name, 'book_size': book_size, 'seed': seed})
+    return result
+
+
+async def benchmark_journal(path):
+    records = list(read_journal(path))
+    header = next(r for r in records if r.action == SESSION_RECORD_ACTION)
+    session = OfflineTradingSession(duration=header.message['duration'],
+                                    default_price=header.message['default_price'])
+    session.start()
+    result = await run_actions(session, [(r.action, r.message) for r in records
+                                         if r.action != SESSION_RECORD_ACTION])
+    result.update({'flow': 'journal', 'journal': path, 'book_size': len(session.active_orders)})
+    return result
+
+
+def get_engine_version():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    results = []
+    if args.journal:
+        results.append(await benchmark_journal(args.journal))
+    else:
+        for flow_name in args.flows:
+            for book_size in args.book_sizes:
+                result = await benchmark_flow(flow_name, book_size, args.actions, args.seed)
+                print(f"{flow_name:>12} book={book_size:>7}: {result['orders_per_s']:10.1f} orders/s "
+                      f"{result['fills_per_s']:10.1f} fills/s  p50={result['latency_us']['p50']:.0f}us "
+                      f"p99={result['latency_us']['p99']:.0f}us p999={result['latency_us']['p999']:.0f}us")
+                results.append(result)
+
+    report = {
+        'engine_version': get_engine_version(),
+        'python': platform.python_version(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'results': results,
+    }
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Matching engine throughput benchmark')
+    parser.add_argument('--flows', nargs='+', choices=sorted(FLOWS), default=sorted(FLOWS))
+    parser.add_argument('--book-sizes', nargs='+', type=int, default=[100, 1000, 10000, 100000])
+    parser.add_argument('--actions', type=int, default=1000, help='number of actions per flow and book size')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--journal', help='benchmark a recorded journal instead of the synthetic flows')
+    parser.add_argument('--output', help='where to write the JSON results')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
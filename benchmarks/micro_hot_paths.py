@@ -0,0 +1,189 @@
+"""
+Micro-benchmarks of the functions that run on every bot decision: the conversions in main_platform/utils.py,
+the JSON encoder, and the external strategy functions.
+
+Inputs are generated with fixed seeds for several book sizes (number of active orders). Each case reports the best
+time per call over a few repeats, which is the least noisy estimate.
+
+    python -m benchmarks.micro_hot_paths                     # run and compare with the committed baseline
+    python -m benchmarks.micro_hot_paths --save-baseline     # overwrite the baseline (after a deliberate change)
+    python -m benchmarks.micro_hot_paths --threshold 1       # only flag slowdowns of more than 100%
+
+Every run also times a fixed piece of plain Python (the calibration case), and the comparison is made on the timings
+relative to it, so a baseline saved on another machine still tells the code changes from the speed of the machine.
+The comparison exits with a non-zero status if any case got slower than the baseline by more than the threshold.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from main_platform.utils import (CustomEncoder, convert_to_book_format, convert_order_book_to_book_format,
+                                 convert_to_noise_state, convert_to_trader_actions, expand_dataframe)
+from external_traders import noise_trader as noise_strategy
+from external_traders import informed_naive as informed_strategy
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline_micro.json')
+BOOK_SIZES = [10, 100, 1000]
+SEED = 42
+MID_PRICE = 2000
+CALIBRATION_CASE = 'calibration'
+
+
+def make_active_orders(n_orders, rng):
+    timestamp = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    orders = []
+    for i in range(n_orders):
+        is_bid = i % 2 == 0
+        orders.append({
+            'id': str(uuid.UUID(int=int(rng.integers(2 ** 63)))),
+            'trader_id': f'trader_{i % 10}',
+            'order_type': 'bid' if is_bid else 'ask',
+            'amount': 1,
+            'price': int(MID_PRICE - 1 - rng.integers(0, 20) if is_bid else MID_PRICE + rng.integers(0, 20)),
+            'status': 'active',
+            'timestamp': timestamp,
+        })
+    return orders
+
+
+def make_order_book(active_orders):
+    levels = {'bid': {}, 'ask': {}}
+    for order in active_orders:
+        side = levels[order['order_type']]
+        side[order['price']] = side.get(order['price'], 0) + order['amount']
+    return {'bids': [{'x': p, 'y': a} for p, a in sorted(levels['bid'].items(), reverse=True)],
+            'asks': [{'x': p, 'y': a} for p, a in sorted(levels['ask'].items())]}
+
+
+def make_cases(book_size):
+    """Returns {case name: zero-argument callable} for one book size."""
+    rng = np.random.default_rng(SEED + book_size)
+    active_orders = make_active_orders(book_size, rng)
+    numeric_orders = [dict(order, order_type=1 if order['order_type'] == 'bid' else -1) for order in active_orders]
+    order_book = make_order_book(active_orders)
+    book_format = convert_to_book_format(active_orders)
+    levels_df = pd.DataFrame({'price': [o['price'] for o in active_orders[:5]], 'amount': [1] * min(5, book_size)})
+    noise_state = convert_to_noise_state(numeric_orders)
+    np.random.seed(SEED)
+    signal_noise = noise_strategy.get_signal_noise(None, noise_strategy.settings_noise)
+    noise_orders = noise_strategy.get_noise_rule_unif(book_format, signal_noise, noise_state,
+                                                      noise_strategy.settings_noise, noise_strategy.settings)
+    settings_informed, informed_time_plan, informed_state = informed_strategy.update_settings_informed(
+        {'time_period_in_min': 15, 'trade_intensity': 0.1, 'direction': 'sell'})
+    # built once, like the trader does; after the first call the cursor is at the end, which is the per tick cost
+    informed_schedule = informed_strategy.ExecutionSchedule(informed_time_plan['period'], informed_time_plan['shares'])
+    broadcast = {'type': 'update', 'order_book': order_book, 'active_orders': active_orders,
+                 'spread': 1, 'midpoint': MID_PRICE - 0.5}
+
+    return {
+        'convert_to_book_format': lambda: convert_to_book_format(active_orders),
+        'convert_order_book_to_book_format': lambda: convert_order_book_to_book_format(order_book),
+        'expand_dataframe': lambda: expand_dataframe(levels_df, max_depth=10, default_price=MID_PRICE),
+        'convert_to_noise_state': lambda: convert_to_noise_state(numeric_orders),
+        'convert_to_trader_actions': lambda: convert_to_trader_actions(noise_orders),
+        'custom_encoder_broadcast': lambda: json.dumps(broadcast, cls=CustomEncoder),
+        'get_signal_noise': lambda: noise_strategy.get_signal_noise(None, noise_strategy.settings_noise),
+        'get_noise_rule_unif': lambda: noise_strategy.get_noise_rule_unif(
+            book_format, signal_noise, noise_state, noise_strategy.settings_noise, noise_strategy.settings),
+        'get_signal_informed': lambda: informed_strategy.get_signal_informed(
+            informed_state, settings_informed, informed_schedule, informed_time_plan['period'][-1]),
+        'get_order_to_match': lambda: informed_strategy.get_order_to_match(
+            book_format, [1, 1], dict(informed_state), settings_informed, noise_strategy.settings, 0),
+    }
+
+
+def time_call(func, repeat=7):
+    """Best time per call in microseconds."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, number // 2)  # autorange aims at 0.2s per repeat, half of it is enough for us
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def calibration():
+    """Fixed interpreter work (a loop, a dict and a list), the unit the other timings are measured in."""
+    levels = {}
+    for i in range(1000):
+        levels[i % 50] = levels.get(i % 50, 0) + i
+    return sorted(levels.values())
+
+
+def run_suite(book_sizes=BOOK_SIZES, only=None):
+    results = {CALIBRATION_CASE: time_call(calibration)}
+    for book_size in book_sizes:
+        for name, func in make_cases(book_size).items():
+            if only and name not in only:
+                continue
+            np.random.seed(SEED)
+            results[f'{name}[{book_size}]'] = time_call(func)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns the list of (case, baseline_us, current_us, ratio) that got slower by more than threshold. The ratio is
+    the one of the timings relative to the calibration case of their own run.
+    """
+    regressions = []
+    speed = results[CALIBRATION_CASE] / baseline[CALIBRATION_CASE]
+    print(f'{CALIBRATION_CASE:<48} {baseline[CALIBRATION_CASE]:12.2f}us {results[CALIBRATION_CASE]:12.2f}us '
+          f'{speed:7.2f}x  (machine speed, the other ratios are divided by it)')
+    for case, current in sorted(results.items()):
+        if case == CALIBRATION_CASE:
+            continue
+        reference = baseline.get(case)
+        flag = ''
+        if reference:
+            ratio = current / reference / speed
+            if ratio > 1 + threshold:
+                regressions.append((case, reference, current, ratio))
+                flag = '  <-- REGRESSION'
+            print(f'{case:<48} {reference:12.2f}us {current:12.2f}us {ratio:7.2f}x{flag}')
+        else:
+            print(f'{case:<48} {"-":>14} {current:12.2f}us   (new)')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the utils and strategy hot paths')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='relative slowdown that counts as a regression (0.5 = 50%%). Timings of the cheap '
+                             'functions jitter by a few tens of percent between runs, so keep it generous')
+    parser.add_argument('--book-sizes', nargs='+', type=int, default=BOOK_SIZES)
+    parser.add_argument('--only', nargs='+', help='run only these functions')
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.book_sizes, args.only)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f'Baseline written to {args.baseline}')
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if CALIBRATION_CASE not in baseline:
+        print(f'The baseline {args.baseline} has no {CALIBRATION_CASE} timing, so its timings can\'t be compared '
+              f'with the ones of this machine. Regenerate it with --save-baseline.')
+        return 2
+    print(f'{"case":<48} {"baseline":>14} {"current":>14} {"ratio":>8}')
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f'{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
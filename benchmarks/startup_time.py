@@ -0,0 +1,71 @@
+"""
+Cold start time of the gateway.
+
+Imports the app (client_connector.main:app by default) in fresh interpreters, the way a new uvicorn worker does, and
+reports the wall time of the import. It also reports which modules took the longest to import (python -X importtime,
+cumulative microseconds) and checks that the import leaves no side effects behind: no thread besides the main one
+(the log writer only starts with the app or the first record, Mongo is only connected when it is first needed) and
+none of the heavy modules that should only load when they are used. It exits with a non-zero status otherwise.
+
+    python -m benchmarks.startup_time --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+LAZY_MODULES = ('pandas',)  # these should only be imported when they are used
+
+PROBE = """
+import json, sys, threading, time
+start = time.perf_counter()
+module_name, attribute = sys.argv[1].split(':')
+getattr(__import__(module_name, fromlist=[attribute]), attribute)
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'threads': [t.name for t in threading.enumerate()],
+                  'loaded': [name for name in sys.argv[2:] if name in sys.modules]}))
+"""
+
+
+def time_import(target):
+    output = subprocess.run([sys.executable, '-c', PROBE, target, *LAZY_MODULES], capture_output=True, text=True,
+                            check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(target, top):
+    module_name = target.split(':')[0]
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module_name}'], capture_output=True,
+                            text=True, check=True).stderr
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        timings.append((int(cumulative), name.strip()))
+    return sorted(timings, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cold start time of the gateway')
+    parser.add_argument('--target', default='client_connector.main:app')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    args = parser.parse_args(argv)
+
+    results = [time_import(args.target) for _ in range(args.runs)]
+    seconds = [result['seconds'] for result in results]
+    print(f'import {args.target}: median {statistics.median(seconds):.3f} s, min {min(seconds):.3f} s '
+          f'({args.runs} fresh interpreters)')
+    extra_threads = [name for name in results[0]['threads'] if name != 'MainThread']
+    print(f'threads started by the import: {extra_threads or "none"}')
+    print(f'lazy modules loaded by the import: {results[0]["loaded"] or "none"}')
+    print(f'slowest imports (cumulative):')
+    for cumulative, name in slowest_imports(args.target, args.top):
+        print(f'  {cumulative / 1000:8.1f} ms  {name}')
+    return 1 if extra_threads or results[0]['loaded'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
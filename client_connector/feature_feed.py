@@ -0,0 +1,89 @@
+"""
+The features of a session, computed once per book update for all its model-driven traders.
+
+The feed listens to the session like the spectator feed does (TradingSession.market_data_listeners): after each
+action it takes the book, updates the session's FeatureEngine and, if the book changed, hands the features to
+every trader with uses_features (BaseTrader.on_features). The traders share the same read-only features_state.
+With a SignalBatcher, the feed also asks it for the signals of the new features and hands them to the traders
+(BaseTrader.on_signals) when the batch is done; updates that come meanwhile are conflated into the next request.
+"""
+import asyncio
+
+import numpy as np
+
+from external_traders.feature_engine import FeatureEngine
+from main_platform.custom_logger import setup_custom_logger
+from main_platform.utils import convert_order_book_to_book_format
+
+logger = setup_custom_logger(__name__)
+
+TRADE_MESSAGE_TYPE = 4  # cols_message 'type' of an execution (the LOBSTER code); 0 is a book change without trades
+
+
+class FeatureFeed:
+    def __init__(self, trading_session, traders, settings, signal_batcher=None):
+        self.trading_session = trading_session
+        self.traders = list(traders)
+        self.default_price = settings['initial_price']
+        self.engine = FeatureEngine(settings)
+        self.signal_batcher = signal_batcher
+        self._message = np.zeros(len(self.engine.message_stack[0]))
+        self._signals_task = None
+        self._signals_stale = False
+
+    def start(self):
+        if self.on_market_data not in self.trading_session.market_data_listeners:
+            self.trading_session.market_data_listeners.append(self.on_market_data)
+        return self
+
+    def stop(self):
+        if self.on_market_data in self.trading_session.market_data_listeners:
+            self.trading_session.market_data_listeners.remove(self.on_market_data)
+        if self._signals_task:
+            self._signals_task.cancel()
+            self._signals_task = None
+
+    def get_message(self, trades):
+        # cols_message: time, type, id, size, price, direction
+        self._message[:] = 0
+        self._message[0] = self.trading_session.current_time.timestamp()
+        if trades:
+            self._message[1] = TRADE_MESSAGE_TYPE
+            self._message[4] = trades[-1]['price']
+        return self._message
+
+    def on_market_data(self, trades):
+        levels_n = self.engine.levels_n
+        book = convert_order_book_to_book_format(self.trading_session.get_order_book(levels_n), levels_n=levels_n,
+                                                 default_price=self.default_price)
+        if not self.engine.update(book, self.get_message(trades)):
+            return
+        features_state = self.engine.features_state
+        for trader in self.traders:
+            try:
+                trader.on_features(features_state)
+            except Exception as e:
+                logger.error('Trader %s failed to take the features: %s', trader.id, e)
+
+        if self.signal_batcher is None:
+            return
+        if self._signals_task is None or self._signals_task.done():
+            self._signals_task = asyncio.create_task(self.update_signals())
+        else:
+            self._signals_stale = True
+
+    async def update_signals(self):
+        while True:
+            self._signals_stale = False
+            try:
+                signals_state = await self.signal_batcher.predict(self.engine.features_state)
+            except Exception as e:
+                logger.error('Signals of session %s failed: %s', self.trading_session.id, e)
+                return
+            for trader in self.traders:
+                try:
+                    trader.on_signals(signals_state)
+                except Exception as e:
+                    logger.error('Trader %s failed to take the signals: %s', trader.id, e)
+            if not self._signals_stale:
+                return
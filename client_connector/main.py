@@ -1,12 +1,23 @@
 import asyncio
+import functools
+import os
+from datetime import datetime
 
 from fastapi import FastAPI, WebSocket, HTTPException, WebSocketDisconnect, BackgroundTasks
 from starlette.websockets import WebSocketState
 from fastapi.middleware.cors import CORSMiddleware
 from client_connector.trader_manager import TraderManager
-from structures import TraderCreationData
-from fastapi.responses import JSONResponse
-from main_platform.custom_logger import setup_custom_logger
+from client_connector.session_registry import SessionRegistry, SessionLimitReached
+from client_connector.session_pool import SessionPool
+from client_connector.spectator_feed import DEFAULT_SPECTATOR_DEPTH
+from structures import TraderCreationData, SessionResult
+from fastapi.responses import JSONResponse, PlainTextResponse
+from main_platform.custom_logger import setup_custom_logger, set_log_session, start_log_listener
+from main_platform.checkpoint import get_checkpoint_path
+from main_platform.metrics import render_prometheus, drop_session_metrics
+from main_platform.utils import connect_to_mongo
+from main_platform.history import get_history_page, InvalidHistoryQuery, DEFAULT_PAGE_SIZE
+from main_platform.profiler import SessionProfiler, MAX_PROFILE_SECONDS, DEFAULT_SAMPLING_INTERVAL
 
 logger = setup_custom_logger(__name__)
 
@@ -19,10 +30,27 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-# TODO: for now we keep it in memory, but we may want to persist it in a database
-trader_managers = {}
-trader_to_session_lookup = {}
+# live sessions (and the finished ones during their grace period); evicted ones are only in Mongo
+session_registry = SessionRegistry()
+# prepared sessions waiting for their participants (SESSION_POOL_SIZE per configuration, none by default)
+session_pool = SessionPool()
 trader_manager: TraderManager = None
+sessions_being_profiled = set()
+
+
+@app.on_event("startup")
+async def start_logging():
+    start_log_listener()
+
+
+@app.on_event("startup")
+async def start_session_pool():
+    session_pool.start()
+
+
+@app.on_event("shutdown")
+async def stop_session_pool():
+    await session_pool.stop()
 
 
 # for testing if sockets work
@@ -49,15 +77,19 @@ async def get_trader_defaults():
 
 @app.post("/trading/initiate")
 async def create_trading_session(params: TraderCreationData, background_tasks: BackgroundTasks):
-    trader_manager = TraderManager(params)
-
-    background_tasks.add_task(trader_manager.launch)
-    trader_managers[trader_manager.trading_session.id] = trader_manager
-    new_traders = list(trader_manager.traders.keys())
+    # a prepared session from the pool only has to connect the humans and open the market
+    trader_manager = session_pool.claim(params)
+    pooled = trader_manager is not None
+    if not pooled:
+        trader_manager = TraderManager(params)
 
-    # loop through the traders and add them to the lookup with values of their session id
-    for t in new_traders:
-        trader_to_session_lookup[t] = trader_manager.trading_session.id
+    try:
+        register_trader_manager(trader_manager)
+    except HTTPException:
+        if pooled:
+            session_pool.give_back(trader_manager)
+        raise
+    background_tasks.add_task(session_registry.run, trader_manager)
 
     return {
         "status": "success",
@@ -69,11 +101,83 @@ async def create_trading_session(params: TraderCreationData, background_tasks: B
     }
 
 
+def register_trader_manager(trader_manager: TraderManager):
+    try:
+        session_registry.register(trader_manager)
+    except SessionLimitReached as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.post("/trading_session/{trading_session_id}/checkpoint")
+async def checkpoint_trading_session(trading_session_id: str):
+    trader_manager = session_registry.get(trading_session_id)
+    if not trader_manager:
+        raise HTTPException(status_code=404, detail="Trading session not found")
+    path = await trader_manager.checkpoint()
+    return {
+        "status": "success",
+        "message": "Checkpoint written",
+        "data": {"trading_session_uuid": trading_session_id, "path": path}
+    }
+
+
+@app.post("/trading_session/{trading_session_id}/restore")
+async def restore_trading_session(trading_session_id: str, background_tasks: BackgroundTasks, new_session: bool = False):
+    """Restarts a session from its latest checkpoint. With new_session a fresh session starts from its book."""
+    path = get_checkpoint_path(trading_session_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Checkpoint not found")
+    if trading_session_id in session_registry and not new_session:
+        if trading_session_id in session_registry.live_sessions:
+            raise HTTPException(status_code=409, detail="Trading session is still running")
+        # it has finished and waits for its eviction: it goes now, it would take the restored one with it
+        await session_registry.evict(trading_session_id)
+    try:
+        session_registry.check_capacity()  # before the checkpoint is loaded and a session is built for nothing
+    except SessionLimitReached as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    trader_manager = await TraderManager.from_checkpoint(path, new_session=new_session)
+    try:
+        register_trader_manager(trader_manager)
+    except HTTPException:
+        drop_session_metrics(trader_manager.trading_session.id)  # the only thing a session that never ran leaves
+        raise
+    background_tasks.add_task(session_registry.run, trader_manager)
+
+    return {
+        "status": "success",
+        "message": "Trading session restored",
+        "data": {"trading_session_uuid": trader_manager.trading_session.id,
+                 "traders": list(trader_manager.traders.keys()),
+                 "human_traders": [t.id for t in trader_manager.human_traders],
+                 }
+    }
+
+
+@app.post("/admin/sessions/{trading_session_id}/profile", response_class=PlainTextResponse)
+async def profile_trading_session(trading_session_id: str, seconds: float = 10,
+                                  interval: float = DEFAULT_SAMPLING_INTERVAL):
+    """Samples the session for `seconds` and returns collapsed stacks (input for flamegraph.pl or speedscope)."""
+    trader_manager = session_registry.get(trading_session_id)
+    if not trader_manager:
+        raise HTTPException(status_code=404, detail="Trading session not found")
+    if not 0 < seconds <= MAX_PROFILE_SECONDS or interval <= 0:
+        raise HTTPException(status_code=422, detail=f"seconds should be in (0, {MAX_PROFILE_SECONDS}], interval > 0")
+    if trading_session_id in sessions_being_profiled:
+        raise HTTPException(status_code=409, detail="The session is already being profiled")
+
+    owners = [trader_manager.trading_session, trader_manager.bot_scheduler, *trader_manager.traders.values()]
+    sessions_being_profiled.add(trading_session_id)
+    try:
+        stacks = await SessionProfiler(owners, interval=interval).profile(seconds)
+    finally:
+        sessions_being_profiled.discard(trading_session_id)
+    return PlainTextResponse(stacks)
+
+
 def get_manager_by_trader(trader_uuid: str):
-    if trader_uuid not in trader_to_session_lookup.keys():
-        return None
-    trading_session_id = trader_to_session_lookup[trader_uuid]
-    return trader_managers[trading_session_id]
+    return session_registry.get_by_trader(trader_uuid)
 
 
 @app.get("/trader/{trader_uuid}")
@@ -117,7 +221,7 @@ async def get_trader_info(trader_uuid: str):
 
 @app.get("/trading_session/{trading_session_id}")
 async def get_trading_session(trading_session_id: str):
-    trader_manager = trader_managers.get(trading_session_id)
+    trader_manager = session_registry.get(trading_session_id)
     if not trader_manager:
         raise HTTPException(status_code=404, detail="Trading session not found")
 
@@ -130,6 +234,73 @@ async def get_trading_session(trading_session_id: str):
     }
 
 
+@app.get("/trading_session/{trading_session_id}/results")
+async def get_trading_session_results(trading_session_id: str):
+    """Results of a session: from memory while it is live (or in its grace period), from Mongo after that."""
+    trader_manager = session_registry.get(trading_session_id)
+    if trader_manager:
+        return {"status": "found", "data": trader_manager.get_results()}
+    connect_to_mongo()
+    result = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: SessionResult.objects(trading_session_id=trading_session_id).first())
+    if not result:
+        raise HTTPException(status_code=404, detail="Trading session not found")
+    return {"status": "found", "data": result.to_mongo().to_dict()}
+
+
+async def read_history(kind, trading_session_id, cursor, start, end, fields, limit):
+    """
+    A page of a session's history from Mongo. `fields` is a comma separated projection, `start` and `end` limit the
+    time range, and `cursor` is the next_cursor of the previous page.
+    """
+    connect_to_mongo()
+    try:
+        page = await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+            get_history_page, kind, trading_session_id, cursor=cursor, start=start, end=end,
+            fields=fields.split(',') if fields else None, limit=limit))
+    except InvalidHistoryQuery as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"status": "found", "data": page['items'], "next_cursor": page['next_cursor']}
+
+
+@app.get("/trading_session/{trading_session_id}/trades")
+async def get_trading_session_trades(trading_session_id: str, cursor: str = None, start: datetime = None,
+                                     end: datetime = None, fields: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    return await read_history('trades', trading_session_id, cursor, start, end, fields, limit)
+
+
+@app.get("/trading_session/{trading_session_id}/messages")
+async def get_trading_session_messages(trading_session_id: str, cursor: str = None, start: datetime = None,
+                                       end: datetime = None, fields: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    return await read_history('messages', trading_session_id, cursor, start, end, fields, limit)
+
+
+@app.get("/trading_session/{trading_session_id}/order_events")
+async def get_trading_session_order_events(trading_session_id: str, cursor: str = None, start: datetime = None,
+                                           end: datetime = None, fields: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    return await read_history('order_events', trading_session_id, cursor, start, end, fields, limit)
+
+
+@app.get("/trading_session/{trading_session_id}/bars")
+async def get_trading_session_bars(trading_session_id: str, interval: int = 5, since: float = None):
+    """OHLCV and VWAP bars of a live session's trades; `since` (epoch seconds) skips the older bars."""
+    trader_manager = session_registry.get(trading_session_id)
+    if not trader_manager:
+        raise HTTPException(status_code=404, detail="Trading session not found")
+    bars = trader_manager.trading_session.bars
+    if interval not in bars.intervals:
+        raise HTTPException(status_code=422, detail=f"interval should be one of {list(bars.intervals)}")
+    return {"status": "found", "data": bars.get_bars(interval, since=since)}
+
+
+@app.get("/trading_session/{trading_session_id}/memory")
+async def get_trading_session_memory(trading_session_id: str):
+    trader_manager = session_registry.get(trading_session_id)
+    if not trader_manager:
+        raise HTTPException(status_code=404, detail="Trading session not found")
+    return {"status": "found", "data": trader_manager.get_memory_report()}
+
+
 @app.websocket("/trader/{trader_uuid}")
 async def websocket_trader_endpoint(websocket: WebSocket, trader_uuid: str):
     await websocket.accept()
@@ -145,16 +316,17 @@ async def websocket_trader_endpoint(websocket: WebSocket, trader_uuid: str):
         return
 
     trader = trader_manager.get_trader(trader_uuid)
+    set_log_session(trader_manager.trading_session.id)
     await trader.connect_to_socket(websocket)
 
-    logger.info(f"Trader {trader_uuid} connected to websocket")
+    logger.info("Trader %s connected to websocket", trader_uuid)
     # Send current status immediately upon new connection
     await websocket.send_json({
         "type": "success",
         "message": "Connected to trader",
         "data": {
             "trader_uuid": trader_uuid,
-            "order_book": trader.order_book
+            "order_book": trader.get_order_book_to_show()
         }
     })
 
@@ -162,17 +334,40 @@ async def websocket_trader_endpoint(websocket: WebSocket, trader_uuid: str):
         while True:
             message = await websocket.receive_text()
             if websocket.client_state != WebSocketState.CONNECTED:
-                logger.warning(f"Trader {trader_uuid} disconnected")
+                logger.warning("Trader %s disconnected", trader_uuid)
                 break
             await trader.on_message_from_client(message)
     except WebSocketDisconnect:
-        logger.critical(f"Trader {trader_uuid} disconnected")
+        logger.info("Trader %s disconnected", trader_uuid)
         pass  # should we something here? not sure, because it can be just an connection interruption
     except asyncio.CancelledError:
         logger.warning("Task cancelled")
         await trader_manager.cleanup()  # This will now cancel all tasks
 
 
+@app.websocket("/trading_session/{trading_session_id}/spectate")
+async def websocket_spectator_endpoint(websocket: WebSocket, trading_session_id: str,
+                                       depth: int = DEFAULT_SPECTATOR_DEPTH):
+    """Read-only book and trades of a session; depth=1 gives L1 only. Whatever the spectator sends is ignored."""
+    await websocket.accept()
+    trader_manager = session_registry.get(trading_session_id)
+    if not trader_manager or depth < 1:
+        await websocket.send_json({"status": "error", "message": "Trading session not found" if not trader_manager
+                                   else "depth should be at least 1", "data": {}})
+        await websocket.close()
+        return
+
+    feed = trader_manager.get_spectator_feed()
+    sender = feed.add_observer(websocket, depth=depth)
+    try:
+        while not sender.closed:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        feed.remove_observer(sender)
+
+
 @app.get("/traders/list")
 async def list_traders():
     return {
@@ -182,6 +377,12 @@ async def list_traders():
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Latency histograms of all the sessions in the Prometheus text format."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def root():
     return {"status": "trading is active",
@@ -0,0 +1,104 @@
+"""
+Pool of pre-warmed trading sessions.
+
+Launching a session from scratch means declaring its queues and exchanges, connecting every bot and letting the noise
+traders warm the book up, which takes seconds before a participant sees anything. The pool does all of that in the
+background (TraderManager.prepare) for the common configurations, so initiating a session with one of them only
+claims a prepared session, connects its human traders and opens the market (TraderManager.open_market).
+
+A session waits in the pool with its clock stopped: its start time, its deadline and the bots' activity all start
+when it is claimed. After each claim the pool prepares a replacement.
+
+    SESSION_POOL_SIZE     - prepared sessions to keep per configuration (default 0, no pool)
+    SESSION_POOL_CONFIGS  - JSON list of TraderCreationData params to keep sessions for (default: the defaults)
+"""
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Dict, List, Optional
+
+from client_connector.trader_manager import TraderManager
+from main_platform.custom_logger import setup_custom_logger
+from structures import TraderCreationData
+
+logger = setup_custom_logger(__name__)
+
+SESSION_POOL_SIZE = int(os.getenv('SESSION_POOL_SIZE', 0))
+SESSION_POOL_CONFIGS = os.getenv('SESSION_POOL_CONFIGS')
+POOL_RETRY_DELAY = 5  # seconds before trying again when a session could not be prepared (the broker is down...)
+
+
+def get_pool_configs(configs_json=SESSION_POOL_CONFIGS) -> List[TraderCreationData]:
+    if not configs_json:
+        return [TraderCreationData()]
+    return [TraderCreationData(**params) for params in json.loads(configs_json)]
+
+
+def get_pool_key(params: TraderCreationData) -> str:
+    return params.model_dump_json()
+
+
+class SessionPool:
+    def __init__(self, configs: List[TraderCreationData] = None, target_size=SESSION_POOL_SIZE):
+        configs = get_pool_configs() if configs is None else configs
+        self.configs = {get_pool_key(params): params for params in configs}
+        self.target_size = target_size
+        self.ready: Dict[str, deque] = {key: deque() for key in self.configs}
+        self._refill = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return sum(len(managers) for managers in self.ready.values())
+
+    def start(self):
+        if self.target_size > 0 and self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self
+
+    def claim(self, params: TraderCreationData) -> Optional[TraderManager]:
+        """A prepared session for these params, or None if there is none (the caller launches one from scratch)."""
+        managers = self.ready.get(get_pool_key(params))
+        if not managers:
+            return None
+        self._refill.set()
+        return managers.popleft()
+
+    def give_back(self, trader_manager: TraderManager):
+        """For a claimed session that could not be used after all; it goes back to the front of the pool."""
+        self.ready.setdefault(get_pool_key(trader_manager.params), deque()).appendleft(trader_manager)
+
+    async def fill(self):
+        """Prepares sessions until every configuration has target_size of them waiting."""
+        for key, params in self.configs.items():
+            while len(self.ready[key]) < self.target_size:
+                trader_manager = TraderManager(params)
+                try:
+                    await trader_manager.prepare()
+                except Exception:
+                    await trader_manager.cleanup()
+                    raise
+                self.ready[key].append(trader_manager)
+                logger.info('Session %s is ready in the pool', trader_manager.trading_session.id)
+
+    async def run(self):
+        while True:
+            try:
+                await self.fill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error('Session pool could not prepare a session: %s', e)
+                await asyncio.sleep(POOL_RETRY_DELAY)
+                continue
+            await self._refill.wait()
+            self._refill.clear()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for managers in self.ready.values():
+            while managers:
+                await managers.popleft().cleanup()
@@ -0,0 +1,109 @@
+"""
+Registry of the trading sessions the gateway keeps in memory.
+
+A session lives here while it runs and for a grace period after it ends (so the clients can still fetch their final
+state). Then it is evicted: its TraderManager is cleaned up and dropped, and only the results saved to Mongo
+(SessionResult, transactions, messages) remain. The number of sessions that run at the same time is capped.
+
+    MAX_LIVE_SESSIONS      - how many sessions can run at once (default 20)
+    SESSION_GRACE_PERIOD   - seconds a finished session stays in memory (default 600)
+"""
+import asyncio
+import os
+from typing import Dict
+
+from client_connector.trader_manager import TraderManager
+from main_platform.custom_logger import setup_custom_logger
+
+logger = setup_custom_logger(__name__)
+
+MAX_LIVE_SESSIONS = int(os.getenv('MAX_LIVE_SESSIONS', 20))
+SESSION_GRACE_PERIOD = float(os.getenv('SESSION_GRACE_PERIOD', 600))
+
+
+class SessionLimitReached(Exception):
+    pass
+
+
+class SessionRegistry:
+    def __init__(self, max_live_sessions=MAX_LIVE_SESSIONS, grace_period=SESSION_GRACE_PERIOD):
+        self.max_live_sessions = max_live_sessions
+        self.grace_period = grace_period
+        self.trader_managers: Dict[str, TraderManager] = {}
+        self.trader_to_session_lookup: Dict[str, str] = {}
+        self.finished_sessions = set()
+        self._eviction_handles = {}
+        self._eviction_tasks = set()  # the loop only keeps weak references to tasks
+
+    @property
+    def live_sessions(self):
+        return [session_id for session_id in self.trader_managers if session_id not in self.finished_sessions]
+
+    def check_capacity(self):
+        """Raises SessionLimitReached if no more sessions can run. Lets callers refuse before building a session."""
+        if len(self.live_sessions) >= self.max_live_sessions:
+            raise SessionLimitReached(f'{self.max_live_sessions} sessions are already running')
+
+    def register(self, trader_manager: TraderManager):
+        self.check_capacity()
+        session_id = trader_manager.trading_session.id
+        self.trader_managers[session_id] = trader_manager
+        # loop through the traders and add them to the lookup with values of their session id
+        for trader_id in trader_manager.traders.keys():
+            self.trader_to_session_lookup[trader_id] = session_id
+
+    def get(self, session_id) -> TraderManager:
+        return self.trader_managers.get(session_id)
+
+    def get_by_trader(self, trader_id) -> TraderManager:
+        session_id = self.trader_to_session_lookup.get(trader_id)
+        return self.trader_managers.get(session_id) if session_id else None
+
+    def __contains__(self, session_id):
+        return session_id in self.trader_managers
+
+    async def run(self, trader_manager: TraderManager):
+        """Launches the session and, whatever way it ends, saves its results and schedules its eviction."""
+        try:
+            await trader_manager.launch()
+        finally:
+            await self.finish(trader_manager)
+
+    async def finish(self, trader_manager: TraderManager):
+        session_id = trader_manager.trading_session.id
+        if session_id in self.finished_sessions or session_id not in self.trader_managers:
+            return
+        self.finished_sessions.add(session_id)
+        try:
+            await trader_manager.save_results()
+        except Exception as e:
+            logger.error('Results of session %s were not saved: %s', session_id, e)
+        self._eviction_handles[session_id] = asyncio.get_running_loop().call_later(
+            self.grace_period, self.start_eviction, session_id)
+        logger.info('Session %s finished, it will be evicted in %s seconds', session_id, self.grace_period)
+
+    def start_eviction(self, session_id):
+        task = asyncio.ensure_future(self.evict(session_id))
+        self._eviction_tasks.add(task)
+        task.add_done_callback(self._eviction_done)
+
+    def _eviction_done(self, task):
+        self._eviction_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error('Eviction failed: %s', task.exception())
+
+    async def evict(self, session_id):
+        handle = self._eviction_handles.pop(session_id, None)
+        if handle:
+            handle.cancel()
+        trader_manager = self.trader_managers.pop(session_id, None)
+        self.finished_sessions.discard(session_id)
+        if trader_manager is None:
+            return
+        for trader_id in trader_manager.traders.keys():
+            self.trader_to_session_lookup.pop(trader_id, None)
+        try:
+            await trader_manager.cleanup()
+        except Exception as e:
+            logger.error('Cleanup of session %s failed: %s', session_id, e)
+        logger.info('Session %s evicted', session_id)
@@ -0,0 +1,66 @@
+"""
+Batched model inference for all the sessions of a worker.
+
+The feature feeds of the sessions ask for the signals of their new features (predict) and wait. Whatever is asked
+for during the same tick of the event loop (plus `max_delay` seconds, 0 by default) goes into one batch: the
+features states are stacked and get_signal_update_batch runs one predict per model of the `models` dict for the
+whole batch, in an executor, so the event loop keeps running while the models work.
+"""
+import asyncio
+import functools
+import os
+
+import numpy as np
+
+from external_traders.noise_trader import models as default_models, settings as default_settings, \
+    get_signal_update_batch
+from main_platform.custom_logger import setup_custom_logger
+
+logger = setup_custom_logger(__name__)
+
+SIGNAL_BATCH_DELAY = float(os.getenv('SIGNAL_BATCH_DELAY', 0))  # seconds to wait for more requests before a batch
+
+
+class SignalBatcher:
+    def __init__(self, models=None, settings=None, max_delay=SIGNAL_BATCH_DELAY, executor=None):
+        self.models = models or default_models
+        self.settings = settings or default_settings
+        self.max_delay = max_delay
+        self.executor = executor  # None is the loop's default executor
+        self._pending = []  # (features state, future)
+        self._flush_task = None
+
+    async def predict(self, features_state) -> np.ndarray:
+        """The signals state (one value per model) of a features state, computed in the next batch."""
+        future = asyncio.get_running_loop().create_future()
+        # the caller may update its state in place while the batch is waiting, so the batch gets a copy
+        self._pending.append((np.array(features_state, dtype=np.float64), future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self.flush())
+        return await future
+
+    async def flush(self):
+        await asyncio.sleep(self.max_delay)  # with 0, lets the rest of the tick add its requests
+        self._flush_task = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        features_states = np.vstack([features_state for features_state, _ in batch])
+        try:
+            signals_states = await asyncio.get_running_loop().run_in_executor(
+                self.executor, get_signal_update_batch, features_states, self.models, self.settings)
+        except Exception as e:
+            logger.error('Batch of %s signal updates failed: %s', len(batch), e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), signals_state in zip(batch, signals_states):
+            if not future.done():  # the caller may be gone
+                future.set_result(signals_state)
+
+
+@functools.lru_cache(maxsize=None)
+def get_signal_batcher() -> SignalBatcher:
+    """The batcher of this worker, shared by all its sessions."""
+    return SignalBatcher()
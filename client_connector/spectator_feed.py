@@ -0,0 +1,99 @@
+"""
+Read-only market data feed of a session for spectators (experimenters, dashboards).
+
+Spectators are not traders: they have no broker queue and the session doesn't send them anything itself. The
+session only hands the new trades to the feed after each action (TradingSession.market_data_listeners) and wakes
+it up. The feed then builds the book at most `max_rate` times a second, encodes it once per depth the spectators
+asked for (depth=1 is L1) and queues it to everybody's WebSocketSender. Book frames are conflated, a slow
+spectator gets the latest book; trade frames are always delivered.
+"""
+import asyncio
+import json
+
+from main_platform.custom_logger import setup_custom_logger
+from main_platform.utils import CustomEncoder
+from traders.websocket_sender import WebSocketSender
+
+logger = setup_custom_logger(__name__)
+
+MAX_FEED_RATE = 10  # book updates per second
+DEFAULT_SPECTATOR_DEPTH = 10
+
+
+def get_book_frame(order_book, depth):
+    bids, asks = order_book['bids'][:depth], order_book['asks'][:depth]
+    spread = midpoint = None
+    if bids and asks:
+        spread = asks[0]['x'] - bids[0]['x']
+        midpoint = (asks[0]['x'] + bids[0]['x']) / 2
+    return json.dumps({'type': 'book', 'depth': depth, 'order_book': {'bids': bids, 'asks': asks},
+                       'spread': spread, 'midpoint': midpoint}, cls=CustomEncoder)
+
+
+class SpectatorFeed:
+    def __init__(self, trading_session, max_rate=MAX_FEED_RATE):
+        self.trading_session = trading_session
+        self.max_rate = max_rate
+        self.observers = {}  # WebSocketSender -> depth
+        self._trades = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def on_market_data(self, trades):
+        """Called by the session after each action: it only takes the trades and wakes the feed up."""
+        if not self.observers:
+            return
+        self._trades.extend(trades)
+        self._wakeup.set()
+
+    def add_observer(self, websocket, depth=DEFAULT_SPECTATOR_DEPTH) -> WebSocketSender:
+        sender = WebSocketSender(websocket, session_id=self.trading_session.id).start()
+        self.observers[sender] = depth
+        if self.on_market_data not in self.trading_session.market_data_listeners:
+            self.trading_session.market_data_listeners.append(self.on_market_data)
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        # the newcomer gets the current book right away, the others will get it with the next update
+        sender.send(get_book_frame(self.trading_session.get_order_book(depth), depth), market_data=True)
+        return sender
+
+    def remove_observer(self, sender: WebSocketSender):
+        self.observers.pop(sender, None)
+        sender.close(close_websocket=False)
+
+    def publish(self):
+        """One round: the book once per depth and the trades once, queued to every spectator."""
+        self.observers = {sender: depth for sender, depth in self.observers.items() if not sender.closed}
+        if not self.observers:
+            self._trades = []
+            return
+        depths = set(self.observers.values())
+        full_book = self.trading_session.get_order_book(max(depths))
+        book_frames = {depth: get_book_frame(full_book, depth) for depth in depths}
+        trades, self._trades = self._trades, []
+        trades_frame = json.dumps({'type': 'trades', 'trades': trades}, cls=CustomEncoder) if trades else None
+        for sender, depth in self.observers.items():
+            if trades_frame:
+                sender.send(trades_frame)
+            sender.send(book_frames[depth], market_data=True)
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error('Spectator feed of session %s failed to publish: %s', self.trading_session.id, e)
+            await asyncio.sleep(1 / self.max_rate)  # what comes in meanwhile is conflated into the next round
+
+    async def stop(self):
+        if self.on_market_data in self.trading_session.market_data_listeners:
+            self.trading_session.market_data_listeners.remove(self.on_market_data)
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for sender in list(self.observers):
+            await sender.stop()
+        self.observers.clear()
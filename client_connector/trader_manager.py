@@ -4,15 +4,25 @@ Upon the request  of a client, it lauchnes new trading sessions and/or helps fin
 so they can communicate with them.
 """
 
+import time
 import uuid
+from datetime import timedelta
 
-from external_traders.noise_trader import get_signal_noise, settings_noise, settings, get_noise_rule_unif
+from external_traders.noise_trader import (get_signal_noise, settings_noise, settings, get_noise_rule_unif,
+                                           get_book_seed_orders)
 from external_traders.informed_naive import get_signal_informed, get_order_to_match, settings_informed, update_settings_informed
-from structures import TraderCreationData
+from structures import TraderCreationData, SessionResult, TransactionModel
 from typing import List
 from traders import HumanTrader, NoiseTrader, InformedTrader
 
 from main_platform import TradingSession
+from client_connector.spectator_feed import SpectatorFeed
+from client_connector.feature_feed import FeatureFeed
+from client_connector.signal_batcher import get_signal_batcher
+from main_platform.bot_scheduler import BotScheduler
+from main_platform.checkpoint import get_checkpoint_path, save_checkpoint, load_checkpoint
+from main_platform.metrics import drop_session_metrics
+from main_platform.utils import now, deep_getsizeof
 
 import asyncio
 
@@ -33,8 +43,12 @@ class TraderManager:
 
         self.params = params
         params=params.model_dump()
-        logger.critical(f"TraderManager params: {params}")
+        logger.info("TraderManager params: %s", params)
         self.tasks = []
+        self.restored = False  # restored sessions already have their book, so they skip the warm up
+        self.resume_elapsed_time = None  # seconds into the session when it was checkpointed, for a resumed session
+        self.prepared = False  # sessions from the SessionPool are prepared in advance, see prepare and open_market
+        self.checkpoint_interval = params.get("checkpoint_interval", 0)
         n_noise_traders = params.get("num_noise_traders", 1)
 
         n_informed_traders = params.get("num_informed_traders", 1)
@@ -46,6 +60,10 @@ class TraderManager:
         # So far for debugging purposes we only need one human trader whose id we return to the client
         n_human_traders = params.get("num_human_traders", 1)
         self.noise_warm_ups = params.get("noise_warm_ups", 10)
+        self.seed_book_levels = params.get("seed_book_levels", 0)
+        self.step = params.get("step", 1)
+        self.seed_orders_per_level = params.get("seed_orders_per_level", 1)
+        self.seed_max_order_amount = params.get("seed_max_order_amount", 1)
 
         self.noise_traders = [NoiseTrader(activity_frequency=params.get('activity_frequency'),
                                           order_amount=params.get('order_amount'), 
@@ -66,36 +84,104 @@ class TraderManager:
                                                 get_signal_informed=get_signal_informed,
                                                 get_order_to_match=get_order_to_match) for _ in range(n_informed_traders)]
                 
-        self.human_traders = [HumanTrader(cash=cash, shares=shares) for _ in range(n_human_traders)]
+        self.human_traders = [HumanTrader(cash=cash, shares=shares, depth_book_shown=params.get('depth_book_shown'))
+                              for _ in range(n_human_traders)]
 
 
         self.traders = {t.id: t for t in self.noise_traders + self.informed_traders + self.human_traders}
-        self.trading_session = TradingSession(duration=params['trading_day_duration'])
+        self.trading_session = TradingSession(duration=params['trading_day_duration'],
+                                              inventory_report_timeout=params['inventory_report_timeout'],
+                                              non_responder_policy=params['non_responder_policy'])
+        # noise and informed traders are woken up by one scheduler instead of running their own loops
+        self.bot_scheduler = BotScheduler(self.trading_session, self.noise_traders + self.informed_traders)
+        self.spectator_feed = None  # created when the first spectator connects
+        # one feature engine for all the model-driven bots of the session, none if no bot uses features
+        model_traders = [t for t in self.noise_traders + self.informed_traders if t.uses_features]
+        self.feature_feed = FeatureFeed(self.trading_session, model_traders, settings,
+                                        signal_batcher=get_signal_batcher()) if model_traders else None
 
 
 
     async def launch(self):
+        if not self.prepared:
+            await self.prepare()
+        await self.open_market()
+
+    async def prepare(self):
+        """Everything that can be done before the humans arrive: the session, the bots and the warm up book."""
         await self.trading_session.initialize()
-        logger.info(f"Trading session UUID: {self.trading_session.id}")
+        logger.info("Trading session UUID: %s", self.trading_session.id)
+        if self.feature_feed:
+            self.feature_feed.start()
 
-        for trader_id, trader in self.traders.items():
+        for trader in self.noise_traders + self.informed_traders:
             await trader.initialize()
             await trader.connect_to_session(trading_session_uuid=self.trading_session.id)
 
-        for trader in self.noise_traders:
-            await trader.warm_up(number_of_warmup_orders=self.noise_warm_ups)
+        if not self.restored:
+            await self.warm_up()
+        self.prepared = True
+
+    async def warm_up(self):
+        """The initial book: seeded at once on behalf of the noise traders, or built by them order by order."""
+        if self.seed_book_levels and self.noise_traders:
+            orders = get_book_seed_orders(best_bid=settings['initial_price'], levels_n=self.seed_book_levels,
+                                          step=self.step, orders_per_level=self.seed_orders_per_level,
+                                          max_size=self.seed_max_order_amount,
+                                          owners=[t.id for t in self.noise_traders])
+            await self.trading_session.seed_book(orders)
+            return
+        # the warm up orders are activations out of the schedule, each on a fresh snapshot of the book
+        for _ in range(self.noise_warm_ups):
+            for trader in self.noise_traders:
+                await self.bot_scheduler.tick([trader], reschedule=False)
+
+    async def open_market(self):
+        """Connects the human traders and starts the clock of the session, its bots and its deadline."""
+        for trader in self.human_traders:
+            await trader.initialize()
+            await trader.connect_to_session(trading_session_uuid=self.trading_session.id)
+
+        self.start_clocks()
 
         await self.trading_session.send_broadcast({"content": "Market is open"})
 
         trading_session_task = asyncio.create_task(self.trading_session.run())
-        trader_tasks = [asyncio.create_task(i.run()) for i in self.traders.values()]
+        scheduler_task = asyncio.create_task(self.bot_scheduler.run())
+        trader_tasks = [asyncio.create_task(i.run()) for i in self.human_traders]
 
         self.tasks.append(trading_session_task)
+        self.tasks.append(scheduler_task)
         self.tasks.extend(trader_tasks)
+        if self.checkpoint_interval:
+            self.tasks.append(asyncio.create_task(self.run_periodic_checkpoints(self.checkpoint_interval)))
 
         await trading_session_task
 
+    def start_clocks(self):
+        """Starts the clock of the session and of its bots, or rebases them if the session is resumed."""
+        if self.resume_elapsed_time is None:
+            # a pre-warmed session may have waited in the pool (or starts from a checkpointed book), its day starts now
+            self.trading_session.start_time = now()
+            bots_start_time = time.monotonic()
+        else:
+            # a restored session goes on where it was checkpointed, so do the clocks of its bots (informed schedules)
+            self.trading_session.start_time = now() - timedelta(seconds=self.resume_elapsed_time)
+            bots_start_time = time.monotonic() - self.resume_elapsed_time
+        for trader in self.noise_traders + self.informed_traders:
+            trader.start_time = bots_start_time
+
+    def get_spectator_feed(self) -> SpectatorFeed:
+        if self.spectator_feed is None:
+            self.spectator_feed = SpectatorFeed(self.trading_session)
+        return self.spectator_feed
+
     async def cleanup(self):
+        self.bot_scheduler.stop()
+        if self.spectator_feed:
+            await self.spectator_feed.stop()
+        if self.feature_feed:
+            self.feature_feed.stop()
         await self.trading_session.clean_up()
         for trader in self.traders.values():
             await trader.clean_up()
@@ -103,6 +189,98 @@ class TraderManager:
             task.cancel()  # Request cancellation of the task
         await asyncio.gather(*self.tasks, return_exceptions=True)
         self.tasks.clear()  # Clear the list of tasks after cancellation
+        drop_session_metrics(self.trading_session.id)
+
+    def get_checkpoint_state(self):
+        return {
+            'params': self.params.model_dump(),
+            'trading_session': self.trading_session.get_checkpoint_state(),
+            'noise_traders': [t.get_checkpoint_state() for t in self.noise_traders],
+            'informed_traders': [t.get_checkpoint_state() for t in self.informed_traders],
+            'human_traders': [t.get_checkpoint_state() for t in self.human_traders],
+            # how far into the session we are, the restored clocks are rebased on it
+            'elapsed_time': (now() - self.trading_session.start_time).total_seconds()
+            if self.trading_session.start_time else None,
+        }
+
+    async def checkpoint(self, path=None):
+        """Writes a checkpoint of the session and its traders. Only copying the state happens on the event loop."""
+        path = path or get_checkpoint_path(self.trading_session.id)
+        await save_checkpoint(self.get_checkpoint_state(), path)
+        return path
+
+    async def run_periodic_checkpoints(self, interval):
+        while self.trading_session.active:
+            await asyncio.sleep(interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                logger.error("Checkpoint of session %s failed: %s", self.trading_session.id, e)
+
+    @classmethod
+    async def from_checkpoint(cls, path, new_session=False):
+        """
+        Rebuilds a TraderManager (with its TradingSession) from a checkpoint file. It still has to be launched, and
+        then resumes the session where it was checkpointed: the clocks of the session and of its bots are rebased
+        on the elapsed time of the checkpoint.
+        With new_session=True only the book carries over: we get a fresh session, with its own id and clock, that
+        starts from the bots' resting orders. The bots keep their ids (they own these orders) but start with fresh
+        ledgers; the humans are new traders and their old orders are dropped.
+        """
+        state = await load_checkpoint(path)
+        manager = cls(TraderCreationData(**state['params']))
+        trader_groups = [(manager.noise_traders, state['noise_traders']),
+                         (manager.informed_traders, state['informed_traders'])]
+        if not new_session:
+            trader_groups.append((manager.human_traders, state['human_traders']))
+        for traders, trader_states in trader_groups:
+            for trader, trader_state in zip(traders, trader_states):
+                trader.restore_checkpoint_state(trader_state, book_only=new_session)
+        manager.traders = {t.id: t for t in manager.noise_traders + manager.informed_traders + manager.human_traders}
+        manager.trading_session.restore_checkpoint_state(state['trading_session'], new_session=new_session)
+        manager.restored = True
+        if not new_session:
+            manager.resume_elapsed_time = state.get('elapsed_time')
+        return manager
+
+    def get_results(self):
+        """Final state of the session and its traders, the part that stays in Mongo after the session is evicted."""
+        session = self.trading_session
+        return {
+            'trading_session_id': session.id,
+            'params': self.params.model_dump(mode='json'),
+            'start_time': session.start_time,
+            'end_time': now(),
+            'status': 'active' if session.active else 'finished',
+            'non_responders': [str(trader_id) for trader_id in session.non_responders],
+            'traders': [{'id': t.id, 'type': t.trader_type, 'cash': t.cash, 'shares': t.shares,
+                         'delta_cash': t.delta_cash, 'pnl': t.get_current_pnl()} for t in self.traders.values()],
+        }
+
+    async def save_results(self):
+        results = self.get_results()
+
+        def save():
+            n_transactions = TransactionModel.objects(trading_session_id=self.trading_session.id).count()
+            SessionResult(n_transactions=n_transactions, **results).save()
+
+        await asyncio.get_running_loop().run_in_executor(None, save)
+
+    def get_memory_report(self):
+        """Approximate bytes held by the session's book and ledgers and by the state of each trader."""
+        session = self.trading_session
+        session_report = {name: deep_getsizeof(getattr(session, name)) for name in
+                          ('all_orders', 'connected_traders', 'trader_responses', '_pending_trades')}
+        traders_report = {trader.id: sum(deep_getsizeof(getattr(trader, name))
+                                         for name in trader.checkpoint_attributes)
+                          for trader in self.traders.values()}
+        return {
+            'orders': len(session.all_orders),
+            'traders': len(self.traders),
+            'session_bytes': session_report,
+            'trader_bytes': traders_report,
+            'total_bytes': sum(session_report.values()) + sum(traders_report.values()),
+        }
 
     def get_trader(self, trader_uuid):
         return self.traders.get(trader_uuid)
@@ -0,0 +1,66 @@
+"""
+Streaming version of the noise trader module's feature pipeline (get_stack_update, get_features_update).
+
+The engine is updated with every book update of a session and keeps the last `stack_max_size` books and messages in
+preallocated ring buffers (a new book overwrites the oldest row, nothing is shifted), computes the features of the
+new book against the previous one (get_book_features) and updates the EWMAs of all settings['alphas_ewma'] with one
+array operation. features_state has the layout of get_features_update: one block of features per alpha.
+
+One engine runs per session (see client_connector/feature_feed.py) and its features_state is shared by all the
+model-driven traders of the session, instead of each trader computing the same features from its own stack.
+"""
+import numpy as np
+
+from external_traders.noise_trader import settings as default_settings, cols_message, get_book_features, \
+    get_cols_features
+
+
+class FeatureEngine:
+    def __init__(self, settings=None):
+        settings = settings or default_settings
+        self.levels_n = settings['levels_n']
+        self.stack_size = max(int(settings['stack_max_size']), 2)  # the features need the previous book
+        self.alphas = np.asarray(settings['alphas_ewma'], dtype=np.float64)[:, None]
+        self.weights_new = 1 - self.alphas
+        self.cols_features = get_cols_features(self.levels_n, settings['alphas_ewma'])
+
+        n_features = 2 * self.levels_n + 2
+        self.book_stack = np.zeros((self.stack_size, 4 * self.levels_n))
+        self.message_stack = np.zeros((self.stack_size, len(cols_message)))
+        self.count = 0  # books seen so far; the latest one is in row (count - 1) % stack_size
+        self.ewma = np.zeros((len(self.alphas), n_features))
+        self._features_new = np.empty(n_features)
+        self._scratch = np.empty_like(self.ewma)
+
+    @property
+    def features_state(self) -> np.ndarray:
+        """The EWMAs as one flat array (a view, it changes with the next update)."""
+        return self.ewma.reshape(-1)
+
+    def get_book(self, lag=0) -> np.ndarray:
+        """The book `lag` updates ago (0 is the latest)."""
+        if lag >= min(self.count, self.stack_size):
+            raise IndexError(lag)
+        return self.book_stack[(self.count - 1 - lag) % self.stack_size]
+
+    def update(self, book, message=None) -> bool:
+        """
+        Adds a book (a row of cols_book) and its message. Returns whether the features changed: a book equal to
+        the previous one isn't an update, and the first book only starts the stack.
+        """
+        book_prev = self.book_stack[(self.count - 1) % self.stack_size] if self.count else None
+        if book_prev is not None and np.array_equal(book, book_prev):
+            return False
+
+        row = self.count % self.stack_size
+        self.book_stack[row] = book
+        self.message_stack[row] = 0 if message is None else message
+        self.count += 1
+        if book_prev is None:
+            return False
+
+        features_new = get_book_features(self.book_stack[row], book_prev, self.levels_n, out=self._features_new)
+        self.ewma *= self.alphas
+        np.multiply(self.weights_new, features_new, out=self._scratch)
+        self.ewma += self._scratch
+        return True
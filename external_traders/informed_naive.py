@@ -15,8 +15,12 @@ settings_informed = {
     "time_period_in_min": 5,
     "trade_intensity": 0.10,
     "direction": "sell",
+    "min_slice_interval": 1,  # seconds; planned trades closer than this are grouped into multi-share slices
 }
 
+# a wakeup may come a little before its planned time (timer resolution), these seconds still count as on time
+SCHEDULE_TOLERANCE = 1e-3
+
 # given that all the rest should run without any change
 
 
@@ -29,8 +33,14 @@ def update_settings_informed(settings_informed):
         settings_informed["total_seconds"] - 10
     ) / settings_informed["inv"]
 
-    time_plan = [settings_informed["sn"]] * settings_informed["inv"]
-    informed_time_plan = {"period": np.cumsum(time_plan)}
+    # with a high intensity the planned trades get too close, so several shares go in one slice
+    slice_shares = max(1, int(np.ceil(settings_informed.get("min_slice_interval", 0) / settings_informed["sn"])))
+    n_slices = int(np.ceil(settings_informed["inv"] / slice_shares))
+    shares = np.full(n_slices, slice_shares)
+    shares[-1] = settings_informed["inv"] - slice_shares * (n_slices - 1)
+
+    time_plan = [settings_informed["sn"] * slice_shares] * n_slices
+    informed_time_plan = {"period": np.cumsum(time_plan), "shares": shares}
 
     if settings_informed["direction"] == "sell":
         informed_state = {"inv": settings_informed["inv"]}
@@ -45,15 +55,39 @@ settings_informed, informed_time_plan, informed_state = update_settings_informed
 )
 
 
-def get_signal_informed(informed_state, settings_informed, informed_time_plan, time):
-    # time here is the clock time measured by the platform
-    # if this is not convenient, Wenbin propose something else
+class ExecutionSchedule:
+    """
+    The time plan of one informed trader, computed once: the planned times (seconds since the start of the session)
+    in order, the shares of each slice, and a cursor on the first slice that wasn't executed yet.
+    Each trader needs its own schedule, the cursor is its progress.
+    """
+
+    def __init__(self, period, shares=None):
+        order = np.argsort(period, kind="stable")
+        self.times = [float(period[i]) for i in order]
+        self.shares = [int(shares[i]) for i in order] if shares is not None else [1] * len(self.times)
+        self.cursor = 0
+
+    def next_time(self):
+        """Planned time of the next slice, None when the plan is over."""
+        return self.times[self.cursor] if self.cursor < len(self.times) else None
+
+    def pop_due(self, time):
+        """Shares of all the slices planned up to `time` that weren't executed yet; they are executed now."""
+        due = 0
+        while self.cursor < len(self.times) and self.times[self.cursor] <= time + SCHEDULE_TOLERANCE:
+            due += self.shares[self.cursor]
+            self.cursor += 1
+        return due
+
 
-    times_to_act = informed_time_plan["period"].astype(int)
+def get_signal_informed(informed_state, settings_informed, schedule, time):
+    # time here is the clock time measured by the platform, in seconds since the start
+    # everything planned up to now that wasn't done yet goes in this signal, so a late wakeup doesn't lose shares
+    shares = min(schedule.pop_due(time), abs(informed_state["inv"]))
 
-    if time in times_to_act and informed_state["inv"] != 0:
+    if shares > 0:
         action = 1
-        shares = 1
     else:
         action = 0
         shares = 0
@@ -74,12 +108,12 @@ def get_order_to_match(
     if action == 1 and settings_informed["direction"] == "sell":
         price = book[2]  # best bid
         order = {"bid": {price: [num_shares]}, "ask": {}}
-        informed_state["inv"] -= 1
+        informed_state["inv"] -= num_shares
 
     if action == 1 and settings_informed["direction"] == "buy":
         price = book[0]  # best ask
         order = {"bid": {}, "ask": {price: [num_shares]}}
-        informed_state["inv"] += 1
+        informed_state["inv"] += num_shares
 
     if action == 0:
         order = {}
@@ -0,0 +1,41 @@
+"""
+Optional compilation of the array-level LOB routines of the strategies (the execution and insertion primitives of
+external_traders/noise_trader.py).
+
+They are written as plain loops over NumPy arrays that numba can compile in nopython mode. @jit compiles them when
+numba is installed, the first time they are called (so importing the strategies stays cheap), and leaves them as
+they are otherwise: the Python code is the fallback and the reference, and stays reachable as `func.py_func` to
+compare the two paths. LOB_KERNELS_JIT=0 turns the compilation off.
+
+Called from Python, a compiled kernel still pays the call; a whole offline simulation gets the big speed up when its
+loop is compiled too: numba code can call the kernels' dispatchers, `func.get_compiled()` (None without numba).
+"""
+import functools
+import importlib.util
+import os
+
+NUMBA_AVAILABLE = importlib.util.find_spec('numba') is not None
+JIT_ENABLED = NUMBA_AVAILABLE and os.getenv('LOB_KERNELS_JIT', '1') != '0'
+
+
+def jit(func):
+    if not JIT_ENABLED:
+        func.py_func = func
+        func.get_compiled = lambda: None
+        return func
+    compiled = None
+
+    def get_compiled():
+        nonlocal compiled
+        if compiled is None:
+            import numba
+            compiled = numba.njit(cache=True)(func)
+        return compiled
+
+    @functools.wraps(func)
+    def kernel(*args):
+        return (compiled or get_compiled())(*args)
+
+    kernel.py_func = func
+    kernel.get_compiled = get_compiled
+    return kernel
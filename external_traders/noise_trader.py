@@ -7,8 +7,8 @@ Created on Wed Aug  2 10:14:44 2023
 """
 
 import numpy as np
-# import numba
 import datetime
+from external_traders.lob_kernels import jit
 from main_platform.custom_logger import setup_custom_logger
 
 
@@ -111,8 +111,8 @@ message_stack = {"a 2d array of shape (settings['stack_max_size'],len(cols_messa
 cols_features_state = {'they will vary: they are intermediate inputs not used by the interface'}
 
 # features_state = {"a 1d array of shape (len(cols_features_state),) and type floats"}
-n_features = 22  # This should be set to the actual number of features
-n_alphas = 3  # This should be set to the actual number of alphas
+n_features = 2 * levels_n + 2  # order flow per level, mid change and their absolute values (see get_book_features)
+n_alphas = len(settings['alphas_ewma'])  # one block of n_features per alpha
 
 features_state = np.zeros(n_alphas * n_features)
 # signals state
@@ -255,10 +255,10 @@ def transform_book(book_stack, settings):
     bid_p = book_stack[:, settings['ind_bid_price']]
     ask_p = book_stack[:, settings['ind_ask_price']]
     bid_s = book_stack[:, settings['ind_bid_size']]
-    ask_s = book_stack[:, settings['ind_bid_size']]
+    ask_s = book_stack[:, settings['ind_ask_size']]
 
     dbid_p = bid_p[1:] - bid_p[:-1]
-    dask_p = bid_p[1:] - bid_p[:-1]
+    dask_p = ask_p[1:] - ask_p[:-1]
 
     cond_bid_1 = dbid_p >= 0
     cond_bid_2 = dbid_p <= 0
@@ -277,78 +277,66 @@ def transform_book(book_stack, settings):
     return book_of_stack
 
 
-def get_features_stack_update(features_stack, book, message, book_of, settings):
-    # performs the update: i.e. compute the latest features based on stack
-    return features_stack
-
-
-def get_features_update(features_state, book_stack, message_stack, settings, cols_ft=None):
-    features_state = list(features_state)
-    alphas = settings['alphas_ewma']
-    n_alphas = len(alphas)
-    n_features = 22  # This should be set to the actual number of features
-    n_alphas = 3  # This should be set to the actual number of alphas
-
-    features_state = np.zeros(n_alphas * n_features)
-    levels_n = settings['levels_n']
-    ind_bid_price1 = settings['ind_bid_price'][0]
-    ind_bid_price1 = settings['ind_bid_price'][0]
-    ind_ask_price1 = settings['ind_ask_price'][0]
+def get_cols_features(levels_n, alphas=None):
+    """Names of the features of get_book_features, or of the whole features_state if the alphas are given."""
+    cols_of = ['of_' + str(level) for level in range(1, 1 + levels_n)]
+    cols_of_abs = [col_of + '_abs' for col_of in cols_of]
+    cols_features = cols_of + ['dmid'] + cols_of_abs + ['dmid_abs']
+    if alphas is None:
+        return cols_features
+    return [col + '_' + str(int(100 * alpha)) for alpha in alphas for col in cols_features]
 
-    bid_p1 = book_stack[-1, ind_bid_price1]
-    ask_p1 = book_stack[-1, ind_ask_price1]
-    bid_p1l = book_stack[-2, ind_bid_price1]
-    ask_p1l = book_stack[-2, ind_ask_price1]
 
-    mid = 0.5 * (bid_p1 + ask_p1)
-    midl = 0.5 * (bid_p1l + ask_p1l)
-
-    of = transform_book(book_stack, settings)[-1]  # if stack longer than 2, only use the latest
-    of_abs = np.abs(of)
-    dmid = 2 * (mid - midl) / (mid + midl)
-    dmid_abs = np.abs(dmid)
-
-    # signed_trd  =
-    # trd         = np.abs(signed_trd)
-
-    # features_new = np.r_[book_of,book_of_abs,dmid ,dmid_abs,signed_trd,trd ]
-
-    features_new = np.r_[of, dmid, of_abs, dmid_abs]
-    cols_features = None
-    if cols_features is None:
-        cols_of = ['of_' + str(level) for level in range(1, 1 + levels_n)]
-        cols_dmid = ['dmid']
-        cols_of_abs = [col_of + '_abs' for col_of in cols_of]
-        cols_dmid_abs = ['dmid_abs']
-        cols_features = cols_of + cols_dmid + cols_of_abs + cols_dmid_abs
-
-    n_features = len(features_new)
-
-    if features_state is None:  # no features have been computed so far
-        features_state = np.zeros((n_alphas * len(features_new),))
-        if cols_ft is not None:  # perform a check - only at the very beginning that we are computing the correct features
-            cols_of = ['of_' + str(level) for level in range(1, 1 + levels_n)]
-            cols_dmid = ['dmid']
-            cols_of_abs = [col_of + '_abs' for col_of in cols_of]
-            cols_dmid_abs = ['dmid_abs']
-            cols_features = cols_of + cols_dmid + cols_of_abs + cols_dmid_abs
-            col_features = [col_features + '_' + str(int(100 * alpha)) for alpha in alphas for col_features in
-                            cols_features]
-            if cols_ft != cols_features: raise Exception('features are not as expected: check settings')
+def get_book_features(book, book_prev, levels_n, out=None):
+    """
+    Features of one book update: the order flow of each level (what transform_book gives for the last book of
+    the stack), the relative change of the mid, and their absolute values. A book is a row of cols_book, so
+    reshaped to (levels_n, 4) its columns are ask_price, ask_size, bid_price, bid_size.
+    `out` is an array of n_features to write into, so a caller that updates on every book doesn't allocate.
+    """
+    if out is None:
+        out = np.empty(2 * levels_n + 2)
+    levels, levels_prev = book.reshape(levels_n, 4), book_prev.reshape(levels_n, 4)
+    ask_p, ask_s, bid_p, bid_s = levels.T
+    ask_p_prev, ask_s_prev, bid_p_prev, bid_s_prev = levels_prev.T
 
-    for i in range(n_alphas):
-        alpha = alphas[i]
+    of = out[:levels_n]
+    np.multiply(bid_s, bid_p >= bid_p_prev, out=of)
+    of -= bid_s_prev * (bid_p <= bid_p_prev)
+    of -= ask_s * (ask_p <= ask_p_prev)
+    of += ask_s_prev * (ask_p >= ask_p_prev)
 
-        ewma_block_i = features_state[(i * n_features):((i + 1) * n_features)]
-        ewma_block_i = np.array(ewma_block_i)
-        features_new = np.array(features_new)
+    mid, mid_prev = 0.5 * (bid_p[0] + ask_p[0]), 0.5 * (bid_p_prev[0] + ask_p_prev[0])
+    out[levels_n] = 2 * (mid - mid_prev) / (mid + mid_prev)
+    np.abs(out[:levels_n + 1], out=out[levels_n + 1:])
+    return out
 
-        ewma_block_i = alpha * ewma_block_i + (1 - alpha) * features_new
 
-        features_state[(i * n_features):((i + 1) * n_features)] = ewma_block_i
+def get_features_stack_update(features_stack, book, message, book_of, settings):
+    # performs the update: i.e. compute the latest features based on stack
+    return features_stack
 
-    # update features names with ewma
 
+def get_features_update(features_state, book_stack, message_stack, settings, cols_ft=None):
+    """
+    Updates the EWMAs of the features of the last book of the stack, one block of features per alpha of
+    settings['alphas_ewma'] (see get_cols_features), all alphas in one array operation. features_state is updated
+    in place if it has the right size, otherwise a zero state is started.
+    FeatureEngine (external_traders/feature_engine.py) does the same on every book update without the stack.
+    """
+    levels_n = settings['levels_n']
+    alphas = np.asarray(settings['alphas_ewma'], dtype=np.float64)[:, None]
+    if cols_ft is not None and cols_ft != get_cols_features(levels_n, settings['alphas_ewma']):
+        raise Exception('features are not as expected: check settings')
+
+    features_new = get_book_features(book_stack[-1], book_stack[-2], levels_n)
+    n_state = len(alphas) * len(features_new)
+    if not isinstance(features_state, np.ndarray) or features_state.shape != (n_state,):
+        features_state = np.zeros(n_state)
+
+    ewma = features_state.reshape(len(alphas), len(features_new))
+    ewma *= alphas
+    ewma += (1 - alphas) * features_new
     return features_state
 
 
@@ -365,17 +353,33 @@ def get_model_prediction(features, model, settings):
     return np.random.uniform(0, 1)
 
 
-def get_signal_update(features_state, models, settings):
-    # example
-    model_names = list(models.keys())
-    signals_state = np.zeros((len(model_names),))
-    for i, model_name in enumerate(model_names):
-        model = models[model_name]
+def get_model_predictions(features, model, settings):
+    """
+    Predictions of one model for a batch of feature vectors (one per row), with a single predict call of the
+    fitted model (sklearn-style). Without a fitted model it's the placeholder of get_model_prediction, row by row.
+    """
+    model_fitted = model['model']
+    if model_fitted is None:
+        return np.random.uniform(0, 1, len(features))
+    return np.asarray(model_fitted.predict(features), dtype=np.float64).reshape(len(features))
+
+
+def get_signal_update_batch(features_states, models, settings):
+    """
+    get_signal_update for many features states at once (one per row, e.g. one per session): one predict per model
+    for the whole batch. Returns the signals states, one row per features state and one column per model.
+    """
+    features_states = np.atleast_2d(features_states)
+    signals_states = np.zeros((len(features_states), len(models)))
+    for i, model in enumerate(models.values()):
         features_ind = model['feature_ind']
-        features = features_state[features_ind]
-        model_fitted = model['model']
-        signals_state[i] = get_model_prediction(features, model, settings)
-    return signals_state
+        features = features_states if features_ind is None else features_states[:, features_ind]
+        signals_states[:, i] = get_model_predictions(features, model, settings)
+    return signals_states
+
+
+def get_signal_update(features_state, models, settings):
+    return get_signal_update_batch(features_state, models, settings)[0]
 
 
 # call every time there is a book update
@@ -621,77 +625,66 @@ def get_noise_order(book, signal_noise, noise_state,
 
 
 # finds the first price at which there is a size less than max_size_level, else gives -1
-# @numba.jit('float64(float64[:],float64[:], float64)', nopython=True)
-
+@jit
 def get_noise_condition_price(prices, sizes, max_size_level):
 
-    # Zip the prices and sizes, then find the first pair where size is either zero or less than max_size_level
-    for p, s in zip(prices, sizes):
-        if s < max_size_level:
-            return p  # return the price of the first such pair
+    # the first pair where size is either zero or less than max_size_level
+    for i in range(len(prices)):
+        if sizes[i] < max_size_level:
+            return prices[i]  # return the price of the first such pair
 
     return -1  # if no such pair exists, return -1
 
 
-
-
 # execution code
 # this part updates the bid side of the order book using an ask price and size.
-# @numba.jit(numba.types.Tuple((numba.float64[:], numba.float64, numba.float64))(numba.float64[:], numba.float64[:],
-#                                                                                numba.float64, numba.float64),
-#            nopython=True)
+@jit
 def get_exec_sell_trd(bid_prices, bid_sizes,
                       order_ask_price, order_ask_size):
     bid_sizes_new = bid_sizes
-    i = 0
     n = len(bid_sizes)
-    cond = order_ask_price <= bid_prices[i]
-    if cond:
-        exec_size = 0
-        exec_price = 0
-        order_ask_size_tot = order_ask_size
-        order_ask_size_new = order_ask_size
-
-        while cond:
-            order_ask_size = order_ask_size_new  # size to execute at level i
-            bid_size_i = bid_sizes[i] - order_ask_size  # size left on book at level i
-            bid_sizes_new[i] = np.maximum(bid_size_i, 0)  # new size in book at level i
-            order_ask_size_new = np.maximum(-bid_size_i, 0)  # residual size to execute at next level
-
-            exec_price = exec_price \
-                         + bid_prices[i] \
-                         * (order_ask_size - order_ask_size_new)  # weighted sum pe exec price
-
-            i += 1
-            cond = (order_ask_price <= bid_prices[i]) & \
-                   (order_ask_size_new > 0) & (i < n)
-            # print(order_ask_size_new)
-        exec_size = (order_ask_size_tot - order_ask_size_new)
-        exec_price = exec_price / exec_size
-    else:
-        exec_size = np.nan
-        exec_price = np.nan
-
-    return (bid_sizes_new, exec_price, exec_size)
+    if n == 0 or order_ask_price > bid_prices[0]:
+        return (bid_sizes_new, np.nan, np.nan)
+
+    exec_price = 0.
+    order_ask_size_tot = order_ask_size
+    order_ask_size_new = order_ask_size
+    i = 0
+    while i < n and order_ask_price <= bid_prices[i] and order_ask_size_new > 0:
+        order_ask_size = order_ask_size_new  # size to execute at level i
+        bid_size_i = bid_sizes[i] - order_ask_size  # size left on book at level i
+        bid_sizes_new[i] = max(bid_size_i, 0.)  # new size in book at level i
+        order_ask_size_new = max(-bid_size_i, 0.)  # residual size to execute at next level
+
+        exec_price = exec_price \
+                     + bid_prices[i] \
+                     * (order_ask_size - order_ask_size_new)  # weighted sum pe exec price
+        i += 1
+
+    exec_size = order_ask_size_tot - order_ask_size_new
+    if exec_size == 0:
+        return (bid_sizes_new, np.nan, np.nan)
+    exec_price = exec_price / exec_size
+    return (bid_sizes_new, exec_price, 1. * exec_size)
 
 
+@jit
 def get_insert_sell(ask_prices, ask_sizes,
                     order_ask_price, order_ask_size):
-    ask_sizes_new = ask_sizes
-    ask_prices_new = ask_prices
     n = len(ask_sizes)
-    cond = order_ask_price in ask_prices
-    if cond:
-        ind_insertion = list(ask_prices).index(order_ask_price)
-        ask_sizes_new[ind_insertion] += order_ask_size
-    elif (order_ask_price < ask_prices[0]):  # need to modify the price with new insertion if price improves
+    for i in range(n):
+        if ask_prices[i] == order_ask_price:
+            ask_sizes[i] += order_ask_size
+            return (ask_prices, ask_sizes)
+    if order_ask_price < ask_prices[0]:  # need to modify the price with new insertion if price improves
         ask_prices_new = np.empty((n,))
         ask_sizes_new = np.empty((n,))
         ask_prices_new[0] = order_ask_price
         ask_prices_new[1:] = ask_prices[:-1]
         ask_sizes_new[0] = order_ask_size
         ask_sizes_new[1:] = ask_sizes[:-1]
-    return (ask_prices_new, ask_sizes_new)
+        return (ask_prices_new, ask_sizes_new)
+    return (ask_prices, ask_sizes)
 
 
 # running example
@@ -725,62 +718,18 @@ def get_book_message_init(best_bid, size, settings):
     return (book, message)
 
 
-cond = True
-iter_num = 0
-max_iter = 1000
-
-# initialise the book
-best_bid = 2009
-size = 1
-book, message = get_book_message_init(best_bid, size, settings)
-
-bid_p = book[settings['ind_bid_price']]
-ask_p = book[settings['ind_ask_price']]
-bid_s = book[settings['ind_bid_size']]
-ask_s = book[settings['ind_ask_size']]
-
-# id -1 as the book is initialised by noise traders
-bid_queue_dict = {bid_p[i]: [[bid_s[i]], [-1]] for i in range(len(bid_p))}
-ask_queue_dict = {ask_p[i]: [[ask_s[i]], [-1]] for i in range(len(ask_p))}
-
-# initialise the noise_state
-outstanding_bid_noise = {bid_p[i]: [bid_s[i]] for i in range(len(bid_p))}
-outstanding_ask_noise = {ask_p[i]: [ask_s[i]] for i in range(len(ask_p))}
-noise_state = {'outstanding_orders': {'bid': outstanding_bid_noise, 'ask': outstanding_ask_noise}}
-
-book_stack = np.zeros((settings['stack_max_size'], len(cols_book)))
-message_stack = np.zeros((settings['stack_max_size'], len(cols_message)))
-
-state_count = np.array([0, 0])
-
-tic = datetime.datetime.now()
-
-while cond:
-    book_stack, message_stack, state_count = get_stack_update(book, message,
-                                                              book_stack, message_stack,
-                                                              state_count, settings)
-
-    cond_update_auxiliary_objects = get_should_update(state_count, settings)
-    # if true run all the following processes
-    if cond_update_auxiliary_objects:  # update features and signal
-        features_state = get_features_update(features_state, book_stack, message_stack, settings)
-        signals_state = get_signal_update(features_state, models, settings)
-
-    # call each subscribed trader`
-
-    signal_noise = get_signal_noise(signals_state, settings_noise)
-    order_noise = get_noise_order(book, signal_noise, noise_state,
-                                  settings_noise, settings)
-
-    # put together all the orders: only one as we only have one trader
-
-    orders = [order_noise, -1]  # only one order with id -1, the one of noise trader
-
-    # do the matching here, modify
-    # 1. book, message
-    # it may leads to multiple updates, but only report the last one,
-    # but in message to report the type as trade if there was one and include price and size
-    # 2.bid_queue_dict, ask_queue_dict
-    # 3. the state of all the traders, including the outstanding orders
-    iter_num += 1
-    cond = iter_num < max_iter
\ No newline at end of file
+def get_book_seed_orders(best_bid, levels_n, step, orders_per_level, max_size, owners, rng=None):
+    """
+    Orders of an initial book laid out like get_book_message_init, but with any number of levels: bids from
+    best_bid down and asks from best_bid + step up, `step` apart. Each level gets orders_per_level orders of a size
+    uniform in 1..max_size, and each order belongs to one of the owners picked at random.
+    order_type is 1 for bids and -1 for asks (OrderType).
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    offsets = np.repeat(np.arange(levels_n), orders_per_level) * step
+    prices = np.concatenate([best_bid - offsets, best_bid + step + offsets])
+    order_types = np.repeat([1, -1], len(offsets))
+    sizes = rng.integers(1, max_size + 1, size=len(prices))
+    owner_index = rng.integers(len(owners), size=len(prices))
+    return [{'trader_id': owners[o], 'order_type': int(t), 'price': float(p), 'amount': int(s)}
+            for o, t, p, s in zip(owner_index, order_types, prices, sizes)]
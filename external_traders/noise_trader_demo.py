@@ -0,0 +1,72 @@
+"""
+Demo of the noise trader strategy on its own, without the platform: the feature engine and the signals are updated
+and the noise trader makes an order at each of max_iter book updates. There is no matching yet, the book stays the
+initial one.
+
+    python -m external_traders.noise_trader_demo
+"""
+import datetime
+
+from external_traders import noise_trader
+from external_traders.feature_engine import FeatureEngine
+from external_traders.noise_trader import (settings, settings_noise, models, get_book_message_init,
+                                           get_signal_update, get_signal_noise, get_noise_order)
+
+
+def main():
+    feature_engine = FeatureEngine(settings)
+    signals_state = noise_trader.signals_state
+    cond = True
+    iter_num = 0
+    max_iter = 1000
+
+    # initialise the book
+    best_bid = 2009
+    size = 1
+    book, message = get_book_message_init(best_bid, size, settings)
+
+    bid_p = book[settings['ind_bid_price']]
+    ask_p = book[settings['ind_ask_price']]
+    bid_s = book[settings['ind_bid_size']]
+    ask_s = book[settings['ind_ask_size']]
+
+    # id -1 as the book is initialised by noise traders
+    bid_queue_dict = {bid_p[i]: [[bid_s[i]], [-1]] for i in range(len(bid_p))}
+    ask_queue_dict = {ask_p[i]: [[ask_s[i]], [-1]] for i in range(len(ask_p))}
+
+    # initialise the noise_state
+    outstanding_bid_noise = {bid_p[i]: [bid_s[i]] for i in range(len(bid_p))}
+    outstanding_ask_noise = {ask_p[i]: [ask_s[i]] for i in range(len(ask_p))}
+    noise_state = {'outstanding_orders': {'bid': outstanding_bid_noise, 'ask': outstanding_ask_noise}}
+
+    tic = datetime.datetime.now()
+
+    while cond:
+        # features and signal are updated when the book changed
+        if feature_engine.update(book, message):
+            signals_state = get_signal_update(feature_engine.features_state, models, settings)
+
+        # call each subscribed trader`
+
+        signal_noise = get_signal_noise(signals_state, settings_noise)
+        order_noise = get_noise_order(book, signal_noise, noise_state,
+                                      settings_noise, settings)
+
+        # put together all the orders: only one as we only have one trader
+
+        orders = [order_noise, -1]  # only one order with id -1, the one of noise trader
+
+        # do the matching here, modify
+        # 1. book, message
+        # it may leads to multiple updates, but only report the last one,
+        # but in message to report the type as trade if there was one and include price and size
+        # 2.bid_queue_dict, ask_queue_dict
+        # 3. the state of all the traders, including the outstanding orders
+        iter_num += 1
+        cond = iter_num < max_iter
+
+    print(f'{iter_num} iterations in {datetime.datetime.now() - tic}')
+
+
+if __name__ == '__main__':
+    main()
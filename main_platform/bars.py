@@ -0,0 +1,59 @@
+"""
+OHLCV bars of a session's trades.
+
+The aggregator is updated with each trade as it happens and keeps, for each interval, the bars so far: open, high,
+low, close, volume and VWAP. It also remembers which bars changed since they were last taken (pop_updates), so
+the session publishes only these bars (a few numbers per interval) after an action instead of the whole tape.
+Bars are aligned on multiples of their interval, in epoch seconds.
+"""
+from datetime import datetime
+from typing import Dict, List
+
+BAR_INTERVALS = (1, 5, 60)  # seconds
+
+
+class BarAggregator:
+    def __init__(self, intervals=BAR_INTERVALS):
+        self.intervals = tuple(intervals)
+        self.bars: Dict[int, List[dict]] = {interval: [] for interval in self.intervals}
+        self._updated = {}  # (interval, start) -> bar, in the order they were touched
+
+    def add_trade(self, price: float, amount: float, timestamp: datetime):
+        epoch = timestamp.timestamp()
+        for interval in self.intervals:
+            start = int(epoch // interval * interval)
+            bars = self.bars[interval]
+            if bars and bars[-1]['start'] == start:
+                bar = bars[-1]
+                bar['high'] = max(bar['high'], price)
+                bar['low'] = min(bar['low'], price)
+                bar['close'] = price
+                bar['volume'] += amount
+                bar['turnover'] += price * amount
+            elif bars and bars[-1]['start'] > start:
+                continue  # a trade older than the current bar (clocks of the timestamps differ), we don't go back
+            else:
+                bar = {'interval': interval, 'start': start, 'open': price, 'high': price, 'low': price,
+                       'close': price, 'volume': amount, 'turnover': price * amount}
+                bars.append(bar)
+            self._updated[(interval, start)] = bar
+
+    @staticmethod
+    def to_message(bar: dict) -> dict:
+        message = {key: value for key, value in bar.items() if key != 'turnover'}
+        message['vwap'] = bar['turnover'] / bar['volume'] if bar['volume'] else bar['close']
+        return message
+
+    def pop_updates(self) -> List[dict]:
+        """The bars that changed since the last call, in the order they were changed."""
+        updated, self._updated = self._updated, {}
+        return [self.to_message(bar) for bar in updated.values()]
+
+    def get_bars(self, interval: int, since: float = None) -> List[dict]:
+        """All bars of an interval, or only those that start at `since` (epoch seconds) or later."""
+        if interval not in self.bars:
+            raise KeyError(interval)
+        bars = self.bars[interval]
+        if since is not None:
+            bars = [bar for bar in bars if bar['start'] >= since]
+        return [self.to_message(bar) for bar in bars]
@@ -0,0 +1,100 @@
+"""
+Session level scheduler for the bots.
+
+Instead of every bot running its own `while` loop with `asyncio.sleep`, the scheduler keeps one heap of the next
+activation times of all the bots of a trading session. It sleeps until the earliest one, wakes all the bots that are
+due (within a small batching window) and gives them the same book snapshot, so the book is built once per tick and
+not once per bot.
+
+Bots tell the scheduler when they want to be woken up next via `get_next_activation_delay` (seconds from now, or
+None if they are done).
+
+The snapshot is the only book the scheduled bots get: they don't subscribe to the book topics, so there is one
+writer of their order_book.
+"""
+import asyncio
+import heapq
+import itertools
+
+from main_platform.custom_logger import setup_custom_logger, set_log_session
+
+logger = setup_custom_logger(__name__)
+
+
+class BotScheduler:
+    def __init__(self, trading_session, traders, book_depth=10, batch_window=0.01):
+        """
+        trading_session - the session the bots trade in, used to build one book snapshot per tick
+        traders - bots to schedule. Each of them should implement act() and get_next_activation_delay()
+        book_depth - number of levels in the shared book snapshot
+        batch_window - bots that are due within this number of seconds are woken up together
+        """
+        self.trading_session = trading_session
+        self.traders = list(traders)
+        self.book_depth = book_depth
+        self.batch_window = batch_window
+        self._heap = []
+        self._counter = itertools.count()  # tie breaker, so traders themselves are never compared
+        self._stop_requested = asyncio.Event()
+        self.ticks = 0
+
+    def schedule(self, trader, delay: float):
+        """Puts the trader to the heap to be activated `delay` seconds from now."""
+        activation_time = asyncio.get_running_loop().time() + max(delay, 0)
+        heapq.heappush(self._heap, (activation_time, next(self._counter), trader))
+
+    def stop(self):
+        self._stop_requested.set()
+
+    def pop_due_traders(self, current_time: float):
+        """Pops all the traders whose activation time falls before current_time plus the batching window."""
+        due = []
+        while self._heap and self._heap[0][0] <= current_time + self.batch_window:
+            _, _, trader = heapq.heappop(self._heap)
+            due.append(trader)
+        return due
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        set_log_session(self.trading_session.id)
+        for trader in self.traders:
+            delay = trader.get_next_activation_delay()
+            if delay is not None:
+                self.schedule(trader, delay)
+
+        try:
+            while self._heap and not self._stop_requested.is_set():
+                delay = self._heap[0][0] - loop.time()
+                if delay > self.batch_window:
+                    try:
+                        await asyncio.wait_for(self._stop_requested.wait(), timeout=delay)
+                        break  # stop was requested while we were sleeping
+                    except asyncio.TimeoutError:
+                        pass
+                await self.tick(self.pop_due_traders(loop.time()))
+        except asyncio.CancelledError:
+            logger.info('Bot scheduler cancelled')
+            raise
+        logger.info('Bot scheduler of session %s stopped after %s ticks', self.trading_session.id, self.ticks)
+
+    async def tick(self, traders, reschedule=True):
+        """
+        Activates a batch of due traders on one shared book snapshot and reschedules them. Without rescheduling it's
+        an activation out of the schedule (the warm up).
+        """
+        traders = [trader for trader in traders if not trader._stop_requested.is_set()]
+        if not traders:
+            return
+        self.ticks += 1
+        snapshot = self.trading_session.get_order_book(self.book_depth)
+        for trader in traders:
+            trader.order_book = snapshot
+            try:
+                await trader.act()
+            except Exception as e:
+                logger.error("An error occurred when activating trader %s: %s", trader.id, e)
+            if not reschedule:
+                continue
+            delay = trader.get_next_activation_delay()
+            if delay is not None:
+                self.schedule(trader, delay)
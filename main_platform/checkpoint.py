@@ -0,0 +1,52 @@
+"""
+Checkpoints of a running trading session.
+
+A checkpoint is the state of the book, the session ledger and the traders (cash, shares, PnL) as plain python
+objects. It is pickled, compressed and written to a local file. The state is copied on the event loop (cheap, just
+dict copies), while serialization and the file write run in the default executor, so matching is not paused.
+The file is replaced atomically, so there is always one complete (latest) checkpoint per session.
+"""
+import asyncio
+import os
+import pickle
+import zlib
+
+from main_platform.custom_logger import setup_custom_logger
+
+logger = setup_custom_logger(__name__)
+
+CHECKPOINT_DIRECTORY = os.getenv('CHECKPOINT_DIRECTORY', 'checkpoints')
+CHECKPOINT_FORMAT_VERSION = 1
+
+
+def get_checkpoint_path(session_id, directory=CHECKPOINT_DIRECTORY):
+    return os.path.join(directory, f'{session_id}.ckpt')
+
+
+def write_checkpoint(state: dict, path: str):
+    """Serializes and writes the state. It is blocking, so call it via save_checkpoint from the event loop."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    payload = pickle.dumps({'version': CHECKPOINT_FORMAT_VERSION, 'state': state}, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(zlib.compress(payload, 1))  # level 1: we care about speed more than about the last few bytes
+    os.replace(tmp_path, path)
+
+
+def read_checkpoint(path: str) -> dict:
+    with open(path, 'rb') as f:
+        checkpoint = pickle.loads(zlib.decompress(f.read()))
+    if checkpoint.get('version') != CHECKPOINT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {checkpoint.get('version')} in {path}")
+    return checkpoint['state']
+
+
+async def save_checkpoint(state: dict, path: str):
+    await asyncio.get_running_loop().run_in_executor(None, write_checkpoint, state, path)
+    logger.info('Checkpoint written to %s', path)
+
+
+async def load_checkpoint(path: str) -> dict:
+    return await asyncio.get_running_loop().run_in_executor(None, read_checkpoint, path)
@@ -1,9 +1,42 @@
 # custom_logger.py
+"""
+Logging of the platform.
 
-from termcolor import colored
+Loggers don't write anything themselves: every logger made by setup_custom_logger has the same QueueHandler, which
+only puts the record to a queue. One background thread (a QueueListener) takes the records from the queue and
+writes them with the shared handlers:
+
+    - the colored console output
+    - logs/platform.log with the records of all the modules
+    - logs/sessions/<session_id>.jsonl, one JSON line per record logged on behalf of a trading session
+
+So the event loop never waits for the terminal or the disk. The thread (and logs/) is only started by the app
+startup or by the first record that passes a level check, so importing a module of the platform starts nothing.
+
+Log with %-style arguments, not f-strings: `logger.info('Order %s placed', order_id)` costs nothing if INFO is
+disabled, the message is only built for the records that pass the level check.
+
+The session a record belongs to comes from the `log_session_id` context variable. Tasks copy the context they were
+created in, so it's enough to call set_log_session at the start of the session's own tasks.
+"""
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
 import os
-CUR_LEVEL = logging.CRITICAL
+import queue
+import threading
+
+from termcolor import colored
+
+CUR_LEVEL = getattr(logging, os.getenv('LOG_LEVEL', 'WARNING').upper(), logging.WARNING)
+LOG_DIRECTORY = os.getenv('LOG_DIRECTORY', 'logs')
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+log_session_id = contextvars.ContextVar('log_session_id', default=None)
+
+
 class CustomFormatter(logging.Formatter):
     COLORS = {
         'WARNING': 'yellow',
@@ -18,28 +51,116 @@ class CustomFormatter(logging.Formatter):
         return colored(log_message, self.COLORS.get(record.levelname))
 
 
-def setup_custom_logger(name, log_directory="logs"):
-    # Create log directory if it doesn't exist
-    if not os.path.exists(log_directory):
-        os.makedirs(log_directory)
+class SessionContextFilter(logging.Filter):
+    """Stamps the records with the session of the current context (on the thread that logs, not the writer)."""
 
-    logger = logging.getLogger(name)
-    logger.setLevel(CUR_LEVEL)
+    def filter(self, record):
+        record.session_id = log_session_id.get()
+        return True
+
+
+class SessionJsonLinesHandler(logging.Handler):
+    """Writes the records of each trading session to its own JSON-lines file. Records without a session are skipped."""
+
+    def __init__(self, log_directory):
+        super().__init__()
+        self.directory = os.path.join(log_directory, 'sessions')
+        self.files = {}
 
-    # Console Handler
-    ch = logging.StreamHandler()
-    ch.setLevel(CUR_LEVEL)
+    def get_file(self, session_id):
+        f = self.files.get(session_id)
+        if f is None:
+            os.makedirs(self.directory, exist_ok=True)
+            f = self.files[session_id] = open(os.path.join(self.directory, f'{session_id}.jsonl'), 'a')
+        return f
 
-    # File Handler
-    fh = logging.FileHandler(os.path.join(log_directory, f"{name}.log"))
-    fh.setLevel(CUR_LEVEL)
+    def emit(self, record):
+        session_id = getattr(record, 'session_id', None)
+        if session_id is None:
+            return
+        try:
+            line = json.dumps({'timestamp': record.created, 'level': record.levelname, 'logger': record.name,
+                               'message': record.getMessage()}, default=str)
+            f = self.get_file(session_id)
+            f.write(line + '\n')
+            f.flush()
+        except Exception:
+            self.handleError(record)
 
-    formatter = CustomFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    def close_session(self, session_id):
+        with self.lock:
+            f = self.files.pop(session_id, None)
+        if f is not None:
+            f.close()
 
-    ch.setFormatter(formatter)
-    fh.setFormatter(formatter)
+    def close(self):
+        with self.lock:
+            files, self.files = self.files, {}
+        for f in files.values():
+            f.close()
+        super().close()
 
-    logger.addHandler(ch)
-    logger.addHandler(fh)
 
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that starts the writer thread when it gets its first record."""
+
+    def enqueue(self, record):
+        if _listener is None:
+            start_log_listener()
+        super().enqueue(record)
+
+
+_log_queue = queue.SimpleQueue()
+_queue_handler = LazyQueueHandler(_log_queue)
+_queue_handler.addFilter(SessionContextFilter())
+_listener = None
+_session_handler = None
+_listener_lock = threading.Lock()
+
+
+def start_log_listener(log_directory=LOG_DIRECTORY):
+    """Creates the shared handlers and starts the writer thread. Only the first call does something."""
+    global _listener, _session_handler
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+        os.makedirs(log_directory, exist_ok=True)
+        formatter = CustomFormatter(LOG_FORMAT)
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        file_handler = logging.FileHandler(os.path.join(log_directory, 'platform.log'))
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        _session_handler = SessionJsonLinesHandler(log_directory)
+        _listener = logging.handlers.QueueListener(_log_queue, console_handler, file_handler, _session_handler)
+        _listener.start()
+        atexit.register(stop_log_listener)
+        return _listener
+
+
+def stop_log_listener():
+    """Writes out what is left in the queue and stops the writer thread."""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def set_log_session(session_id):
+    log_session_id.set(session_id)
+
+
+def close_session_log(session_id):
+    if _session_handler is not None:
+        _session_handler.close_session(session_id)
+
+
+def setup_custom_logger(name):
+    logger = logging.getLogger(name)
+    logger.setLevel(CUR_LEVEL)
+    if _queue_handler not in logger.handlers:
+        logger.addHandler(_queue_handler)
     return logger
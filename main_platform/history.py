@@ -0,0 +1,93 @@
+"""
+Paginated reads of the history of a session from Mongo: trades (TransactionModel), broadcast messages (Message) and
+order events (OrderEvent).
+
+Pages are ordered by (timestamp, id) and walked with a cursor, the (timestamp, id) of the last item of the previous
+page, so a page costs the same however deep into the history it is: the query follows the
+(trading_session_id, timestamp, id) index of the collection instead of skipping documents. The documents are
+projected on the server (only the requested fields are read) and returned as plain dicts.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Iterable, Optional
+
+from bson import ObjectId
+from mongoengine import ObjectIdField
+
+from structures import TransactionModel, Message, OrderEvent
+
+HISTORY_DOCUMENTS = {'trades': TransactionModel, 'messages': Message, 'order_events': OrderEvent}
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidHistoryQuery(ValueError):
+    pass
+
+
+def encode_cursor(timestamp: datetime, document_id) -> str:
+    return base64.urlsafe_b64encode(json.dumps([timestamp.isoformat(), str(document_id)]).encode()).decode()
+
+
+def decode_cursor(cursor: str, document):
+    try:
+        timestamp, document_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp = datetime.fromisoformat(timestamp)
+        if isinstance(document._fields['id'], ObjectIdField):
+            document_id = ObjectId(document_id)
+    except Exception:
+        raise InvalidHistoryQuery(f'Invalid cursor: {cursor}')
+    return timestamp, document_id
+
+
+def get_projection(document, fields: Optional[Iterable[str]]):
+    """The fields to read; the timestamp and the id are always there, the cursor is made of them."""
+    if not fields:
+        return None
+    unknown = set(fields) - set(document._fields)
+    if unknown:
+        raise InvalidHistoryQuery(f'Unknown fields: {", ".join(sorted(unknown))}')
+    return sorted(set(fields) | {'id', 'timestamp'})
+
+
+def build_history_query(session_id: str, cursor=None, start: datetime = None, end: datetime = None) -> dict:
+    """Raw Mongo filter of one page. `cursor` is a decoded (timestamp, id); `start` is inclusive, `end` isn't."""
+    conditions = [{'trading_session_id': str(session_id)}]
+    time_range = {}
+    if start is not None:
+        time_range['$gte'] = start
+    if end is not None:
+        time_range['$lt'] = end
+    if time_range:
+        conditions.append({'timestamp': time_range})
+    if cursor is not None:
+        timestamp, document_id = cursor
+        conditions.append({'$or': [{'timestamp': {'$gt': timestamp}},
+                                   {'timestamp': timestamp, '_id': {'$gt': document_id}}]})
+    return conditions[0] if len(conditions) == 1 else {'$and': conditions}
+
+
+def get_history_page(kind: str, session_id: str, cursor: str = None, start: datetime = None, end: datetime = None,
+                     fields: Optional[Iterable[str]] = None, limit: int = DEFAULT_PAGE_SIZE) -> dict:
+    """
+    One page of a session's history. Blocking (it queries Mongo), so call it in an executor. Returns the items and
+    the cursor of the next page (None on the last page).
+    """
+    document = HISTORY_DOCUMENTS[kind]
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise InvalidHistoryQuery(f'limit should be between 1 and {MAX_PAGE_SIZE}')
+    query = build_history_query(session_id, decode_cursor(cursor, document) if cursor else None, start, end)
+    queryset = document.objects(__raw__=query).order_by('timestamp', 'id').limit(limit + 1)
+    projection = get_projection(document, fields)
+    if projection:
+        queryset = queryset.only(*projection)
+    items = list(queryset.as_pymongo())
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1]['timestamp'], items[-1]['_id'])
+    for item in items:
+        item['id'] = item.pop('_id')
+    return {'items': items, 'next_cursor': next_cursor}
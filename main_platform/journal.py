@@ -0,0 +1,101 @@
+"""
+Append-only journal of the actions a trading session receives.
+
+Every inbound action (add_order, cancel_order, register_me, inventory_report, ...) is written as one record:
+
+    | payload length: uint32 | arrival sequence: uint64 | arrival timestamp: float64 | payload: JSON |
+
+little-endian, so a record can be read without parsing the previous ones' payloads. The first record of a journal
+(sequence 0, action 'session') holds the parameters of the session, so the replay can rebuild the same session.
+Writes go to a buffered file; the buffer is flushed when full, on flush() and on close().
+Opening an existing journal appends to it: the sequence goes on from its last record, and a record cut by a crash
+at its end is dropped first, so the file stays readable.
+"""
+import json
+import os
+import struct
+import time
+from dataclasses import dataclass
+from typing import Iterator
+
+from main_platform.utils import CustomEncoder
+
+RECORD_HEADER = struct.Struct('<IQd')
+SESSION_RECORD_ACTION = 'session'
+JOURNAL_DIRECTORY = os.getenv('JOURNAL_DIRECTORY')  # journaling is off unless a directory is given
+
+
+def get_journal_path(session_id, directory):
+    return os.path.join(directory, f'{session_id}.journal')
+
+
+@dataclass
+class JournalRecord:
+    seq: int
+    timestamp: float
+    action: str
+    message: dict
+
+
+class ActionJournal:
+    def __init__(self, path: str, buffer_size: int = 64 * 1024):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.seq, size = scan_journal(path) if os.path.exists(path) else (0, 0)
+        self._file = open(path, 'ab', buffering=buffer_size)
+        self._file.truncate(size)
+
+    @property
+    def resumed(self) -> bool:
+        """True if the journal already had records (and so its session header) when it was opened."""
+        return self.seq > 0
+
+    def append(self, action: str, message: dict, timestamp: float = None) -> int:
+        """Writes one record and returns its arrival sequence number."""
+        payload = json.dumps({'action': action, **message}, cls=CustomEncoder, separators=(',', ':')).encode()
+        seq = self.seq
+        self._file.write(RECORD_HEADER.pack(len(payload), seq, time.time() if timestamp is None else timestamp))
+        self._file.write(payload)
+        self.seq += 1
+        return seq
+
+    def write_session_header(self, session_params: dict):
+        self.append(SESSION_RECORD_ACTION, session_params)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def scan_journal(path: str):
+    """Next sequence number and size of the complete records of a journal, only reading the record headers."""
+    next_seq, size = 0, 0
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return next_seq, size
+            length, seq, _ = RECORD_HEADER.unpack(header)
+            if len(f.read(length)) < length:
+                return next_seq, size
+            next_seq, size = seq + 1, size + RECORD_HEADER.size + length
+
+
+def read_journal(path: str) -> Iterator[JournalRecord]:
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return  # end of file (or a record cut by a crash, which we can't use anyway)
+            length, seq, timestamp = RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            message = json.loads(payload)
+            action = message.pop('action')
+            yield JournalRecord(seq=seq, timestamp=timestamp, action=action, message=message)
@@ -0,0 +1,116 @@
+"""
+Latency metrics of the trading sessions.
+
+Each session has its own set of histograms, one per stage an order goes through:
+
+    queue_wait  - from BaseTrader.send_to_trading_system to the session picking the message from its queue (broker)
+    handler     - the handle_<action> method of the session, matching and persistence included (engine)
+    matching    - clear_orders only
+    persistence - Mongo writes of transactions and broadcast messages
+    broadcast   - building and publishing the updates after an action
+    round_trip  - from sending the order to the trader receiving the result of it
+
+Messages are stamped with time.monotonic(), which is the same clock for all the processes of a host.
+
+Besides, each session counts what happens to the frames sent to the human traders' websockets (sent, conflated
+with a newer market data frame, dropped because the client was too far behind).
+All of it is rendered in the Prometheus text exposition format by render_prometheus (see GET /metrics).
+"""
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# seconds; from 100 microseconds to 10 seconds, which covers both the engine and a slow broker
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LATENCY_STAGES = ('queue_wait', 'handler', 'matching', 'persistence', 'broadcast', 'round_trip')
+LATENCY_METRIC_NAME = 'trading_session_latency_seconds'
+WEBSOCKET_FRAME_OUTCOMES = ('sent', 'conflated', 'dropped')
+WEBSOCKET_FRAMES_METRIC_NAME = 'trading_session_websocket_frames_total'
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for count in self.counts:
+            total += count
+            yield total
+
+
+class SessionMetrics:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.histograms = {stage: Histogram() for stage in LATENCY_STAGES}
+        self.websocket_frames = dict.fromkeys(WEBSOCKET_FRAME_OUTCOMES, 0)
+
+    def observe(self, stage: str, seconds: float):
+        if seconds >= 0:  # a negative value means the stamp came from another host's clock, it's of no use
+            self.histograms[stage].observe(seconds)
+
+    def observe_since(self, stage: str, stamp):
+        """Observes the time passed since a time.monotonic() stamp carried by a message (if there is one)."""
+        if stamp is not None:
+            self.observe(stage, time.monotonic() - stamp)
+
+    def count_websocket_frames(self, outcome: str, n=1):
+        self.websocket_frames[outcome] += n
+
+    @contextmanager
+    def time(self, stage: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - start)
+
+
+_session_metrics: Dict[str, SessionMetrics] = {}
+
+
+def get_session_metrics(session_id, create=True) -> Optional[SessionMetrics]:
+    """
+    The metrics of the session, created on the first call. With create=False it returns None for a session that has
+    none, so a message that comes late, after drop_session_metrics, doesn't bring the session back.
+    """
+    metrics = _session_metrics.get(session_id)
+    if metrics is None and create:
+        metrics = _session_metrics[session_id] = SessionMetrics(session_id)
+    return metrics
+
+
+def drop_session_metrics(session_id):
+    _session_metrics.pop(session_id, None)
+
+
+def format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def render_prometheus() -> str:
+    lines = [f'# HELP {LATENCY_METRIC_NAME} Latency of the stages an order goes through, per trading session.',
+             f'# TYPE {LATENCY_METRIC_NAME} histogram']
+    for session_id, metrics in list(_session_metrics.items()):
+        for stage, histogram in metrics.histograms.items():
+            labels = f'session_id="{session_id}",stage="{stage}"'
+            bounds = histogram.buckets + (float('inf'),)
+            for bound, count in zip(bounds, histogram.cumulative_counts()):
+                lines.append(f'{LATENCY_METRIC_NAME}_bucket{{{labels},le="{format_bound(bound)}"}} {count}')
+            lines.append(f'{LATENCY_METRIC_NAME}_sum{{{labels}}} {histogram.sum!r}')
+            lines.append(f'{LATENCY_METRIC_NAME}_count{{{labels}}} {histogram.count}')
+    lines += [f'# HELP {WEBSOCKET_FRAMES_METRIC_NAME} Frames to the human traders\' websockets by what happened to them.',
+              f'# TYPE {WEBSOCKET_FRAMES_METRIC_NAME} counter']
+    for session_id, metrics in list(_session_metrics.items()):
+        for outcome, count in metrics.websocket_frames.items():
+            lines.append(f'{WEBSOCKET_FRAMES_METRIC_NAME}{{session_id="{session_id}",outcome="{outcome}"}} {count}')
+    return '\n'.join(lines) + '\n'
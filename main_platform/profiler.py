@@ -0,0 +1,110 @@
+"""
+On-demand sampling profiler for a live trading session.
+
+A background thread wakes up every `interval` seconds and looks at the stack the event loop thread is executing at
+that moment (sys._current_frames). Only the part of the stack that runs on behalf of the profiled session is kept:
+frames of methods whose `self` is the session, one of its traders or its bot scheduler. Other sessions sharing the
+same loop are not counted. Each sample is annotated with the handle_* method or the trader's act() that was running.
+
+Nothing is hooked into the session itself, so there is no overhead when the profiler is off, and while it runs the
+cost is one stack walk per sample on a separate thread. The result is in the collapsed-stack format that
+flamegraph.pl and speedscope read:
+
+    [handle_add_order];trading_platform.py:handle_add_order;trading_platform.py:clear_orders 42
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from main_platform.custom_logger import setup_custom_logger
+
+logger = setup_custom_logger(__name__)
+
+MAX_PROFILE_SECONDS = 60
+DEFAULT_SAMPLING_INTERVAL = 0.005
+ANNOTATED_METHOD_PREFIX = 'handle_'
+ANNOTATED_METHODS = ('act',)
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+
+def get_frame_owner(frame):
+    """Returns `self` of a method frame, None for plain functions. f_locals is only touched for methods."""
+    code = frame.f_code
+    if code.co_argcount and code.co_varnames[0] == 'self':
+        return frame.f_locals.get('self')
+    return None
+
+
+def is_annotated(frame):
+    name = frame.f_code.co_name
+    return name.startswith(ANNOTATED_METHOD_PREFIX) or name in ANNOTATED_METHODS
+
+
+class SessionProfiler:
+    def __init__(self, owners, interval=DEFAULT_SAMPLING_INTERVAL):
+        """
+        owners - objects whose methods belong to the profiled session: the session, its traders, its scheduler
+        interval - seconds between two samples
+        """
+        self.owner_ids = {id(owner) for owner in owners}
+        self.interval = interval
+        self.samples = Counter()
+        self.total_samples = 0
+
+    def collapse_stack(self, frame):
+        """Turns the stack into one collapsed line, starting at the outermost frame that belongs to the session.
+        Returns None if the session isn't on the stack."""
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        frames.reverse()  # outermost first
+
+        start = None
+        annotation = None
+        for i, frame in enumerate(frames):
+            if id(get_frame_owner(frame)) in self.owner_ids:
+                if start is None:
+                    start = i
+                if is_annotated(frame):
+                    annotation = frame.f_code.co_name
+                    if frame.f_code.co_name in ANNOTATED_METHODS:
+                        annotation = f'{type(get_frame_owner(frame)).__name__}.{annotation}'
+        if start is None:
+            return None
+        labels = [frame_label(frame) for frame in frames[start:]]
+        return ';'.join([f'[{annotation or "other"}]'] + labels)
+
+    def take_sample(self, thread_id):
+        frame = sys._current_frames().get(thread_id)
+        self.total_samples += 1
+        if frame is None:
+            return
+        stack = self.collapse_stack(frame)
+        if stack:
+            self.samples[stack] += 1
+
+    def sample_thread(self, thread_id, seconds):
+        """Blocking sampling loop, it runs on a separate thread."""
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.take_sample(thread_id)
+            time.sleep(self.interval)
+
+    async def profile(self, seconds):
+        """Samples the thread of the running event loop for `seconds` and returns the collapsed stacks."""
+        seconds = min(seconds, MAX_PROFILE_SECONDS)
+        thread_id = threading.get_ident()
+        await asyncio.get_running_loop().run_in_executor(None, self.sample_thread, thread_id, seconds)
+        logger.info('Profiler took %s samples, %s in the session', self.total_samples, sum(self.samples.values()))
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return '\n'.join(f'{stack} {count}' for stack, count in self.samples.most_common())
@@ -0,0 +1,114 @@
+"""
+Deterministic replay of an action journal.
+
+The actions recorded by a live session (see journal.py) are fed, in their arrival order, through the same handlers
+of a TradingSession that runs without broker, without Mongo and without bots. Since new orders were given their ids
+and timestamps before they were journaled, the replay ends up with exactly the same book and the same trades.
+
+To replay a journal from the command line:
+
+    python -m main_platform.replay journals/<session_id>.journal
+"""
+import argparse
+import asyncio
+from collections import Counter
+from typing import List
+
+from main_platform.custom_logger import setup_custom_logger
+from main_platform.journal import read_journal, SESSION_RECORD_ACTION
+from main_platform.trading_platform import TradingSession
+from structures import TransactionModel, OrderStatus, ActionType
+
+logger = setup_custom_logger(__name__)
+
+
+class OfflineTradingSession(TradingSession):
+    """
+    TradingSession that only matches: nothing is published and the trades are kept in memory instead of Mongo.
+    Used for replays and for benchmarking the engine.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('journal_directory', None)
+        super().__init__(*args, **kwargs)
+        self.trades: List[TransactionModel] = []
+
+    def start(self):
+        self.start_time = self.start_time or self.creation_time
+        self.active = True
+
+    @property
+    def transactions(self):
+        return [transaction.to_mongo().to_dict() for transaction in self.trades]
+
+    def persist_transaction(self, transaction: TransactionModel):
+        self.trades.append(transaction)
+
+    async def save_transactions(self, transactions: List[TransactionModel]):
+        self.trades.extend(transactions)
+
+    async def save_order_events(self):
+        self._pending_order_events = []
+
+    async def send_broadcast(self, message: dict, incoming_message=None):
+        # nobody listens, but the queued updates have to go, otherwise they pile up
+        self._pending_trades = []
+        self._traders_with_order_updates = set()
+        self._pending_order_events = []
+        self.bars.pop_updates()
+
+    async def publish_market_data(self, topic: str, message: dict):
+        pass
+
+    async def send_message_to_trader(self, trader_id, message):
+        pass
+
+    async def send_fill_reports(self, fills):
+        pass
+
+    async def replay_action(self, action: str, message: dict):
+        """The trader actions go through their handlers, the platform's own ones are executed directly."""
+        if action == ActionType.SEED_BOOK.value:
+            await self.apply_seed_book(message)
+        elif action == ActionType.SETTLEMENT.value:
+            await self.execute_settlement(message)
+        else:
+            await self.process_action(action, message)
+
+
+async def replay_journal(path: str, session: OfflineTradingSession = None) -> OfflineTradingSession:
+    """Replays the journal at `path` and returns the session in the state the journaled one was in."""
+    for record in read_journal(path):
+        if record.action == SESSION_RECORD_ACTION:
+            if session is None:
+                session = OfflineTradingSession(duration=record.message['duration'],
+                                                default_price=record.message['default_price'],
+                                                default_spread=record.message['default_spread'],
+                                                punishing_constant=record.message['punishing_constant'])
+                session.id = record.message['id']
+            continue
+        if session is None:
+            raise ValueError(f'Journal {path} has no session record')
+        if not session.active:
+            session.start()
+        await session.replay_action(record.action, record.message)
+    return session
+
+
+def summarize(session: OfflineTradingSession) -> dict:
+    statuses = Counter(order['status'] for order in session.all_orders.values())
+    return {
+        'session_id': session.id,
+        'orders': len(session.all_orders),
+        'active_orders': statuses.get(OrderStatus.ACTIVE.value, 0),
+        'cancelled_orders': statuses.get(OrderStatus.CANCELLED.value, 0),
+        'trades': len(session.trades),
+        'order_book': session.order_book,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a trading session journal offline')
+    parser.add_argument('journal', help='path to the journal file')
+    args = parser.parse_args()
+    print(summarize(asyncio.run(replay_journal(args.journal))))
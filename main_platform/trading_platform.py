@@ -1,27 +1,40 @@
 import aio_pika
 import json
+import re
 import uuid
 from pydantic import ValidationError
 from pprint import pprint
-from main_platform.custom_logger import setup_custom_logger
+from main_platform.custom_logger import setup_custom_logger, set_log_session, close_session_log
 from typing import List, Dict
-from structures import OrderStatus, OrderType, TransactionModel, Order, TraderType, Message
+from structures import (OrderStatus, OrderType, TransactionModel, Order, TraderType, Message, MarketDataTopic,
+                        book_topic, NonResponderPolicy, ActionType, OrderEvent, OrderEventType)
 import asyncio
-import pandas as pd
+import functools
+import numpy as np
 import os
-from main_platform.utils import CustomEncoder, now, if_active
+from main_platform.utils import CustomEncoder, now, if_active, connect_to_mongo
+from main_platform.metrics import get_session_metrics
+from main_platform.bars import BarAggregator
+from main_platform.journal import ActionJournal, JOURNAL_DIRECTORY, get_journal_path
 from asyncio import Lock, Event
 from datetime import datetime, timedelta, timezone
 from collections import defaultdict
 
-# setting mongodb
-from mongoengine import connect
-
-connect('trader', host='localhost', port=27017)
-
 rabbitmq_url = os.getenv('RABBITMQ_URL', 'amqp://localhost')
 logger = setup_custom_logger(__name__)
 
+# the actions traders may send through the broker. The others (the seeded book, the settlement) are the platform's
+# own: they are executed directly, never dispatched from a message
+TRADER_ACTIONS = ('add_order', 'cancel_order', 'amend_order', 'register_me', 'inventory_report')
+
+# actions that change the state of the session: they go to the journal (if it is on)
+JOURNALED_ACTIONS = ('add_order', 'cancel_order', 'amend_order', 'register_me', 'inventory_report', 'seed_book',
+                     'settlement')
+
+# these are delivered to everyone: via the fanout exchange and via the 'control' topic
+CONTROL_MESSAGE_TYPES = ('stop_trading', 'closure')
+BOOK_TOPIC_PATTERN = re.compile(r'^book\.l(\d+)$')
+
 
 class TradingSession:
     duration: int
@@ -30,7 +43,9 @@ class TradingSession:
     transactions = List[TransactionModel]
     all_orders = Dict[uuid.UUID, Dict]
 
-    def __init__(self, duration, default_price=1000, default_spread=10, punishing_constant=1):
+    def __init__(self, duration, default_price=1000, default_spread=10, punishing_constant=1,
+                 inventory_report_timeout=10, non_responder_policy=NonResponderPolicy.IGNORE,
+                 journal_directory=JOURNAL_DIRECTORY):
         self.active = False
         self.duration = duration
         self.default_price = default_price
@@ -38,16 +53,39 @@ class TradingSession:
         self.default_spread = default_spread
         self.punishing_constant = punishing_constant
 
+        # end of the session: the deadline is a scheduled callback, inventory reports are futures
+        self.inventory_report_timeout = inventory_report_timeout
+        self.non_responder_policy = NonResponderPolicy(non_responder_policy)
+        self.non_responders = []
+        self._inventory_reports = {}
+        self._deadline_reached = asyncio.Event()
+        self._deadline_handle = None
+
         self._stop_requested = asyncio.Event()
 
         self.id = str(uuid.uuid4())
 
         self.creation_time = now()
+        self.start_time = None
         self.all_orders = {}
 
         self.broadcast_exchange_name = f'broadcast_{self.id}'
+        self.market_data_exchange_name = f'market_data_{self.id}'
         self.queue_name = f'trading_system_queue_{self.id}'
         self.trader_exchange = None
+        self.market_data_exchange = None
+
+        # Topic routing. Traders declare their subscriptions when they register; traders that declare none
+        # get the full fanout broadcast as before. We only build and publish the topics somebody listens to.
+        self.subscribed_topics = set()
+        self.subscribed_book_depths = set()
+        self.full_broadcast_subscribers = set()
+        self._pending_trades = []
+        self._traders_with_order_updates = set()
+        self._pending_order_events = []  # saved in bulk before each broadcast
+        self.bars = BarAggregator()  # OHLCV bars of the trades, their updates go out with the broadcasts
+        # in-process consumers of the updates (the spectator feed): called with the new trades after each action
+        self.market_data_listeners = []
 
         self.connected_traders = {}
         self.trader_responses = {}
@@ -56,6 +94,13 @@ class TradingSession:
         self.release_event = Event()
         self.current_price = 0  # handling non-defined attribute
 
+        # append-only journal of the inbound actions, opened in initialize if a directory is given
+        self.journal_directory = journal_directory
+        self.journal = None
+
+        # latency histograms served by GET /metrics
+        self.metrics = get_session_metrics(self.id)
+
     @property
     def current_time(self):
         return datetime.now(timezone.utc)
@@ -85,12 +130,66 @@ class TradingSession:
             "connected_traders": self.connected_traders,
         }
 
+    def get_checkpoint_state(self):
+        """Plain copy of the session state for checkpoints. Orders are copied one level deep, which is enough because
+        the session only ever replaces values inside order dicts."""
+        return {
+            'id': self.id,
+            'duration': self.duration,
+            'default_price': self.default_price,
+            'default_spread': self.default_spread,
+            'punishing_constant': self.punishing_constant,
+            'creation_time': self.creation_time,
+            'start_time': self.start_time,
+            'current_price': self.current_price,
+            'all_orders': {order_id: dict(order) for order_id, order in self.all_orders.items()},
+            'connected_traders': {trader_id: dict(info) for trader_id, info in self.connected_traders.items()},
+            'trader_responses': dict(self.trader_responses),
+        }
+
+    def restore_checkpoint_state(self, state: dict, new_session=False):
+        """
+        Restores the session from a checkpoint. With new_session=True the session keeps its own id and clock and
+        only takes the resting orders of the bots, so a new session can start from a pre-built book (the humans of
+        the new session are other people).
+        """
+        self.default_price = state['default_price']
+        self.default_spread = state['default_spread']
+        self.punishing_constant = state['punishing_constant']
+        self.current_price = state['current_price']
+        if new_session:
+            human_ids = {trader_id for trader_id, info in state['connected_traders'].items()
+                         if info.get('trader_type') == TraderType.HUMAN.value}
+            self.all_orders = {order_id: dict(order, session_id=self.id) for order_id, order in
+                               state['all_orders'].items()
+                               if order['status'] == OrderStatus.ACTIVE.value and order['trader_id'] not in human_ids}
+            return
+
+        self.id = state['id']
+        self.metrics = get_session_metrics(self.id)
+        self.broadcast_exchange_name = f'broadcast_{self.id}'
+        self.market_data_exchange_name = f'market_data_{self.id}'
+        self.queue_name = f'trading_system_queue_{self.id}'
+        self.duration = state['duration']
+        self.creation_time = state['creation_time']
+        self.start_time = state['start_time']
+        self.all_orders = state['all_orders']
+        self.connected_traders = state['connected_traders']
+        self.trader_responses = state['trader_responses']
+        for trader_id, info in self.connected_traders.items():
+            self.add_subscriptions(trader_id, info.get('subscriptions'))
+
     @property
     def active_orders(self):
         return {k: v for k, v in self.all_orders.items() if v['status'] == OrderStatus.ACTIVE}
 
     @property
     def order_book(self):
+        return self.get_order_book()
+
+    def get_order_book(self, depth: int = None):
+        """Aggregated order book. If depth is given, only the best `depth` price levels of each side are kept."""
+        import pandas as pd
         active_orders_df = pd.DataFrame(list(self.active_orders.values()))
         # Initialize empty order book
         order_book = {'bids': [], 'asks': []}
@@ -102,11 +201,15 @@ class TradingSession:
         if not active_bids.empty:
             bids_grouped = active_bids.groupby('price').amount.sum().reset_index().sort_values(by='price',
                                                                                                ascending=False)
+            if depth is not None:
+                bids_grouped = bids_grouped.head(depth)
             order_book['bids'] = bids_grouped.rename(columns={'price': 'x', 'amount': 'y'}).to_dict('records')
 
         # Aggregate and format asks if there are any
         if not active_asks.empty:
             asks_grouped = active_asks.groupby('price').amount.sum().reset_index().sort_values(by='price')
+            if depth is not None:
+                asks_grouped = asks_grouped.head(depth)
             order_book['asks'] = asks_grouped.rename(columns={'price': 'x', 'amount': 'y'}).to_dict('records')
 
         return order_book
@@ -122,13 +225,21 @@ class TradingSession:
         return transactions[-1]['price']
 
     async def initialize(self):
-        self.start_time = now()
+        set_log_session(self.id)  # the consumers and tasks created from here on log to the session's file
+        if self.start_time is None:  # a session restored from a checkpoint keeps its original clock
+            self.start_time = now()
         self.active = True
+        connect_to_mongo()
+        if self.journal_directory:
+            self.open_journal(get_journal_path(self.id, self.journal_directory))
         self.connection = await aio_pika.connect_robust(rabbitmq_url)
         self.channel = await self.connection.channel()
 
         await self.channel.declare_exchange(self.broadcast_exchange_name, aio_pika.ExchangeType.FANOUT,
                                             auto_delete=True)
+        self.market_data_exchange = await self.channel.declare_exchange(self.market_data_exchange_name,
+                                                                        aio_pika.ExchangeType.TOPIC,
+                                                                        auto_delete=True)
         self.trader_exchange = await self.channel.declare_exchange(self.queue_name, aio_pika.ExchangeType.DIRECT,
                                                                    auto_delete=True)
         trader_queue = await self.channel.declare_queue(self.queue_name, auto_delete=True)
@@ -146,6 +257,11 @@ class TradingSession:
         # Signal the run loop to stop
         self._stop_requested.set()
         self.active = False
+        if self._deadline_handle:
+            self._deadline_handle.cancel()
+        if self.journal:
+            self.journal.close()
+        close_session_log(self.id)
         try:
             # Unbind the queue from the exchange (optional, as auto_delete should handle this)
             trader_queue = await self.channel.get_queue(self.queue_name)
@@ -153,19 +269,23 @@ class TradingSession:
 
             # Close the channel and connection
             await self.channel.close()
-            logger.info(f"Trading System {self.id} channel closed")
+            logger.info("Trading System %s channel closed", self.id)
             await self.connection.close()
-            logger.info(f"Trading System {self.id} connection closed")
+            logger.info("Trading System %s connection closed", self.id)
             #     dump transactions and orders to files
             # await dump_transactions_to_csv(self.transactions, generate_file_name(self.id, "transactions"))
             # Dump all_orders to CSV
             # await dump_orders_to_csv(self.all_orders, generate_file_name(self.id, "all_orders"))
         except Exception as e:
-            logger.error(f"An error occurred during cleanup: {e}")
+            logger.error("An error occurred during cleanup: %s", e)
 
-    def get_active_orders_to_broadcast(self):
+    def get_active_orders_to_broadcast(self, trader_id=None):
         # TODO. PHILIPP. It's not optimal but we'll rewrite it anyway when we convert form in-memory to DB
-        active_orders_df = pd.DataFrame(list(self.active_orders.values()))
+        import pandas as pd
+        active_orders = self.active_orders.values()
+        if trader_id is not None:
+            active_orders = [order for order in active_orders if order['trader_id'] == trader_id]
+        active_orders_df = pd.DataFrame(list(active_orders))
         # lets keep only id, trader_id, order_type, amount, price
         if active_orders_df.empty:
             return []
@@ -178,6 +298,11 @@ class TradingSession:
         return res
 
     async def send_broadcast(self, message: dict, incoming_message=None):
+        await self.save_order_events()
+        with self.metrics.time('broadcast'):
+            await self.build_and_send_broadcast(message, incoming_message)
+
+    async def build_and_send_broadcast(self, message: dict, incoming_message=None):
         # TODO: PHILIPP: let's think how to make this more efficient but for simplicity
         # TODO we inject the current order book, active orders and transaction history into every broadcasted message
         # TODO: also important thing: we now send all active orders to everyone. We may think about possiblity to
@@ -185,6 +310,17 @@ class TradingSession:
         # let's set default type if type is emp[ty
         message['type'] = message.get('type', 'update')
 
+        bar_updates = []
+        fanout = True
+        if message['type'] in CONTROL_MESSAGE_TYPES:
+            await self.publish_market_data(MarketDataTopic.CONTROL.value, message)
+        else:
+            bar_updates = self.bars.pop_updates()
+            await self.publish_book_updates(bar_updates)
+            # nobody listens to the full snapshot, so we don't pay for building it; the message history still gets a
+            # compact one (the book and the bars, without the active orders and the trades read back from Mongo)
+            fanout = bool(self.full_broadcast_subscribers)
+
         if message.get('type') == 'closure':
             pass  # TODO. PHILIPP. Should we inject some info here?
         else:
@@ -192,18 +328,25 @@ class TradingSession:
             message.update({
                 # TODO: PHILIPP: we need to think about the type of the message. it's hardcoded for now
                 'order_book': self.order_book,
-                'active_orders': self.get_active_orders_to_broadcast(),
-                'history': self.transactions,
                 'spread': spread,
                 'midpoint': midpoint,
-                'transaction_price': self.transaction_price,
+                'bars': bar_updates,
                 'incoming_message': incoming_message
             })
+            if fanout:
+                message.update({
+                    'active_orders': self.get_active_orders_to_broadcast(),
+                    'history': self.transactions,
+                    'transaction_price': self.transaction_price,
+                })
             message_document = Message(
                 trading_session_id=self.id,  # Assuming self.id is the UUID of the TradingSession
                 content=message
             )
-            message_document.save()
+            with self.metrics.time('persistence'):
+                message_document.save()
+        if not fanout:
+            return
 
         exchange = await self.channel.get_exchange(self.broadcast_exchange_name)
         await exchange.publish(
@@ -211,6 +354,51 @@ class TradingSession:
             routing_key=''  # routing_key is typically ignored in FANOUT exchanges
         )
 
+    async def publish_market_data(self, topic: str, message: dict):
+        """Publishes a message to the market data topic exchange if anybody subscribed to the topic."""
+        if topic not in self.subscribed_topics or self.market_data_exchange is None:
+            return
+        await self.market_data_exchange.publish(
+            aio_pika.Message(body=json.dumps(message, cls=CustomEncoder).encode()),
+            routing_key=topic
+        )
+
+    async def publish_book_updates(self, bar_updates=()):
+        """
+        Publishes everything that changed since the last update to the topic exchange:
+        the book for each depth somebody subscribed to, the new trades, the bars they changed and the own orders of
+        the traders whose orders were touched.
+        """
+        if self.subscribed_book_depths:
+            spread, midpoint = self.get_spread()
+            # we build the deepest book once and cut it for the shallower subscribers
+            full_book = self.get_order_book(max(self.subscribed_book_depths))
+            for depth in self.subscribed_book_depths:
+                await self.publish_market_data(book_topic(depth), {
+                    'type': 'book',
+                    'depth': depth,
+                    'order_book': {'bids': full_book['bids'][:depth], 'asks': full_book['asks'][:depth]},
+                    'spread': spread,
+                    'midpoint': midpoint,
+                })
+
+        trades, self._pending_trades = self._pending_trades, []
+        for listener in self.market_data_listeners:
+            listener(trades)
+        if trades:
+            await self.publish_market_data(MarketDataTopic.TRADES.value, {'type': 'trades', 'trades': trades})
+        if bar_updates:
+            await self.publish_market_data(MarketDataTopic.BARS.value, {'type': 'bars', 'bars': bar_updates})
+
+        traders_to_update, self._traders_with_order_updates = self._traders_with_order_updates, set()
+        for trader_id in traders_to_update:
+            topic = MarketDataTopic.PRIVATE_ORDERS.value.format(trader_id=trader_id)
+            if topic in self.subscribed_topics:
+                await self.publish_market_data(topic, {
+                    'type': 'private_orders',
+                    'trader_orders': self.get_active_orders_to_broadcast(trader_id=trader_id),
+                })
+
     async def send_message_to_trader(self, trader_id, message):
 
         # TODO. PHILIPP. IT largely overlap with broadcast. We need to refactor that moving to _injection method
@@ -260,8 +448,34 @@ class TradingSession:
             'status': OrderStatus.ACTIVE.value,
         })
         self.all_orders[order_id] = order_dict
+        self._traders_with_order_updates.add(order_dict.get('trader_id'))
+        self.record_order_event(OrderEventType.PLACED, order_dict)
         return order_dict
 
+    def record_order_event(self, event: OrderEventType, order: Dict):
+        self._pending_order_events.append({
+            'trading_session_id': self.id,
+            'order_id': order['id'],
+            'trader_id': order.get('trader_id'),
+            'event': event.value,
+            'order_type': int(order['order_type']),
+            'price': order.get('price'),
+            'amount': order.get('amount'),
+            'timestamp': datetime.now(),  # naive local time, like the other documents of the session
+        })
+
+    async def save_order_events(self):
+        """Saves the order events recorded since the last call with one bulk insert, in the default executor."""
+        events, self._pending_order_events = self._pending_order_events, []
+        if not events:
+            return
+
+        def insert():
+            OrderEvent.objects.insert([OrderEvent(**event) for event in events], load_bulk=False)
+
+        with self.metrics.time('persistence'):
+            await asyncio.get_running_loop().run_in_executor(None, insert)
+
     def get_spread(self):
         """
         Returns the spread and the midpoint. If there are no overlapping orders, returns None, None.
@@ -285,10 +499,16 @@ class TradingSession:
             logger.info("No overlapping orders.")
             return None, None
 
+    def persist_transaction(self, transaction: TransactionModel):
+        with self.metrics.time('persistence'):
+            transaction.save()
+
     def create_transaction(self, bid, ask, transaction_price):
         # Change the status to 'EXECUTED'
         self.all_orders[ask['id']]['status'] = OrderStatus.EXECUTED.value
         self.all_orders[bid['id']]['status'] = OrderStatus.EXECUTED.value
+        self.record_order_event(OrderEventType.EXECUTED, ask)
+        self.record_order_event(OrderEventType.EXECUTED, bid)
 
         # Create a transaction object with automatic id and timestamp generation
         transaction = TransactionModel(
@@ -297,12 +517,15 @@ class TradingSession:
             ask_order_id=ask['id'],
             price=transaction_price
         )
-        transaction.save()
+        self.persist_transaction(transaction)
 
-        # Append to self.transactions
+        self._pending_trades.append({'id': transaction.id, 'price': transaction_price,
+                                     'timestamp': transaction.timestamp})
+        self.bars.add_trade(transaction_price, min(bid['amount'], ask['amount']), transaction.timestamp)
+        self._traders_with_order_updates.update((ask['trader_id'], bid['trader_id']))
 
         # Log the transaction creation
-        logger.info(f"Transaction created: {transaction}")
+        logger.info("Transaction created: %s", transaction)
 
         # Return trader IDs involved in the transaction for further processing
         return ask['trader_id'], bid['trader_id'], transaction
@@ -334,8 +557,8 @@ class TradingSession:
 
         # Check if any transactions are possible
         if spread > 0:
-            logger.info(
-                f"No overlapping orders. Spread is positive: {spread}. Lowest ask: {lowest_ask}, highest bid: {highest_bid}")
+            logger.info("No overlapping orders. Spread is positive: %s. Lowest ask: %s, highest bid: %s",
+                        spread, lowest_ask, highest_bid)
             return res
 
         # Filter the bids and asks that could be involved in a transaction
@@ -355,7 +578,7 @@ class TradingSession:
             ask_trader_id = ask.get('trader_id')
             bid_trader_id = bid.get('trader_id')
             if ask_trader_type == TraderType.HUMAN.value and ask_trader_id == bid_trader_id:
-                logger.warning(f'Blocking self-execution for trader {ask_trader_id}')
+                logger.warning('Blocking self-execution for trader %s', ask_trader_id)
                 return res
             ask_trader_id, bid_trader_id, transaction = self.create_transaction(bid, ask, transaction_price)
 
@@ -403,185 +626,430 @@ class TradingSession:
 
         except ValidationError as e:
             # Handle validation errors, e.g., log them or send a message back to the trader
-            logger.critical(f"Order validation failed: {e}")
+            logger.warning("Order validation failed: %s", e)
         # lets clear them now
-        resp = await self.clear_orders()
+        with self.metrics.time('matching'):
+            resp = await self.clear_orders()
         subgroup_data = resp.pop('subgroup_broadcast', None)
         if subgroup_data:
             await self.send_message_to_subgroup(subgroup_data)
         return dict(respond=True, **resp)
 
+    async def seed_book(self, orders: List[Dict]):
+        """
+        Puts a whole initial book into the session at once (see get_book_seed_orders) and sends one snapshot,
+        instead of the warm up orders going one by one through the broker, the matching and a broadcast each.
+        The orders get their ids and timestamp here and are journaled as one seed_book action.
+        """
+        message = {'timestamp': now().isoformat(),
+                   'orders': [dict(order, id=str(uuid.uuid4())) for order in orders]}
+        self.record_action(ActionType.SEED_BOOK.value, message)
+        await self.apply_seed_book(message)
+        logger.info("TS %s seeded the book with %s orders", self.id, len(orders))
+        await self.send_broadcast(message=dict(text="book is seeded"))
+
+    @if_active
+    async def apply_seed_book(self, data: dict):
+        """Places a recorded seed_book (live or in a replay). Not a handle_ method: traders can't send it."""
+        timestamp = datetime.fromisoformat(data['timestamp'])
+        for order in data['orders']:
+            self.place_order({
+                'id': uuid.UUID(order['id']),
+                'status': OrderStatus.BUFFERED.value,
+                'amount': float(order['amount']),
+                'price': order['price'],
+                'order_type': OrderType(order['order_type']),
+                'timestamp': timestamp,
+                'session_id': self.id,
+                'trader_id': order['trader_id'],
+            })
+        # a seeded book doesn't cross, but the orders that were already there might
+        with self.metrics.time('matching'):
+            resp = await self.clear_orders()
+        subgroup_data = resp.pop('subgroup_broadcast', None)
+        if subgroup_data:
+            await self.send_message_to_subgroup(subgroup_data)
+
     async def send_message_to_subgroup(self, message):
         for trader_id, transaction_list in message.items():
             await self.send_message_to_trader(trader_id, {'type': 'update', 'new_transactions': transaction_list})
 
-    @if_active
-    async def handle_cancel_order(self, data: dict):
-        order_id = data.get('order_id')
-        trader_id = data.get('trader_id')
-
-        # Ensure order_id is a valid UUID
+    def get_own_active_order(self, order_id, trader_id):
+        """
+        The active order `order_id` of the trader, for the cancel and amend handlers: (order, None), or
+        (None, failure response) if the id is malformed, the order isn't there, isn't theirs or isn't active.
+        One lookup in all_orders, the active_orders property builds a whole dict on each access.
+        """
         try:
-            order_id = uuid.UUID(order_id)
+            order_id = uuid.UUID(str(order_id))
         except ValueError:
-            logger.warning(f"Invalid order ID format: {order_id}.")
-            return {"status": "failed", "reason": "Invalid order ID format"}
+            logger.warning("Invalid order ID format: %s.", order_id)
+            return None, {"status": "failed", "reason": "Invalid order ID format"}
 
-        async with self.lock:
-            # Check if the order exists and belongs to the trader
-            if order_id not in self.active_orders:
-                return {"status": "failed", "reason": "Order not found"}
+        existing_order = self.all_orders.get(order_id)
+        if existing_order is None:
+            return None, {"status": "failed", "reason": "Order not found"}
+
+        if existing_order['trader_id'] != trader_id:
+            logger.warning("Trader %s does not own order %s.", trader_id, order_id)
+            return None, {"status": "failed", "reason": "Trader does not own the order"}
+
+        if existing_order['status'] != OrderStatus.ACTIVE.value:
+            logger.warning("Order %s is not active and cannot be changed.", order_id)
+            return None, {"status": "failed", "reason": "Order is not active"}
 
-            existing_order = self.active_orders[order_id]
+        return existing_order, None
 
-            if existing_order['trader_id'] != trader_id:
-                logger.warning(f"Trader {trader_id} does not own order {order_id}.")
-                return {"status": "failed", "reason": "Trader does not own the order"}
+    @if_active
+    async def handle_cancel_order(self, data: dict):
+        trader_id = data.get('trader_id')
 
-            if existing_order['status'] != OrderStatus.ACTIVE.value:
-                logger.warning(f"Order {order_id} is not active and cannot be canceled.")
-                return {"status": "failed", "reason": "Order is not active"}
+        async with self.lock:
+            existing_order, failure = self.get_own_active_order(data.get('order_id'), trader_id)
+            if failure:
+                return failure
+            order_id = existing_order['id']
 
             # Cancel the order
-            self.all_orders[order_id]['status'] = OrderStatus.CANCELLED.value
-            self.all_orders[order_id]['cancellation_timestamp'] = now()
+            existing_order['status'] = OrderStatus.CANCELLED.value
+            existing_order['cancellation_timestamp'] = now()
+            self._traders_with_order_updates.add(trader_id)
+            self.record_order_event(OrderEventType.CANCELLED, existing_order)
 
             return {"status": "cancel success", "order": order_id, "respond": True}
 
+    @if_active
+    async def handle_amend_order(self, data: dict):
+        """
+        Cancel-replace in one action: changes the price and/or the amount of a resting order, runs the matching
+        once and the trader gets one response and the others one broadcast (instead of a cancel_order and an
+        add_order with their own broadcast each). The order keeps its id.
+        A smaller amount at the same price keeps the place in the queue; any other change is like a new order and
+        goes to the back of the queue of its price (the timestamp of the amend, set when the action is recorded).
+        """
+        trader_id = data.get('trader_id')
+        price, amount = data.get('price'), data.get('amount')
+        if price is None and amount is None:
+            return {"status": "failed", "reason": "Nothing to amend", "respond": True, "individual": True}
+        try:
+            price = None if price is None else float(price)
+            amount = None if amount is None else float(amount)
+        except (TypeError, ValueError):
+            return {"status": "failed", "reason": "Invalid price or amount", "respond": True, "individual": True}
+        if amount is not None and amount <= 0:
+            return {"status": "failed", "reason": "Amount should be positive, cancel the order instead",
+                    "respond": True, "individual": True}
+
+        async with self.lock:
+            existing_order, failure = self.get_own_active_order(data.get('order_id'), trader_id)
+            if failure:
+                # the trader is told, but nothing changed for the others
+                return dict(failure, respond=True, individual=True)
+            order_id = existing_order['id']
+
+            new_price = existing_order['price'] if price is None else price
+            new_amount = existing_order['amount'] if amount is None else amount
+            keeps_priority = new_price == existing_order['price'] and new_amount <= existing_order['amount']
+            existing_order['price'] = new_price
+            existing_order['amount'] = new_amount
+            if not keeps_priority:
+                existing_order['timestamp'] = datetime.fromisoformat(data['timestamp']) if 'timestamp' in data \
+                    else now()
+            self._traders_with_order_updates.add(trader_id)
+            self.record_order_event(OrderEventType.AMENDED, existing_order)
+
+        with self.metrics.time('matching'):
+            resp = await self.clear_orders()
+        subgroup_data = resp.pop('subgroup_broadcast', None)
+        if subgroup_data:
+            await self.send_message_to_subgroup(subgroup_data)
+        return dict(respond=True, status="amend success", order=order_id, kept_priority=keeps_priority, **resp)
+
     @if_active
     async def handle_register_me(self, msg_body):
         trader_id = msg_body.get('trader_id')
         trader_type = msg_body.get('trader_type')
-        self.connected_traders[trader_id] = {'trader_type': trader_type, }
+        subscriptions = msg_body.get('subscriptions')
+        self.connected_traders[trader_id] = {'trader_type': trader_type, 'subscriptions': subscriptions}
         self.trader_responses[trader_id] = False
+        self._inventory_reports[trader_id] = asyncio.get_running_loop().create_future()
+        self.add_subscriptions(trader_id, subscriptions)
 
-        logger.info(f"Trader type  {trader_type} id {trader_id} connected.")
-        logger.info(f"Total connected traders: {len(self.connected_traders)}")
+        logger.info("Trader type  %s id %s connected.", trader_type, trader_id)
+        logger.info("Total connected traders: %s", len(self.connected_traders))
         return dict(respond=True, trader_id=trader_id, message="Registered successfully", individual=True)
 
+    def add_subscriptions(self, trader_id, subscriptions):
+        """Remembers which topics are listened to. No subscriptions means the trader wants the full broadcast."""
+        if subscriptions is None:
+            self.full_broadcast_subscribers.add(trader_id)
+            return
+        for topic in subscriptions:
+            self.subscribed_topics.add(topic)
+            depth_match = BOOK_TOPIC_PATTERN.match(topic)
+            if depth_match:
+                self.subscribed_book_depths.add(int(depth_match.group(1)))
+
+    def open_journal(self, path):
+        self.journal = ActionJournal(path)
+        if self.journal.resumed:
+            return  # a restored session goes on with its journal, which already starts with the session record
+        self.journal.write_session_header({
+            'id': self.id,
+            'duration': self.duration,
+            'default_price': self.default_price,
+            'default_spread': self.default_spread,
+            'punishing_constant': self.punishing_constant,
+        })
+
+    def record_action(self, action, incoming_message):
+        """
+        Writes the action to the journal. New orders get their id and timestamp here, before they are recorded,
+        so that a replay creates exactly the same orders (and the cancellations that refer to them still match).
+        """
+        # always set by the platform: the timestamp is the place in the queue and the id must not collide with
+        # another order, the trader can't pick them
+        if action == ActionType.POST_NEW_ORDER.value:
+            incoming_message['id'] = str(uuid.uuid4())
+            incoming_message['timestamp'] = now().isoformat()
+        elif action == ActionType.AMEND_ORDER.value:
+            incoming_message['timestamp'] = now().isoformat()
+        if self.journal and action in JOURNALED_ACTIONS:
+            self.journal.append(action, incoming_message)
+
     async def on_individual_message(self, message):
+        set_log_session(self.id)
         incoming_message = json.loads(message.body.decode())
-        logger.info(f"TS {self.id} received message: {incoming_message}")
+        logger.info("TS %s received message: %s", self.id, incoming_message)
         action = incoming_message.pop('action', None)
-        trader_id = incoming_message.get('trader_id', None)  # Assuming the trader_id is part of the message
         if incoming_message is None:
-            logger.critical(f"Invalid message format: {message}")
+            logger.error("Invalid message format: %s", message)
+        if action not in TRADER_ACTIONS:
+            logger.warning("TS %s rejected action %s from trader %s", self.id, action,
+                           incoming_message.get('trader_id'))
+            return
+        # the send stamp is transport metadata: it is measured here and echoed back, but not journaled
+        sent_at = incoming_message.pop('sent_at', None)
+        self.metrics.observe_since('queue_wait', sent_at)
+        if action:
+            self.record_action(action, incoming_message)
+        await self.process_action(action, incoming_message, sent_at=sent_at)
 
+    async def process_action(self, action, incoming_message, sent_at=None):
+        """
+        Dispatches an incoming action to its handle_<action> method and sends the responses. `sent_at` is the
+        monotonic stamp the trader put on the message; the responses carry it back as request_sent_at, so the trader
+        can measure the round trip.
+        """
+        trader_id = incoming_message.get('trader_id', None)  # Assuming the trader_id is part of the message
         if action:
             handler_method = getattr(self, f"handle_{action}", None)
             if handler_method:
 
-                result = await handler_method(incoming_message)
+                with self.metrics.time('handler'):
+                    result = await handler_method(incoming_message)
                 if result and result.pop('respond', None) and trader_id:
+                    if sent_at is not None:
+                        result['request_sent_at'] = sent_at
                     await self.send_message_to_trader(trader_id, result)
                     #         TODO.PHILIPP. IMPORTANT! let's at this stage also send a broadcast message to all traders with updated info.
                     # IT IS FAR from optimal but for now we keep it simple. We'll refactor it later.
                     if not result.get('individual', False):
+                        if sent_at is not None:
+                            incoming_message = dict(incoming_message, request_sent_at=sent_at)
                         await self.send_broadcast(message=dict(text="book is updated"), incoming_message=incoming_message)
 
 
 
             else:
-                logger.warning(f"No handler method found for action: {action}")
+                logger.warning("No handler method found for action: %s", action)
         else:
-            logger.warning(f"No action found in message: {incoming_message}")
+            logger.warning("No action found in message: %s", incoming_message)
 
-    async def close_existing_book(self):
-        """we create a counteroffer on behalf of the platform with a get_closure_price price. and then we
-        create a transaction out of it."""
-        for order_id, order in self.active_orders.items():
-            platform_order_type = OrderType.ASK.value if order[
-                                                             'order_type'] == OrderType.BID else OrderType.BID
-            closure_price = self.get_closure_price(order['amount'], order['order_type'])
-            platform_order = Order(trader_id=self.id,
-                                   order_type=platform_order_type,
-                                   amount=order['amount'],
-                                   price=closure_price,
-                                   status=OrderStatus.BUFFERED.value,
-                                   session_id=self.id,
-                                   )
-
-            self.place_order(platform_order.model_dump())
-            if order['order_type'] == OrderType.BID:
-                self.create_transaction(order, platform_order.model_dump(), closure_price)
+    def make_closure_order(self, trader_id, order_type: OrderType, amount: float, price: float, timestamp):
+        """Plain order dict for the end-of-session settlement. We build these ones without pydantic because the
+        values are produced by the platform itself, and there can be a lot of them."""
+        return {
+            'id': uuid.uuid4(),
+            'status': OrderStatus.BUFFERED.value,
+            'amount': amount,
+            'price': price,
+            'order_type': order_type,
+            'timestamp': timestamp,
+            'session_id': self.id,
+            'trader_id': trader_id,
+        }
+
+    async def save_transactions(self, transactions: List[TransactionModel]):
+        """Saves the transactions with one bulk insert, in the default executor so Mongo doesn't block the loop."""
+        if not transactions:
+            return
+        with self.metrics.time('persistence'):
+            await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(TransactionModel.objects.insert, transactions, load_bulk=False))
+
+    async def send_fill_reports(self, fills: Dict[str, List[Dict]]):
+        """Sends each trader only their own fills, without the market snapshot send_message_to_trader injects."""
+        for trader_id, trader_fills in fills.items():
+            await self.trader_exchange.publish(
+                aio_pika.Message(body=json.dumps({'type': 'update', 'new_transactions': trader_fills},
+                                                 cls=CustomEncoder).encode()),
+                routing_key=f'trader_{trader_id}'
+            )
+
+    async def settle_at_closure_price(self, trader_ids, order_types, amounts, resting_orders=None):
+        """
+        Bulk settlement at the end of the session: for every entry the platform takes the other side of the trader
+        at get_closure_price. `order_types` are the sides of the traders. If `resting_orders` are given, these
+        existing orders get executed, otherwise the orders on behalf of the traders are created here (that's what we
+        need for the inventory reports).
+        The closure prices are computed in one vectorized pass and, with the ids of the new orders, recorded as one
+        settlement action, so a replay settles exactly the same way (see handle_settlement).
+        """
+        if not len(trader_ids):
+            return []
+        order_types = np.asarray(order_types, dtype=int)
+        amounts = np.asarray(amounts, dtype=float)
+        closure_prices = self.get_closure_price(amounts, order_types)
+
+        message = {'timestamp': now().isoformat(), 'entries': [{
+            'trader_id': trader_id,
+            'order_type': int(order_types[i]),
+            'amount': float(amounts[i]),
+            'price': float(closure_prices[i]),
+            'order_id': str(resting_orders[i]['id'] if resting_orders is not None else uuid.uuid4()),
+            'resting': resting_orders is not None,
+            'platform_order_id': str(uuid.uuid4()),
+        } for i, trader_id in enumerate(trader_ids)]}
+        self.record_action(ActionType.SETTLEMENT.value, message)
+        return await self.execute_settlement(message)
+
+    async def execute_settlement(self, data: dict):
+        """
+        Executes a recorded settlement (see settle_at_closure_price) and returns its transactions. All of them are
+        saved with one bulk write and each trader gets one fill report. It's also what a replay calls for a journaled
+        settlement; there is no handle_settlement, so it can't be triggered by a message.
+        """
+        timestamp = datetime.fromisoformat(data['timestamp'])
+        resting = {str(order_id): order for order_id, order in self.all_orders.items()} \
+            if any(entry['resting'] for entry in data['entries']) else {}
+        transactions = []
+        fills = defaultdict(list)
+        for entry in data['entries']:
+            trader_id, amount, price = entry['trader_id'], entry['amount'], entry['price']
+            order_type = OrderType(entry['order_type'])
+            if entry['resting']:
+                trader_order = resting[entry['order_id']]
             else:
-                self.create_transaction(platform_order.model_dump(), order, closure_price)
+                trader_order = self.place_order(dict(self.make_closure_order(trader_id, order_type, amount, price,
+                                                                             timestamp),
+                                                     id=uuid.UUID(entry['order_id'])))
+            platform_order = self.place_order(dict(self.make_closure_order(self.id, OrderType(-order_type), amount,
+                                                                           price, timestamp),
+                                                   id=uuid.UUID(entry['platform_order_id'])))
+            bid, ask = (trader_order, platform_order) if order_type == OrderType.BID else (platform_order, trader_order)
+            self.all_orders[bid['id']]['status'] = OrderStatus.EXECUTED.value
+            self.all_orders[ask['id']]['status'] = OrderStatus.EXECUTED.value
+            self.record_order_event(OrderEventType.EXECUTED, bid)
+            self.record_order_event(OrderEventType.EXECUTED, ask)
+
+            transaction = TransactionModel(trading_session_id=self.id, bid_order_id=bid['id'],
+                                           ask_order_id=ask['id'], price=price)
+            transactions.append(transaction)
+            self._pending_trades.append({'id': transaction.id, 'price': price, 'timestamp': transaction.timestamp})
+            self.bars.add_trade(price, amount, transaction.timestamp)
+            self._traders_with_order_updates.add(trader_id)
+            fills[trader_id].append({'id': trader_order['id'], 'price': price,
+                                     'type': order_type.name.lower(), 'amount': amount})
+
+        await self.save_transactions(transactions)
+        await self.save_order_events()
+        logger.info("Settled %s positions at closure price", len(transactions))
+        await self.send_fill_reports(fills)
+        return transactions
+
+    async def close_existing_book(self):
+        """we create a counteroffer on behalf of the platform with a get_closure_price price for every active order
+        and then we create a transaction out of it. All of them are settled in one go."""
+        resting_orders = list(self.active_orders.values())
+        await self.settle_at_closure_price([order['trader_id'] for order in resting_orders],
+                                           [order['order_type'] for order in resting_orders],
+                                           [order['amount'] for order in resting_orders],
+                                           resting_orders=resting_orders)
 
         await self.send_broadcast(message=dict(text="book is updated"))
 
     async def handle_inventory_report(self, data: dict):
-        # Handle received inventory report from a trader
+        """
+        Handle received inventory report from a trader. Here we only resolve the trader's report; the positions of
+        all traders are settled together in settle_inventories once the reports are collected.
+        """
         trader_id = data.get('trader_id')
         self.trader_responses[trader_id] = True
+        report = self._inventory_reports.get(trader_id)
+        if report is not None and not report.done():
+            report.set_result(data)
         trader_type = self.connected_traders[trader_id]['trader_type']
-        logger.info(f'Trader ({trader_type}):  {trader_id} has reported back their inventory: {data}')
-        shares = data.get('shares', 0)
-        # if shares is positive than we need to sell them. to do this we first handle_add_order
-        # on behalf of this trader at the closure_price and then put the opposite order to buy
-        # the same amount of shares at the same price. We need to do this for each trader who has positive shares
-        if shares != 0:
-
-            trader_order_type = OrderType.ASK if shares > 0 else OrderType.BID
-            platform_order_type = OrderType.BID if shares > 0 else OrderType.ASK
-            shares = abs(shares)
-            closure_price = self.get_closure_price(shares, trader_order_type)
-
-            proto_order = dict(amount=shares,
-                               price=closure_price,
-                               status=OrderStatus.BUFFERED.value,
-                               session_id=self.id,
-
-                               )
-            trader_order = Order(trader_id=trader_id,
-                                 order_type=trader_order_type,
-                                 **proto_order
-                                 )
-            platform_order = Order(trader_id=self.id,
-                                   order_type=platform_order_type,
-                                   **proto_order
-                                   )
-            self.place_order(platform_order.model_dump())
-            self.place_order(trader_order.model_dump())
-            # let's create a transaction. it should be a bit different depending on type
-            if trader_order_type == OrderType.BID:
-                self.create_transaction(trader_order.model_dump(), platform_order.model_dump(), closure_price)
-            else:
-                self.create_transaction(platform_order.model_dump(), trader_order.model_dump(), closure_price)
+        logger.info('Trader (%s):  %s has reported back their inventory: %s', trader_type, trader_id, data)
 
-            traders_to_transactions_lookup = defaultdict(list)
-            trader_order = trader_order.model_dump()
-            traders_to_transactions_lookup[trader_id].append(
-                {'id': trader_order['id'], 'price': trader_order['price'],
-                 'type': trader_order['order_type'],
-                 'amount': trader_order['amount']})
-
-            await self.send_message_to_subgroup(traders_to_transactions_lookup)
-
-        # mid_price + x * spread * const)
+    async def settle_inventories(self, reports: List[Dict]):
+        """
+        if shares are positive we need to sell them, so on behalf of the trader we put an ask at the closure price
+        and the platform buys the same amount at the same price (and the other way round for negative shares).
+        """
+        reports = [report for report in reports if report.get('shares', 0) != 0]
+        shares = np.array([report['shares'] for report in reports], dtype=float)
+        trader_order_types = np.where(shares > 0, OrderType.ASK.value, OrderType.BID.value)
+        return await self.settle_at_closure_price([report['trader_id'] for report in reports],
+                                                  trader_order_types, np.abs(shares))
 
     async def wait_for_traders(self):
-        while not all(self.trader_responses.values()):
-            await asyncio.sleep(1)  # Check every second
-        logger.info('All traders have reported back their inventories.')
+        """
+        Waits until the inventory reports of all the connected traders resolve. With the IGNORE policy we give up
+        after inventory_report_timeout seconds and keep the list of traders who didn't report in self.non_responders.
+        """
+        pending = [report for report in self._inventory_reports.values() if not report.done()]
+        timeout = None if self.non_responder_policy == NonResponderPolicy.WAIT else self.inventory_report_timeout
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+        self.non_responders = [trader_id for trader_id, report in self._inventory_reports.items() if not report.done()]
+        if self.non_responders:
+            logger.warning('Traders did not report their inventories in time: %s', self.non_responders)
+        else:
+            logger.info('All traders have reported back their inventories.')
+
+    def schedule_deadline(self):
+        """Schedules the end of the session on the event loop instead of checking the clock every second."""
+        end_time = self.start_time + timedelta(minutes=self.duration)
+        delay = max((end_time - now()).total_seconds(), 0)
+        self._deadline_handle = asyncio.get_running_loop().call_later(delay, self._deadline_reached.set)
+
+    async def wait_for_deadline(self):
+        """Returns True if the session reached its end, False if it was stopped before that."""
+        deadline = asyncio.ensure_future(self._deadline_reached.wait())
+        stop = asyncio.ensure_future(self._stop_requested.wait())
+        try:
+            await asyncio.wait({deadline, stop}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            deadline.cancel()
+            stop.cancel()
+        return self._deadline_reached.is_set() and not self._stop_requested.is_set()
 
     async def run(self):
+        set_log_session(self.id)
         try:
-            while not self._stop_requested.is_set():
-                current_time = now()
-                if current_time - self.start_time > timedelta(
-                        minutes=self.duration
-                ):
-                    logger.critical('Time limit reached, stopping...')
-                    self.active = False  # here we stop accepting all incoming requests on placing new orders, cancelling etc.
-                    await self.close_existing_book()
-                    await self.send_broadcast({"type": "stop_trading"})
-                    # Wait for each of the traders to report back their inventories
-                    await self.wait_for_traders()
-                    await self.send_broadcast({"type": "closure"})
-
-                    break
-                await asyncio.sleep(1)
-            logger.critical('Exited the run loop.')
+            self.schedule_deadline()
+            if await self.wait_for_deadline():
+                logger.info('Time limit reached, stopping...')
+                self.active = False  # here we stop accepting all incoming requests on placing new orders, cancelling etc.
+                await self.close_existing_book()
+                await self.send_broadcast({"type": "stop_trading"})
+                # Wait for each of the traders to report back their inventories
+                await self.wait_for_traders()
+                await self.settle_inventories([report.result() for report in self._inventory_reports.values()
+                                               if report.done()])
+                await self.send_broadcast({"type": "closure", "non_responders": self.non_responders})
+            logger.info('Exited the run loop.')
         except asyncio.CancelledError:
             logger.info('Run method cancelled, performing cleanup of trading session...')
 
@@ -589,7 +1057,7 @@ class TradingSession:
 
         except Exception as e:
             # Handle the exception here
-            logger.error(f"Exception in trading session run: {e}")
+            logger.error("Exception in trading session run: %s", e)
             # Optionally re-raise the exception if you want it to be propagated
             raise
         finally:
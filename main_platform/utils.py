@@ -8,7 +8,6 @@ from uuid import UUID
 from structures.structures import   ActionType, LobsterEventType, OrderType, Order, str_to_order_type
 from collections import defaultdict
 from typing import List, Dict
-import pandas as pd
 import numpy as np
 from bson import ObjectId
 from main_platform.custom_logger import setup_custom_logger
@@ -26,19 +25,20 @@ from datetime import timezone, datetime
 
 import asyncio
 import functools
+import sys
 
 def if_active(func):
     @functools.wraps(func)
     def sync_wrapper(self, *args, **kwargs):
         if not self.active:
-            logger.critical(f"{func.__name__} is skipped because the trading session is not active.")
+            logger.info("%s is skipped because the trading session is not active.", func.__name__)
             return None  # or alternatively, raise an exception
 
         return func(self, *args, **kwargs)
 
     async def async_wrapper(self, *args, **kwargs):
         if not self.active:
-            logger.critical(f"{func.__name__} is skipped because the trading session is not active.")
+            logger.info("%s is skipped because the trading session is not active.", func.__name__)
             return None  # or alternatively, raise an exception
 
         return await func(self, *args, **kwargs)
@@ -80,6 +80,14 @@ class CustomEncoder(JSONEncoder):
             return [doc.to_mongo().to_dict() for doc in obj]
         return JSONEncoder.default(self, obj)
 
+@functools.lru_cache(maxsize=None)
+def connect_to_mongo():
+    """The default mongoengine connection. It's made on first use (a session starting, a results lookup) and not
+    when the platform is imported, so imports stay free of side effects."""
+    from mongoengine import connect
+    return connect('trader', host='localhost', port=27017)
+
+
 def ack_message(func):
     @wraps(func)
     async def wrapper(self, message: aio_pika.IncomingMessage):
@@ -103,6 +111,7 @@ def expand_dataframe(df, max_depth=10, step=1, reverse=False, default_price=0):
     Returns:
         DataFrame: Expanded DataFrame.
     """
+    import pandas as pd
 
     # Check if DataFrame is empty
     if df.empty:
@@ -154,6 +163,7 @@ def expand_dataframe(df, max_depth=10, step=1, reverse=False, default_price=0):
 
 def convert_to_book_format(active_orders, levels_n=10, default_price=2000):
     """ That's the OLD function for Lobster format. I keep it here for now but that all should be deeply rewritten"""
+    import pandas as pd
     # Create a DataFrame from the list of active orders
 
     if active_orders:
@@ -189,6 +199,30 @@ def convert_to_book_format(active_orders, levels_n=10, default_price=2000):
     return interleaved_array
 
 
+def convert_order_book_to_book_format(order_book, levels_n=10, default_price=2000):
+    """
+    Same interleaved array as convert_to_book_format, but built from the aggregated order book that the trading
+    session publishes on the book topics: {'bids': [{'x': price, 'y': amount}, ...], 'asks': [...]}.
+    """
+    import pandas as pd
+    order_book = order_book or {}
+    levels = {}
+    for side in ('asks', 'bids'):
+        levels[side] = pd.DataFrame(
+            [{'price': int(round(level['x'])), 'amount': int(level['y'])} for level in
+             order_book.get(side, [])[:levels_n]],
+            columns=['price', 'amount'])
+
+    df_asks = expand_dataframe(levels['asks'], max_depth=levels_n, step=1, reverse=False,
+                               default_price=default_price)
+    df_bids = expand_dataframe(levels['bids'], max_depth=levels_n, step=1, reverse=True,
+                               default_price=default_price - 1)
+
+    interleaved_array = np.ravel(np.column_stack((df_asks['price'].tolist(), df_asks['amount'].tolist(),
+                                                  df_bids['price'].tolist(), df_bids['amount'].tolist())))
+    return interleaved_array.astype(np.float64)
+
+
 
 def convert_to_noise_state(active_orders: List[Dict]) -> Dict:
     noise_state = {
@@ -246,3 +280,25 @@ def generate_file_name(session_uuid, file_type, extension='csv'):
     file_name = f"{file_type}_{session_uuid}_{date_str}.{extension}"
     # Return the filename prefixed with the "data/" directory
     return f"{DATA_PATH}/{file_name}"
+
+
+def deep_getsizeof(obj, seen=None) -> int:
+    """Approximate memory footprint of a container with everything it holds (dicts, lists, sets, tuples).
+    Shared objects are counted once. Other objects are not followed, so don't pass traders or sessions directly."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_getsizeof(k, seen) + deep_getsizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_getsizeof(item, seen) for item in obj)
+    return size
+
+
+def splice_json_objects(*encoded_objects: str) -> str:
+    """Merges JSON objects that are already encoded (and have no keys in common) without decoding them again:
+    '{"a":1}' and '{"b":2}' give '{"a":1,"b":2}'."""
+    members = [encoded[1:-1] for encoded in encoded_objects]
+    return '{' + ','.join(member for member in members if member.strip()) + '}'
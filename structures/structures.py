@@ -1,6 +1,7 @@
 from enum import Enum, IntEnum, StrEnum
 from pydantic import BaseModel, Field, ConfigDict
-from mongoengine import Document, IntField, BooleanField, DateTimeField, ListField, DictField, UUIDField, FloatField
+from mongoengine import (Document, IntField, BooleanField, DateTimeField, ListField, DictField, UUIDField, FloatField,
+                         StringField)
 
 from typing import Optional
 from uuid import UUID, uuid4
@@ -21,6 +22,12 @@ class TradeDirection(str, Enum):
     SELL = 'sell'
 
 
+class NonResponderPolicy(str, Enum):
+    """What the trading session does with traders who don't report their inventory at the end of the session."""
+    IGNORE = 'ignore'  # close the session after the timeout without their reports
+    WAIT = 'wait'  # wait for all the reports no matter how long it takes
+
+
 class TraderCreationData(BaseModel):
     num_human_traders: int = Field(
         default=1,
@@ -74,7 +81,26 @@ class TraderCreationData(BaseModel):
     noise_warm_ups: int = Field(
         default=10,
         title="Noise Warm Ups",
-        description="Number of warm up periods for noise traders",
+        description="Number of warm up periods for noise traders (only used if the book is not seeded)",
+        gt=0
+    )
+    seed_book_levels: int = Field(
+        default=10,
+        title="Seed Book: Levels",
+        description="Levels on each side of the initial book, placed at once for the noise traders "
+                    "(0 means the noise traders warm the book up order by order instead)",
+        ge=0
+    )
+    seed_orders_per_level: int = Field(
+        default=1,
+        title="Seed Book: Orders per Level",
+        description="Number of orders at each level of the initial book",
+        gt=0
+    )
+    seed_max_order_amount: int = Field(
+        default=1,
+        title="Seed Book: Max Order Amount",
+        description="Orders of the initial book have amounts uniform between 1 and this",
         gt=0
     )
     initial_cash: float = Field(
@@ -95,6 +121,23 @@ class TraderCreationData(BaseModel):
         description="Depth of the book shown to the human traders",
 
     )
+    inventory_report_timeout: float = Field(
+        default=10,
+        title="Inventory Report Timeout",
+        description="Seconds to wait for the traders to report their inventories when the session ends",
+        gt=0
+    )
+    checkpoint_interval: float = Field(
+        default=0,
+        title="Checkpoint Interval",
+        description="Seconds between automatic checkpoints of the session state (0 disables them)",
+        ge=0
+    )
+    non_responder_policy: NonResponderPolicy = Field(
+        default=NonResponderPolicy.IGNORE,
+        title="Non Responder Policy",
+        description="Whether to close the session after the timeout ('ignore') or to wait for all reports ('wait')",
+    )
 
 
 class LobsterEventType(IntEnum):
@@ -113,8 +156,11 @@ class LobsterEventType(IntEnum):
 class ActionType(str, Enum):
     POST_NEW_ORDER = 'add_order'
     CANCEL_ORDER = 'cancel_order'
+    AMEND_ORDER = 'amend_order'
     UPDATE_BOOK_STATUS = 'update_book_status'
     REGISTER = 'register_me'
+    SEED_BOOK = 'seed_book'
+    SETTLEMENT = 'settlement'
 
 
 class OrderType(IntEnum):
@@ -128,6 +174,23 @@ str_to_order_type = {
 }
 
 
+class MarketDataTopic(str, Enum):
+    """Routing keys of the session's market data (topic) exchange.
+    Book topics carry the depth in the key (book.l1, book.l10, ...), see book_topic below.
+    PRIVATE_ORDERS is a template: it is formatted with the trader id on subscription.
+    """
+    BOOK_L1 = 'book.l1'
+    TRADES = 'trades'
+    BARS = 'bars'
+    CONTROL = 'control'
+    PRIVATE_ORDERS = 'orders.private.{trader_id}'
+
+
+def book_topic(depth: int) -> str:
+    """Routing key for the order book aggregated up to `depth` price levels."""
+    return f'book.l{depth}'
+
+
 class OrderStatus(str, Enum):
     BUFFERED = 'buffered'
     ACTIVE = 'active'
@@ -135,6 +198,13 @@ class OrderStatus(str, Enum):
     CANCELLED = 'cancelled'
 
 
+class OrderEventType(str, Enum):
+    PLACED = 'placed'
+    CANCELLED = 'cancelled'
+    AMENDED = 'amended'
+    EXECUTED = 'executed'
+
+
 class TraderType(str, Enum):
     NOISE = 'NOISE'
     MARKET_MAKER = 'MARKET_MAKER'
@@ -165,8 +235,40 @@ class TransactionModel(Document):
     timestamp = DateTimeField(default=datetime.now)
     price = FloatField(required=True)
 
+    # the history of a session is read by session and time (and by id within the same timestamp, for the cursors)
+    meta = {'indexes': [('trading_session_id', 'timestamp', 'id')]}
+
 
 class Message(Document):
     trading_session_id = UUIDField(required=True, binary=False)  # Assuming you want the UUID as a string
     content = DictField(required=True)  # Store the entire message as a dictionary
     timestamp = DateTimeField(default=datetime.now)  # Automatically set the timestamp when created
+
+    meta = {'indexes': [('trading_session_id', 'timestamp', 'id')]}
+
+
+class OrderEvent(Document):
+    """A change of an order (placed, amended, cancelled, executed). The session saves them in bulk, see
+    TradingSession.save_order_events."""
+    trading_session_id = UUIDField(required=True, binary=False)
+    order_id = UUIDField(required=True, binary=False)
+    trader_id = StringField()
+    event = StringField(required=True, choices=[event.value for event in OrderEventType])
+    order_type = IntField()
+    price = FloatField()
+    amount = FloatField()
+    timestamp = DateTimeField(default=datetime.now)
+
+    meta = {'indexes': [('trading_session_id', 'timestamp', 'id')]}
+
+
+class SessionResult(Document):
+    """What is left of a trading session once it is evicted from memory: its parameters and the traders' results."""
+    trading_session_id = UUIDField(primary_key=True, binary=False)
+    params = DictField()
+    start_time = DateTimeField()
+    end_time = DateTimeField()
+    status = StringField()
+    non_responders = ListField(StringField())
+    n_transactions = IntField(default=0)
+    traders = ListField(DictField())  # id, type, cash, shares, delta cash and PnL of each trader
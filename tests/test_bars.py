@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from main_platform import TradingSession
+from main_platform.bars import BarAggregator
+from structures import OrderType
+
+
+def at(second):
+    return datetime.fromtimestamp(1_700_000_000 + second, tz=timezone.utc)
+
+
+def test_bars_are_updated_trade_by_trade():
+    aggregator = BarAggregator(intervals=(1, 5))
+    for second, price, amount in ((0.1, 100, 1), (0.5, 103, 2), (0.9, 99, 1), (3.2, 101, 4)):
+        aggregator.add_trade(price, amount, at(second))
+
+    one_second = aggregator.get_bars(1)
+    assert [(b["open"], b["high"], b["low"], b["close"], b["volume"]) for b in one_second] == \
+           [(100, 103, 99, 99, 4), (101, 101, 101, 101, 4)]
+    five_seconds, = aggregator.get_bars(5)
+    assert five_seconds["start"] == 1_700_000_000
+    assert five_seconds["vwap"] == pytest.approx((100 + 206 + 99 + 404) / 8)
+    assert aggregator.get_bars(1, since=1_700_000_001) == one_second[1:]
+
+
+def test_updates_hold_only_the_changed_bars():
+    aggregator = BarAggregator(intervals=(1, 5))
+    aggregator.add_trade(100, 1, at(0.1))
+    aggregator.pop_updates()
+    aggregator.add_trade(102, 1, at(1.5))
+    updates = aggregator.pop_updates()
+    assert [(bar["interval"], bar["close"], bar["volume"]) for bar in updates] == [(1, 102, 1), (5, 102, 2)]
+    assert aggregator.pop_updates() == []
+
+
+@pytest.mark.asyncio
+async def test_bar_updates_are_published_after_a_trade():
+    session = TradingSession(duration=1)
+    session.active = True
+    session.connected_traders = {"buyer": {"trader_type": "NOISE"}, "seller": {"trader_type": "NOISE"}}
+    session.persist_transaction = lambda transaction: None
+    session.send_message_to_subgroup = AsyncMock()
+    session.save_order_events = AsyncMock()
+    session.market_data_exchange = AsyncMock()
+    session.add_subscriptions("chart", ["bars"])
+
+    await session.handle_add_order({"trader_id": "buyer", "order_type": OrderType.BID, "price": 1000, "amount": 2})
+    await session.handle_add_order({"trader_id": "seller", "order_type": OrderType.ASK, "price": 1000, "amount": 2})
+    with patch("main_platform.trading_platform.Message"):
+        await session.send_broadcast({})
+
+    published = [call for call in session.market_data_exchange.publish.await_args_list
+                 if call.kwargs["routing_key"] == "bars"]
+    assert len(published) == 1
+    assert b'"volume": 2' in published[0].args[0].body
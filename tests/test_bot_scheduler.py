@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from main_platform.bot_scheduler import BotScheduler
+
+
+class FakeBot:
+    def __init__(self, trader_id, delays):
+        self.id = trader_id
+        self.delays = list(delays)
+        self.order_book = None
+        self.seen_books = []
+        self._stop_requested = asyncio.Event()
+
+    def get_next_activation_delay(self):
+        return self.delays.pop(0) if self.delays else None
+
+    async def act(self):
+        self.seen_books.append(self.order_book)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_activates_bots_and_stops_when_done():
+    session = MagicMock()
+    session.get_order_book.return_value = {"bids": [], "asks": []}
+    fast = FakeBot("fast", [0, 0.01, 0.01])
+    slow = FakeBot("slow", [0.02])
+    scheduler = BotScheduler(session, [fast, slow], batch_window=0)
+    await asyncio.wait_for(scheduler.run(), timeout=1)
+    assert len(fast.seen_books) == 3
+    assert len(slow.seen_books) == 1
+
+
+@pytest.mark.asyncio
+async def test_due_bots_share_one_snapshot():
+    session = MagicMock()
+    session.get_order_book.return_value = {"bids": [{"x": 1000, "y": 1}], "asks": []}
+    bots = [FakeBot(str(i), [0]) for i in range(5)]
+    scheduler = BotScheduler(session, bots, batch_window=0.05)
+    await asyncio.wait_for(scheduler.run(), timeout=1)
+    assert scheduler.ticks == 1
+    session.get_order_book.assert_called_once_with(10)
+    assert all(bot.seen_books[0] is bots[0].seen_books[0] for bot in bots)
+
+
+@pytest.mark.asyncio
+async def test_stopped_bots_are_not_activated():
+    session = MagicMock()
+    session.get_order_book.return_value = {"bids": [], "asks": []}
+    bot = FakeBot("bot", [0, 0, 0])
+    bot._stop_requested.set()
+    scheduler = BotScheduler(session, [bot])
+    await asyncio.wait_for(scheduler.run(), timeout=1)
+    assert bot.seen_books == []
+
+
+@pytest.mark.asyncio
+async def test_activation_out_of_schedule_gives_the_book_but_does_not_reschedule():
+    session = MagicMock()
+    session.get_order_book.return_value = {"bids": [], "asks": [{"x": 1001, "y": 1}]}
+    bot = FakeBot("bot", [0])
+    scheduler = BotScheduler(session, [bot])
+    await scheduler.tick([bot], reschedule=False)
+    assert bot.seen_books == [session.get_order_book.return_value]
+    assert scheduler._heap == [] and bot.delays == [0]
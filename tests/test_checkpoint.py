@@ -0,0 +1,136 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from datetime import timedelta
+from client_connector.trader_manager import TraderManager
+from main_platform.checkpoint import write_checkpoint, read_checkpoint
+from main_platform.utils import now
+from structures import TraderCreationData, OrderStatus, OrderType
+
+
+def make_manager():
+    manager = TraderManager(TraderCreationData(num_human_traders=1, num_noise_traders=2, num_informed_traders=1))
+    manager.trading_session.place_order({
+        "id": "resting_bid",
+        "trader_id": manager.noise_traders[0].id,
+        "order_type": OrderType.BID.value,
+        "price": 1999,
+        "amount": 1,
+    })
+    manager.trading_session.connected_traders[manager.noise_traders[0].id] = {
+        "trader_type": "NOISE", "subscriptions": ["book.l10"]}
+    manager.human_traders[0].cash = 123
+    manager.human_traders[0].update_data_for_pnl(1, 2000)
+    return manager
+
+
+def test_checkpoint_file_round_trip(tmp_path):
+    path = str(tmp_path / "session.ckpt")
+    state = make_manager().get_checkpoint_state()
+    write_checkpoint(state, path)
+    assert read_checkpoint(path) == state
+
+
+@pytest.mark.asyncio
+async def test_restore_trader_manager(tmp_path):
+    manager = make_manager()
+    path = await manager.checkpoint(str(tmp_path / "session.ckpt"))
+
+    restored = await TraderManager.from_checkpoint(path)
+    assert restored.restored
+    assert restored.trading_session.id == manager.trading_session.id
+    assert restored.trading_session.all_orders == manager.trading_session.all_orders
+    assert restored.trading_session.subscribed_book_depths == {10}
+    assert set(restored.traders) == set(manager.traders)
+    human = restored.human_traders[0]
+    assert human.id == manager.human_traders[0].id
+    assert human.cash == 123
+    assert human.goal == manager.human_traders[0].goal
+    assert human.transaction_prices == [2000]
+    assert restored.resume_elapsed_time is None  # the checkpointed session was never opened
+
+
+@pytest.mark.asyncio
+async def test_resumed_bots_keep_the_clock_of_the_session(tmp_path):
+    manager = make_manager()
+    manager.trading_session.start_time = now() - timedelta(seconds=30)
+    informed = manager.informed_traders[0]
+    informed.schedule_cursor = 2
+    path = await manager.checkpoint(str(tmp_path / "session.ckpt"))
+
+    restored = await TraderManager.from_checkpoint(path)
+    restored.start_clocks()
+
+    restored_informed = restored.informed_traders[0]
+    assert restored_informed.schedule_cursor == 2
+    # the informed trader goes on with its plan 30 seconds in, not from 0
+    assert 30 <= restored_informed.get_elapsed_time() < 35
+    assert 30 <= (now() - restored.trading_session.start_time).total_seconds() < 35
+
+
+@pytest.mark.asyncio
+async def test_restore_as_new_session_keeps_only_the_book(tmp_path):
+    manager = make_manager()
+    manager.trading_session.all_orders["resting_bid"]["status"] = OrderStatus.ACTIVE.value
+    path = await manager.checkpoint(str(tmp_path / "session.ckpt"))
+
+    restored = await TraderManager.from_checkpoint(path, new_session=True)
+    session = restored.trading_session
+    assert session.id != manager.trading_session.id
+    assert session.start_time is None
+    assert session.all_orders["resting_bid"]["session_id"] == session.id
+    assert session.connected_traders == {}
+    # only the book carries over: the bots own their orders but start with fresh ledgers, the humans are new
+    assert restored.noise_traders[0].id == manager.noise_traders[0].id
+    assert restored.human_traders[0].id != manager.human_traders[0].id
+    assert restored.human_traders[0].cash != 123 and restored.human_traders[0].transaction_prices == []
+    assert restored.resume_elapsed_time is None
+
+
+@pytest.mark.asyncio
+async def test_restore_endpoint_refuses_before_loading_when_full(tmp_path, monkeypatch):
+    from fastapi import BackgroundTasks, HTTPException
+    from client_connector import main
+    from client_connector.session_registry import SessionRegistry
+    from main_platform import metrics
+
+    manager = make_manager()
+    session_id = manager.trading_session.id
+    monkeypatch.setattr(main, "get_checkpoint_path", lambda _: str(tmp_path / "session.ckpt"))
+    await manager.checkpoint(str(tmp_path / "session.ckpt"))
+    metrics.drop_session_metrics(session_id)
+    registry = SessionRegistry(max_live_sessions=1)
+    monkeypatch.setattr(main, "session_registry", registry)
+    running = MagicMock()
+    running.trading_session.id = "running"
+    running.traders = {}
+    registry.register(running)
+    from_checkpoint = AsyncMock()
+    monkeypatch.setattr(main.TraderManager, "from_checkpoint", from_checkpoint)
+
+    with pytest.raises(HTTPException) as e:
+        await main.restore_trading_session(session_id, BackgroundTasks())
+    assert e.value.status_code == 503
+    from_checkpoint.assert_not_awaited()
+    assert session_id not in metrics._session_metrics
+
+
+@pytest.mark.asyncio
+async def test_restore_endpoint_replaces_a_finished_session_in_its_grace_period(tmp_path, monkeypatch):
+    from fastapi import BackgroundTasks
+    from client_connector import main
+    from client_connector.session_registry import SessionRegistry
+
+    manager = make_manager()
+    session_id = manager.trading_session.id
+    monkeypatch.setattr(main, "get_checkpoint_path", lambda _: str(tmp_path / "session.ckpt"))
+    await manager.checkpoint(str(tmp_path / "session.ckpt"))
+    registry = SessionRegistry(max_live_sessions=1)
+    monkeypatch.setattr(main, "session_registry", registry)
+    manager.cleanup = AsyncMock()
+    registry.register(manager)
+    registry.finished_sessions.add(session_id)
+
+    response = await main.restore_trading_session(session_id, BackgroundTasks())
+    assert response["data"]["trading_session_uuid"] == session_id
+    manager.cleanup.assert_awaited_once()
+    assert registry.get(session_id) is not manager and session_id in registry.live_sessions
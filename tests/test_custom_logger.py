@@ -0,0 +1,33 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+from main_platform.custom_logger import SessionJsonLinesHandler, SessionContextFilter, set_log_session
+
+
+def test_session_records_go_to_their_own_json_lines_file(tmp_path):
+    handler = SessionJsonLinesHandler(str(tmp_path))
+    session_filter = SessionContextFilter()
+    for session_id in ("s1", None):
+        set_log_session(session_id)
+        record = logging.LogRecord("main_platform.trading_platform", logging.INFO, __file__, 1,
+                                   "Order %s placed", ("abc",), None)
+        session_filter.filter(record)
+        handler.handle(record)
+    handler.close()
+
+    lines = (tmp_path / "sessions" / "s1.jsonl").read_text().splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["message"] == "Order abc placed"
+    assert [p.name for p in (tmp_path / "sessions").iterdir()] == ["s1.jsonl"]
+
+
+def test_import_starts_no_thread_and_writes_nothing(tmp_path):
+    code = ("import threading, main_platform.trading_platform, client_connector.trader_manager; "
+            "print(threading.active_count())")
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    output = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, capture_output=True, text=True,
+                            check=True).stdout
+    assert output.strip() == "1"
+    assert not (tmp_path / "logs").exists()
@@ -0,0 +1,65 @@
+import numpy as np
+from unittest.mock import MagicMock
+from client_connector.feature_feed import FeatureFeed
+from external_traders.feature_engine import FeatureEngine
+from external_traders.noise_trader import settings, get_book_message_init, get_features_update, transform_book, \
+    get_book_features
+from main_platform import TradingSession
+from main_platform.metrics import drop_session_metrics
+from structures import OrderType
+
+
+def random_books(n, seed=0):
+    rng = np.random.default_rng(seed)
+    books = []
+    for _ in range(n):
+        book, _ = get_book_message_init(2000 + rng.integers(-3, 4), 1, settings)
+        book[settings['ind_bid_size']] = rng.integers(1, 5, settings['levels_n'])
+        book[settings['ind_ask_size']] = rng.integers(1, 5, settings['levels_n'])
+        books.append(book)
+    return books
+
+
+def test_engine_matches_the_stack_pipeline_and_keeps_the_last_books():
+    books = random_books(30)
+    engine = FeatureEngine(settings)
+    features_state = None
+    for previous, book in zip(books, books[1:]):
+        if engine.count == 0:
+            engine.update(previous)
+        assert engine.update(book)
+        book_stack = np.array([previous, book])
+        features_state = get_features_update(features_state, book_stack, None, settings)
+        assert np.array_equal(get_book_features(book, previous, settings['levels_n'])[:settings['levels_n']],
+                              transform_book(book_stack, settings)[-1])
+
+    assert np.allclose(engine.features_state, features_state)
+    assert len(engine.features_state) == len(engine.cols_features) == 4 * 22
+    assert np.array_equal(engine.get_book(), books[-1]) and np.array_equal(engine.get_book(1), books[-2])
+    # the same book again is not an update
+    assert not engine.update(books[-1].copy())
+
+
+def test_feed_updates_the_features_once_per_book_change_for_model_traders():
+    session = TradingSession(duration=1)
+    model_trader = MagicMock(id="model")
+    feed = FeatureFeed(session, [model_trader], settings).start()
+    for i in range(3):
+        session.place_order({"id": f"bid_{i}", "trader_id": "noise", "order_type": OrderType.BID.value,
+                             "price": 1999 - i, "amount": 1, "timestamp": i})
+        session.place_order({"id": f"ask_{i}", "trader_id": "noise", "order_type": OrderType.ASK.value,
+                             "price": 2000 + i, "amount": 1, "timestamp": i})
+
+    feed.on_market_data([])
+    feed.on_market_data([])  # nothing changed
+    model_trader.on_features.assert_not_called()
+    session.place_order({"id": "bid_3", "trader_id": "noise", "order_type": OrderType.BID.value,
+                         "price": 1999, "amount": 2, "timestamp": 3})
+    feed.on_market_data([])
+    model_trader.on_features.assert_called_once()
+    # the traders share the engine's state, nothing is copied per trader
+    assert np.shares_memory(model_trader.on_features.call_args.args[0], feed.engine.ewma)
+
+    feed.stop()
+    assert feed.on_market_data not in session.market_data_listeners
+    drop_session_metrics(session.id)
@@ -0,0 +1,59 @@
+import uuid
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from unittest.mock import AsyncMock
+
+from main_platform import TradingSession
+from main_platform.history import (build_history_query, encode_cursor, decode_cursor, get_projection,
+                                   InvalidHistoryQuery)
+from structures import Message, TransactionModel, OrderType
+
+
+def test_cursor_round_trip_keeps_id_type():
+    timestamp = datetime(2024, 4, 1, 12, 30, 0, 123000)
+    trade_id = uuid.uuid4()
+    assert decode_cursor(encode_cursor(timestamp, trade_id), TransactionModel) == (timestamp, str(trade_id))
+    message_id = ObjectId()
+    assert decode_cursor(encode_cursor(timestamp, message_id), Message) == (timestamp, message_id)
+    with pytest.raises(InvalidHistoryQuery):
+        decode_cursor("not a cursor", Message)
+
+
+def test_query_continues_after_cursor_within_time_range():
+    start, end, last = datetime(2024, 4, 1), datetime(2024, 4, 2), datetime(2024, 4, 1, 6)
+    query = build_history_query("s1", cursor=(last, "t9"), start=start, end=end)
+    assert query == {"$and": [
+        {"trading_session_id": "s1"},
+        {"timestamp": {"$gte": start, "$lt": end}},
+        {"$or": [{"timestamp": {"$gt": last}}, {"timestamp": last, "_id": {"$gt": "t9"}}]},
+    ]}
+    assert build_history_query("s1") == {"trading_session_id": "s1"}
+
+
+def test_projection_always_has_cursor_fields():
+    assert get_projection(TransactionModel, ["price"]) == ["id", "price", "timestamp"]
+    assert get_projection(TransactionModel, None) is None
+    with pytest.raises(InvalidHistoryQuery):
+        get_projection(TransactionModel, ["price", "password"])
+
+
+@pytest.mark.asyncio
+async def test_order_events_are_saved_in_bulk_before_broadcast():
+    session = TradingSession(duration=1)
+    session.active = True
+    session.connected_traders = {"buyer": {"trader_type": "NOISE"}, "seller": {"trader_type": "NOISE"}}
+    session.persist_transaction = lambda transaction: None
+    session.build_and_send_broadcast = AsyncMock()
+    session.send_message_to_subgroup = AsyncMock()
+    saved = []
+    session.save_order_events = AsyncMock(side_effect=lambda: saved.extend(session._pending_order_events))
+
+    await session.handle_add_order({"trader_id": "buyer", "order_type": OrderType.BID, "price": 1000, "amount": 1})
+    await session.handle_add_order({"trader_id": "seller", "order_type": OrderType.ASK, "price": 1000, "amount": 1})
+    await session.send_broadcast({})
+
+    assert [(event["trader_id"], event["event"]) for event in saved] == [
+        ("buyer", "placed"), ("seller", "placed"), ("seller", "executed"), ("buyer", "executed")]
+    session.save_order_events.assert_awaited_once()
@@ -0,0 +1,55 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from starlette.websockets import WebSocketState
+from traders import HumanTrader
+from traders import human_trader
+from traders.websocket_sender import WebSocketSender
+
+
+def connected_human(depth_book_shown=None):
+    trader = HumanTrader(cash=1000, shares=10, depth_book_shown=depth_book_shown)
+    trader.websocket = MagicMock()
+    trader.websocket.client_state = WebSocketState.CONNECTED
+    trader.websocket.send_text = AsyncMock()
+    trader.socket_status = True
+    trader.sender = WebSocketSender(trader.websocket).start()
+    return trader
+
+
+def broadcast(body):
+    message = MagicMock()
+    message.body = json.dumps(body).encode()
+    return message
+
+
+@pytest.mark.asyncio
+async def test_broadcast_market_data_is_encoded_once_for_all_humans():
+    traders = [connected_human(depth_book_shown=1) for _ in range(3)]
+    body = {'type': 'update', 'order_book': {'bids': [{'x': 999, 'y': 1}, {'x': 998, 'y': 2}], 'asks': []},
+            'active_orders': [], 'history': [], 'midpoint': None}
+
+    with patch.object(human_trader, 'encode_market_data', wraps=human_trader.encode_market_data) as encode:
+        for trader in traders:
+            await trader.on_message_from_system(broadcast(body))
+    assert encode.call_count == 1
+    await asyncio.sleep(0)  # let the senders write
+
+    for trader in traders:
+        sent = json.loads(trader.websocket.send_text.await_args.args[0])
+        assert sent['type'] == 'update'
+        assert sent['shares'] == 10 and sent['cash'] == 1000
+        assert sent['order_book'] == {'bids': [{'x': 999, 'y': 1}], 'asks': []}
+        assert sent['active_orders'] == []
+
+
+@pytest.mark.asyncio
+async def test_message_without_book_gets_the_latest_known_book():
+    trader = connected_human()
+    trader.order_book = {'bids': [{'x': 999, 'y': 1}], 'asks': []}
+    await trader.send_message_to_client('update', new_transactions=[])
+    await asyncio.sleep(0)
+    sent = json.loads(trader.websocket.send_text.await_args.args[0])
+    assert sent['order_book'] == trader.order_book
+    assert sent['new_transactions'] == []
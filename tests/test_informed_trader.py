@@ -2,6 +2,8 @@ import pytest
 from unittest.mock import MagicMock, patch, AsyncMock
 from traders import InformedTrader
 from structures import TraderType, OrderType
+from external_traders.informed_naive import (ExecutionSchedule, update_settings_informed, get_signal_informed,
+                                             get_order_to_match)
 
 @pytest.fixture
 def informed_trader_settings():
@@ -36,4 +38,25 @@ def test_initialization(informed_trader):
 async def test_act_generates_orders(informed_trader):
     informed_trader.post_new_order = AsyncMock()
     await informed_trader.act()
-    informed_trader.post_new_order.assert_awaited_with(1, 100, OrderType.ASK)
\ No newline at end of file
+    informed_trader.post_new_order.assert_awaited_with(1, 100, OrderType.ASK)
+
+def test_schedule_fires_each_slice_once_even_when_woken_late():
+    schedule = ExecutionSchedule([2.5, 0.5, 1.5], shares=[1, 2, 3])
+    assert schedule.next_time() == 0.5
+    assert schedule.pop_due(0.4999999) == 2  # a hair early still counts
+    assert schedule.pop_due(0.9) == 0
+    assert schedule.pop_due(2.7) == 3 + 1  # a late wakeup gets everything that was due
+    assert schedule.next_time() is None
+
+
+def test_plan_groups_close_trades_into_slices_and_signal_takes_them():
+    settings_informed, plan, state = update_settings_informed(
+        {"time_period_in_min": 1, "trade_intensity": 2, "direction": "sell", "min_slice_interval": 1})
+    assert plan["shares"].sum() == state["inv"] == 120
+    assert min(plan["period"]) >= 1
+
+    schedule = ExecutionSchedule(plan["period"], plan["shares"])
+    action, shares = get_signal_informed(state, settings_informed, schedule, plan["period"][1])
+    assert action == 1 and shares == plan["shares"][0] + plan["shares"][1]
+    get_order_to_match([2001, 1, 2000, 1], [action, shares], state, settings_informed, {}, 0)
+    assert state["inv"] == 120 - shares
@@ -0,0 +1,185 @@
+import json
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from main_platform import TradingSession
+from main_platform.journal import ActionJournal, read_journal
+from main_platform.replay import replay_journal
+from external_traders.noise_trader import get_book_seed_orders
+
+
+def test_journal_round_trip(tmp_path):
+    path = str(tmp_path / "session.journal")
+    journal = ActionJournal(path)
+    journal.append("register_me", {"trader_id": "a"}, timestamp=1.5)
+    journal.append("add_order", {"trader_id": "a", "price": 1000.0})
+    journal.close()
+    records = list(read_journal(path))
+    assert [(r.seq, r.action) for r in records] == [(0, "register_me"), (1, "add_order")]
+    assert records[0].timestamp == 1.5
+    assert records[1].message == {"trader_id": "a", "price": 1000.0}
+
+
+def test_reopened_journal_goes_on_with_the_sequence(tmp_path):
+    path = str(tmp_path / "session.journal")
+    live = TradingSession(duration=1)
+    live.open_journal(path)
+    live.journal.append("register_me", {"trader_id": "a"})
+    live.journal.close()
+    with open(path, "ab") as f:
+        f.write(b"\x10\x00")  # a record cut by a crash
+
+    live.open_journal(path)
+    live.journal.append("add_order", {"trader_id": "a", "price": 1000.0})
+    live.journal.close()
+    records = list(read_journal(path))
+    assert [(r.seq, r.action) for r in records] == [(0, "session"), (1, "register_me"), (2, "add_order")]
+
+
+def incoming(body):
+    message = MagicMock()
+    message.body = json.dumps(body).encode()
+    return message
+
+
+@pytest.mark.asyncio
+async def test_replay_reproduces_book_and_trades(tmp_path):
+    live = TradingSession(duration=1, journal_directory=str(tmp_path))
+    live.active = True
+    live.open_journal(str(tmp_path / "live.journal"))
+    live.send_message_to_trader = AsyncMock()
+    live.send_broadcast = AsyncMock()
+    live.persist_transaction = MagicMock()
+
+    for trader_id in ("buyer", "seller"):
+        await live.on_individual_message(incoming({"action": "register_me", "trader_id": trader_id,
+                                                   "trader_type": "NOISE"}))
+    for trader_id, order_type, price in (("buyer", 1, 999), ("buyer", 1, 1000), ("seller", -1, 1002),
+                                         ("seller", -1, 1000)):
+        await live.on_individual_message(incoming({"action": "add_order", "trader_id": trader_id,
+                                                   "order_type": order_type, "price": price, "amount": 1}))
+    resting_ask = next(order for order in live.active_orders.values() if order["order_type"] == -1)
+    await live.on_individual_message(incoming({"action": "cancel_order", "trader_id": "seller",
+                                               "order_id": str(resting_ask["id"])}))
+    live.journal.close()
+
+    replayed = await replay_journal(str(tmp_path / "live.journal"))
+
+    assert replayed.id == live.id
+    assert replayed.all_orders.keys() == live.all_orders.keys()
+    assert {k: v["status"] for k, v in replayed.all_orders.items()} == \
+           {k: v["status"] for k, v in live.all_orders.items()}
+    assert replayed.order_book == live.order_book
+    live_trades = [call.args[0] for call in live.persist_transaction.call_args_list]
+    assert live_trades
+    assert [(t.bid_order_id, t.ask_order_id, t.price) for t in replayed.trades] == \
+           [(t.bid_order_id, t.ask_order_id, t.price) for t in live_trades]
+
+
+@pytest.mark.asyncio
+async def test_seeded_book_is_placed_at_once_and_replayed(tmp_path):
+    live = TradingSession(duration=1, journal_directory=str(tmp_path))
+    live.active = True
+    live.open_journal(str(tmp_path / "live.journal"))
+    live.send_broadcast = AsyncMock()
+    live.persist_transaction = MagicMock()
+
+    orders = get_book_seed_orders(best_bid=2000, levels_n=20, step=1, orders_per_level=2, max_size=3,
+                                  owners=["noise_1", "noise_2"], rng=np.random.default_rng(0))
+    await live.seed_book(orders)
+    live.journal.close()
+
+    assert len(live.active_orders) == 80
+    assert live.order_book["bids"][0]["x"] == 2000 and live.order_book["asks"][0]["x"] == 2001
+    assert {order["trader_id"] for order in live.active_orders.values()} == {"noise_1", "noise_2"}
+    live.persist_transaction.assert_not_called()
+    live.send_broadcast.assert_awaited_once()
+
+    replayed = await replay_journal(str(tmp_path / "live.journal"))
+    assert replayed.all_orders.keys() == live.all_orders.keys()
+    assert replayed.order_book == live.order_book
+
+
+@pytest.mark.asyncio
+async def test_replay_reproduces_amended_orders(tmp_path):
+    live = TradingSession(duration=1, journal_directory=str(tmp_path))
+    live.active = True
+    live.open_journal(str(tmp_path / "live.journal"))
+    live.send_message_to_trader = AsyncMock()
+    live.send_broadcast = AsyncMock()
+    live.persist_transaction = MagicMock()
+
+    await live.on_individual_message(incoming({"action": "register_me", "trader_id": "buyer",
+                                               "trader_type": "NOISE"}))
+    for price in (999, 998):
+        await live.on_individual_message(incoming({"action": "add_order", "trader_id": "buyer", "order_type": 1,
+                                                   "price": price, "amount": 2}))
+    first_bid, second_bid = live.all_orders.values()
+    await live.on_individual_message(incoming({"action": "amend_order", "trader_id": "buyer",
+                                               "order_id": str(first_bid["id"]), "amount": 1}))
+    await live.on_individual_message(incoming({"action": "amend_order", "trader_id": "buyer",
+                                               "order_id": str(second_bid["id"]), "price": 1000}))
+    live.journal.close()
+
+    assert [r.action for r in read_journal(str(tmp_path / "live.journal"))].count("amend_order") == 2
+    replayed = await replay_journal(str(tmp_path / "live.journal"))
+    assert {k: (v["status"], v["price"], v["amount"], v["timestamp"]) for k, v in replayed.all_orders.items()} == \
+           {k: (v["status"], v["price"], v["amount"], v["timestamp"]) for k, v in live.all_orders.items()}
+    assert replayed.order_book == live.order_book
+
+
+@pytest.mark.asyncio
+async def test_replay_reproduces_the_settlement_at_closure_price(tmp_path):
+    live = TradingSession(duration=1, default_price=1000, default_spread=10)
+    live.active = True
+    live.open_journal(str(tmp_path / "live.journal"))
+    live.send_message_to_trader = AsyncMock()
+    live.send_broadcast = AsyncMock()
+    live.save_transactions = AsyncMock()
+    live.save_order_events = AsyncMock()
+    live.send_fill_reports = AsyncMock()
+
+    for trader_id in ("buyer", "seller"):
+        await live.on_individual_message(incoming({"action": "register_me", "trader_id": trader_id,
+                                                   "trader_type": "NOISE"}))
+    await live.on_individual_message(incoming({"action": "add_order", "trader_id": "buyer", "order_type": 1,
+                                               "price": 999, "amount": 2}))
+    live.active = False
+    await live.close_existing_book()
+    await live.on_individual_message(incoming({"action": "inventory_report", "trader_id": "seller", "shares": 3}))
+    await live.settle_inventories([{"trader_id": "seller", "shares": 3}])
+    live.journal.close()
+    live_trades = [t for call in live.save_transactions.await_args_list for t in call.args[0]]
+    assert len(live_trades) == 2
+
+    replayed = await replay_journal(str(tmp_path / "live.journal"))
+    assert {k: v["status"] for k, v in replayed.all_orders.items()} == \
+           {k: v["status"] for k, v in live.all_orders.items()}
+    assert [(t.bid_order_id, t.ask_order_id, t.price) for t in replayed.trades] == \
+           [(t.bid_order_id, t.ask_order_id, t.price) for t in live_trades]
+
+
+@pytest.mark.asyncio
+async def test_settlement_cannot_be_sent_by_a_trader(tmp_path):
+    live = TradingSession(duration=1)
+    live.active = True
+    live.send_message_to_trader = AsyncMock()
+    live.save_transactions = AsyncMock()
+    live.send_fill_reports = AsyncMock()
+    await live.on_individual_message(incoming({"action": "settlement", "timestamp": "2024-01-01T00:00:00+00:00",
+                                               "entries": [{"trader_id": "a", "order_type": 1, "amount": 1,
+                                                            "price": 1, "order_id": "x", "resting": False,
+                                                            "platform_order_id": "y"}]}))
+    assert live.all_orders == {}
+    live.save_transactions.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_seed_book_cannot_be_sent_by_a_trader():
+    live = TradingSession(duration=1)
+    live.active = True
+    live.send_broadcast = AsyncMock()
+    await live.on_individual_message(incoming({"action": "seed_book", "timestamp": "2024-01-01T00:00:00+00:00",
+                                               "orders": [{"id": "0" * 32, "trader_id": "a", "order_type": 1,
+                                                           "price": 1, "amount": 1}]}))
+    assert live.all_orders == {}
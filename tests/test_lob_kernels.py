@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from external_traders.noise_trader import get_noise_condition_price, get_exec_sell_trd, get_insert_sell
+
+
+def random_sides(n_cases=200, levels_n=10, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n_cases):
+        best = float(rng.integers(1990, 2010))
+        prices = best - np.arange(levels_n) * rng.integers(1, 3)
+        sizes = rng.integers(0, 5, levels_n).astype(np.float64)
+        yield prices, sizes, float(best + rng.integers(-12, 3)), float(rng.integers(0, 15))
+
+
+def test_python_kernels():
+    bid_prices, bid_sizes = np.array([100., 99., 98.]), np.array([2., 1., 5.])
+    assert get_noise_condition_price.py_func(bid_prices, bid_sizes, 2) == 99.
+    assert get_noise_condition_price.py_func(bid_prices, bid_sizes, 1) == -1
+
+    # a sell at 99 for 4 takes the 2 at 100 and the 1 at 99, the rest doesn't cross
+    sizes, exec_price, exec_size = get_exec_sell_trd.py_func(bid_prices, bid_sizes.copy(), 99., 4.)
+    assert list(sizes) == [0., 0., 5.] and exec_size == 3 and exec_price == pytest.approx((200 + 99) / 3)
+    # sweeping the whole side doesn't run past the last level
+    sizes, exec_price, exec_size = get_exec_sell_trd.py_func(bid_prices, bid_sizes.copy(), 90., 20.)
+    assert list(sizes) == [0., 0., 0.] and exec_size == 8
+    assert np.isnan(get_exec_sell_trd.py_func(bid_prices, bid_sizes.copy(), 101., 1.)[1])
+
+    ask_prices, ask_sizes = np.array([101., 102., 103.]), np.array([1., 1., 1.])
+    assert list(get_insert_sell.py_func(ask_prices, ask_sizes.copy(), 102., 2.)[1]) == [1., 3., 1.]
+    prices, sizes = get_insert_sell.py_func(ask_prices, ask_sizes.copy(), 100., 2.)
+    assert list(prices) == [100., 101., 102.] and list(sizes) == [2., 1., 1.]
+
+
+def test_compiled_kernels_match_the_python_ones():
+    pytest.importorskip('numba')
+    for prices, sizes, order_price, order_size in random_sides():
+        assert get_noise_condition_price(prices, sizes, 3.) == get_noise_condition_price.py_func(prices, sizes, 3.)
+
+        compiled = get_exec_sell_trd(prices, sizes.copy(), order_price, order_size)
+        python = get_exec_sell_trd.py_func(prices, sizes.copy(), order_price, order_size)
+        assert np.array_equal(compiled[0], python[0])
+        assert np.allclose(compiled[1:], python[1:], equal_nan=True)
+
+        ask_prices = prices[::-1].copy()
+        compiled = get_insert_sell(ask_prices, sizes.copy(), order_price, order_size)
+        python = get_insert_sell.py_func(ask_prices, sizes.copy(), order_price, order_size)
+        assert np.array_equal(compiled[0], python[0]) and np.array_equal(compiled[1], python[1])
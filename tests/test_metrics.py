@@ -0,0 +1,60 @@
+import json
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from main_platform import TradingSession
+from main_platform.metrics import Histogram, get_session_metrics, drop_session_metrics, render_prometheus
+from traders.base_trader import BaseTrader
+from structures import TraderType
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.001, 0.01))
+    for value in (0.0005, 0.001, 0.005, 2):
+        histogram.observe(value)
+    assert list(histogram.cumulative_counts()) == [2, 3, 4]
+    assert histogram.count == 4
+
+
+def test_render_prometheus():
+    metrics = get_session_metrics("render-test")
+    metrics.observe("handler", 0.002)
+    text = render_prometheus()
+    drop_session_metrics("render-test")
+    assert '# TYPE trading_session_latency_seconds histogram' in text
+    assert 'trading_session_latency_seconds_bucket{session_id="render-test",stage="handler",le="0.0025"} 1' in text
+    assert 'trading_session_latency_seconds_bucket{session_id="render-test",stage="handler",le="+Inf"} 1' in text
+    assert 'trading_session_latency_seconds_count{session_id="render-test",stage="matching"} 0' in text
+    assert "render-test" not in render_prometheus()
+
+
+@pytest.mark.asyncio
+async def test_session_measures_stages_and_echoes_send_stamp():
+    session = TradingSession(duration=1)
+    session.active = True
+    session.send_message_to_trader = AsyncMock()
+    session.send_broadcast = AsyncMock()
+    message = MagicMock()
+    message.body = json.dumps({"action": "register_me", "trader_id": "a", "trader_type": "NOISE",
+                               "sent_at": time.monotonic()}).encode()
+
+    await session.on_individual_message(message)
+
+    assert session.metrics.histograms["queue_wait"].count == 1
+    assert session.metrics.histograms["handler"].count == 1
+    response = session.send_message_to_trader.await_args.args[1]
+    assert "request_sent_at" in response
+    drop_session_metrics(session.id)
+
+
+def test_late_response_does_not_bring_back_dropped_metrics():
+    trader = BaseTrader(TraderType.NOISE)
+    trader.trading_session_uuid = "dropped-test"
+    trader.subscriptions = []
+    get_session_metrics("dropped-test")
+    drop_session_metrics("dropped-test")
+
+    trader.observe_round_trip({"request_sent_at": time.monotonic()})
+
+    assert get_session_metrics("dropped-test", create=False) is None
+    assert "dropped-test" not in render_prometheus()
@@ -0,0 +1,35 @@
+import asyncio
+import time
+import pytest
+from main_platform.profiler import SessionProfiler
+
+
+class BusySession:
+    def spin(self, seconds):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            pass
+
+    async def handle_add_order(self, seconds):
+        await asyncio.sleep(0.02)  # let the sampler thread start
+        self.spin(seconds)
+
+
+@pytest.mark.asyncio
+async def test_profiler_samples_only_the_profiled_session():
+    session, other_session = BusySession(), BusySession()
+    profiler = SessionProfiler([session], interval=0.001)
+
+    async def busy():
+        await session.handle_add_order(0.1)
+        await other_session.handle_add_order(0.1)
+
+    stacks, _ = await asyncio.gather(profiler.profile(0.3), busy())
+
+    assert profiler.samples
+    for line in stacks.splitlines():
+        stack, count = line.rsplit(' ', 1)
+        assert stack.startswith('[handle_add_order];test_profiler.py:handle_add_order')
+        assert int(count) > 0
+    # the other session's spin runs the same code, but it must not be counted
+    assert sum(profiler.samples.values()) < profiler.total_samples
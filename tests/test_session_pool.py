@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from client_connector import session_pool as session_pool_module
+from client_connector.session_pool import SessionPool, get_pool_configs
+from structures import TraderCreationData
+
+
+@pytest.fixture
+def prepared_managers(monkeypatch):
+    managers = []
+
+    def make_manager(params):
+        manager = MagicMock()
+        manager.params = params
+        manager.prepare = AsyncMock()
+        manager.cleanup = AsyncMock()
+        managers.append(manager)
+        return manager
+
+    monkeypatch.setattr(session_pool_module, 'TraderManager', make_manager)
+    return managers
+
+
+@pytest.mark.asyncio
+async def test_pool_is_refilled_after_a_claim(prepared_managers):
+    params = TraderCreationData(num_noise_traders=2)
+    pool = SessionPool(configs=[params], target_size=2).start()
+    await asyncio.sleep(0.01)
+    assert len(pool) == 2
+    assert all(manager.prepare.await_count == 1 for manager in prepared_managers)
+
+    claimed = pool.claim(TraderCreationData(num_noise_traders=2))
+    assert claimed is prepared_managers[0]
+    await asyncio.sleep(0.01)
+    assert len(pool) == 2
+    assert len(prepared_managers) == 3
+
+    await pool.stop()
+    assert len(pool) == 0
+    claimed.cleanup.assert_not_awaited()
+    assert all(manager.cleanup.await_count == 1 for manager in prepared_managers[1:])
+
+
+@pytest.mark.asyncio
+async def test_claim_of_another_config_misses(prepared_managers):
+    pool = SessionPool(configs=[TraderCreationData()], target_size=1)
+    await pool.fill()
+    assert pool.claim(TraderCreationData(num_noise_traders=5)) is None
+    manager = pool.claim(TraderCreationData())
+    assert pool.claim(TraderCreationData()) is None
+    pool.give_back(manager)
+    assert pool.claim(TraderCreationData()) is manager
+
+
+def test_pool_configs_from_json():
+    configs = get_pool_configs('[{"num_noise_traders": 3}, {"trading_day_duration": 5}]')
+    assert [c.num_noise_traders for c in configs] == [3, 1]
+    assert get_pool_configs(None) == [TraderCreationData()]
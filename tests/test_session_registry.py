@@ -0,0 +1,41 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from client_connector.session_registry import SessionRegistry, SessionLimitReached
+
+
+def make_manager(session_id, trader_ids=("t1",)):
+    manager = MagicMock()
+    manager.trading_session.id = session_id
+    manager.traders = {trader_id: MagicMock() for trader_id in trader_ids}
+    manager.launch = AsyncMock()
+    manager.save_results = AsyncMock()
+    manager.cleanup = AsyncMock()
+    return manager
+
+
+def test_live_sessions_are_capped():
+    registry = SessionRegistry(max_live_sessions=1)
+    registry.register(make_manager("s1"))
+    with pytest.raises(SessionLimitReached):
+        registry.register(make_manager("s2"))
+
+
+@pytest.mark.asyncio
+async def test_finished_session_is_evicted_after_grace_period():
+    registry = SessionRegistry(max_live_sessions=1, grace_period=0.05)
+    manager = make_manager("s1", trader_ids=("t1", "t2"))
+    registry.register(manager)
+
+    await registry.run(manager)
+
+    manager.save_results.assert_awaited_once()
+    # during the grace period it is still there, but it doesn't count as a live session anymore
+    assert registry.get_by_trader("t2") is manager
+    registry.register(make_manager("s2"))
+
+    await asyncio.sleep(0.1)
+    assert "s1" not in registry
+    assert registry.get_by_trader("t1") is None
+    manager.cleanup.assert_awaited_once()
+    assert not registry._eviction_tasks  # the eviction task was kept until it finished, then let go
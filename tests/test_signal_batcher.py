@@ -0,0 +1,34 @@
+import asyncio
+import numpy as np
+import pytest
+from client_connector.signal_batcher import SignalBatcher
+from external_traders.noise_trader import settings, get_signal_update
+
+
+class SumModel:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, features):
+        self.batch_sizes.append(len(features))
+        return features.sum(axis=1)
+
+
+@pytest.mark.asyncio
+async def test_requests_of_one_tick_run_as_one_predict_per_model():
+    models = {'market_maker': {'model': SumModel(), 'feature_ind': [0, 1]},
+              'informed': {'model': SumModel(), 'feature_ind': None}}
+    batcher = SignalBatcher(models, settings)
+    states = [np.arange(4.0) + i for i in range(3)]
+
+    signals = await asyncio.gather(*(batcher.predict(state) for state in states))
+
+    assert [model['model'].batch_sizes for model in models.values()] == [[3], [3]]
+    for state, signals_state in zip(states, signals):
+        assert np.array_equal(signals_state, get_signal_update(state, models, settings))
+        assert list(signals_state) == [state[0] + state[1], state.sum()]
+
+    # a later request is a new batch
+    batch_sizes = models['informed']['model'].batch_sizes
+    await batcher.predict(states[0])
+    assert batch_sizes[-1] == 1 and batch_sizes.count(3) == 1
@@ -0,0 +1,50 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from client_connector.spectator_feed import SpectatorFeed
+from main_platform import TradingSession
+from main_platform.metrics import drop_session_metrics
+from structures import OrderType
+
+
+def recording_websocket():
+    websocket = MagicMock()
+    sent = []
+
+    async def send_text(frame):
+        sent.append(json.loads(frame))
+
+    websocket.send_text = send_text
+    websocket.close = AsyncMock()
+    return websocket, sent
+
+
+@pytest.mark.asyncio
+async def test_spectators_get_conflated_books_at_their_depth_and_all_trades():
+    session = TradingSession(duration=1)
+    for i in range(5):
+        session.place_order({"id": f"bid_{i}", "trader_id": "noise", "order_type": OrderType.BID.value,
+                             "price": 1000 - i, "amount": 1, "timestamp": i})
+        session.place_order({"id": f"ask_{i}", "trader_id": "noise", "order_type": OrderType.ASK.value,
+                             "price": 1001 + i, "amount": 1, "timestamp": i})
+    feed = SpectatorFeed(session, max_rate=50)
+    l1_socket, l1_frames = recording_websocket()
+    deep_socket, deep_frames = recording_websocket()
+    feed.add_observer(l1_socket, depth=1)
+    feed.add_observer(deep_socket, depth=3)
+
+    # a burst of actions between two rounds of the feed ends up in a single book frame
+    session._pending_trades = [{"id": "t1", "price": 1000.5}]
+    await session.publish_book_updates()
+    session._pending_trades = [{"id": "t2", "price": 1000.5}]
+    await session.publish_book_updates()
+    await asyncio.sleep(0.05)
+    await feed.stop()
+
+    assert [frame["type"] for frame in l1_frames] == ["book", "trades", "book"]
+    assert len(l1_frames[0]["order_book"]["bids"]) == 1 and l1_frames[0]["spread"] == 1
+    assert [trade["id"] for trade in l1_frames[1]["trades"]] == ["t1", "t2"]
+    assert len(deep_frames[-1]["order_book"]["asks"]) == 3
+    assert session.market_data_listeners == []
+    drop_session_metrics(session.id)
@@ -1,6 +1,7 @@
 import pytest
 import asyncio
-from unittest.mock import AsyncMock, patch
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
 from main_platform import TradingSession
 from structures import OrderStatus, OrderType
 
@@ -159,3 +160,222 @@ async def test_clean_up():
     session.channel.close.assert_awaited()
     session.connection.close.assert_awaited()
     assert session.active is False
+
+
+@pytest.mark.asyncio
+async def test_order_book_with_depth():
+    session = TradingSession(duration=1)
+    session.all_orders = {
+        f"bid_{price}": {
+            "id": f"bid_{price}",
+            "order_type": OrderType.BID.value,
+            "price": price,
+            "amount": 1,
+            "status": OrderStatus.ACTIVE.value,
+        }
+        for price in (990, 995, 1000)
+    }
+    order_book = session.get_order_book(depth=2)
+    assert [level["x"] for level in order_book["bids"]] == [1000, 995]
+
+
+@pytest.mark.asyncio
+async def test_register_subscriptions():
+    session = TradingSession(duration=1)
+    session.active = True
+    await session.handle_register_me({"trader_id": "noise", "trader_type": "NOISE",
+                                      "subscriptions": ["book.l10", "control", "orders.private.noise"]})
+    await session.handle_register_me({"trader_id": "human", "trader_type": "HUMAN", "subscriptions": None})
+    assert session.subscribed_book_depths == {10}
+    assert "orders.private.noise" in session.subscribed_topics
+    assert session.full_broadcast_subscribers == {"human"}
+
+
+@pytest.mark.asyncio
+async def test_publish_book_updates_only_subscribed_topics():
+    session = TradingSession(duration=1)
+    session.market_data_exchange = AsyncMock()
+    session.add_subscriptions("noise", ["book.l1", "orders.private.noise"])
+    session.place_order({
+        "id": "bid_order",
+        "trader_id": "noise",
+        "order_type": OrderType.BID.value,
+        "price": 1000,
+        "amount": 1,
+        "timestamp": "2023-04-01T00:00:05Z",
+    })
+    session.place_order({
+        "id": "other_bid",
+        "trader_id": "other",
+        "order_type": OrderType.BID.value,
+        "price": 1001,
+        "amount": 1,
+        "timestamp": "2023-04-01T00:00:06Z",
+    })
+    await session.publish_book_updates()
+    routing_keys = [call.kwargs["routing_key"] for call in session.market_data_exchange.publish.await_args_list]
+    assert sorted(routing_keys) == ["book.l1", "orders.private.noise"]
+    assert not session._traders_with_order_updates
+
+
+@pytest.mark.asyncio
+async def test_run_closes_session_at_deadline():
+    session = TradingSession(duration=0, inventory_report_timeout=0.05)
+    session.active = True
+    session.start_time = datetime.now(timezone.utc)
+    session.close_existing_book = AsyncMock()
+    session.send_broadcast = AsyncMock()
+    session.clean_up = AsyncMock()
+    await session.handle_register_me({"trader_id": "reporter", "trader_type": "NOISE"})
+    await session.handle_register_me({"trader_id": "silent", "trader_type": "NOISE"})
+    session.trader_responses["reporter"] = True
+    session._inventory_reports["reporter"].set_result({})
+
+    await asyncio.wait_for(session.run(), timeout=1)
+
+    session.close_existing_book.assert_awaited_once()
+    session.send_broadcast.assert_awaited_with({"type": "closure", "non_responders": ["silent"]})
+    session.clean_up.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_run_exits_without_closing_when_stopped():
+    session = TradingSession(duration=10)
+    session.start_time = datetime.now(timezone.utc)
+    session.close_existing_book = AsyncMock()
+    session.clean_up = AsyncMock()
+    session._stop_requested.set()
+    await asyncio.wait_for(session.run(), timeout=1)
+    session.close_existing_book.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_close_existing_book_settles_in_bulk():
+    session = TradingSession(duration=1, default_price=1000, default_spread=10)
+    session.save_transactions = AsyncMock()
+    session.save_order_events = AsyncMock()
+    session.send_broadcast = AsyncMock()
+    session.trader_exchange = AsyncMock()
+    for order_id, trader_id, order_type in (("bid", "buyer", OrderType.BID), ("ask", "seller", OrderType.ASK)):
+        session.place_order({
+            "id": order_id,
+            "trader_id": trader_id,
+            "order_type": order_type.value,
+            "price": 1000,
+            "amount": 2,
+        })
+
+    await session.close_existing_book()
+
+    assert session.active_orders == {}
+    assert session.all_orders["bid"]["status"] == OrderStatus.EXECUTED.value
+    transactions = session.save_transactions.await_args.args[0]
+    assert sorted(t.price for t in transactions) == [980, 1020]
+    routing_keys = {call.kwargs["routing_key"] for call in session.trader_exchange.publish.await_args_list}
+    assert routing_keys == {"trader_buyer", "trader_seller"}
+    session.send_broadcast.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_settle_inventories_sells_long_and_buys_short_positions():
+    session = TradingSession(duration=1, default_price=1000, default_spread=10)
+    session.save_transactions = AsyncMock()
+    session.save_order_events = AsyncMock()
+    session.send_fill_reports = AsyncMock()
+    transactions = await session.settle_inventories([
+        {"trader_id": "long", "shares": 3},
+        {"trader_id": "short", "shares": -1},
+        {"trader_id": "flat", "shares": 0},
+    ])
+    assert [t.price for t in transactions] == [970, 1010]
+    fills = session.send_fill_reports.await_args.args[0]
+    assert fills["long"][0]["type"] == "ask"
+    assert fills["short"][0]["type"] == "bid"
+    assert "flat" not in fills
+
+
+async def send_action(session, action, **message):
+    """Records (ids and timestamps of new orders and amends) and processes an action, as on_individual_message does."""
+    session.record_action(action, message)
+    await session.process_action(action, message)
+
+
+@pytest.mark.asyncio
+async def test_amend_keeps_priority_on_size_down_and_matches_once():
+    session = TradingSession(duration=1)
+    session.active = True
+    session.send_message_to_trader = AsyncMock()
+    session.send_broadcast = AsyncMock()
+    session.persist_transaction = MagicMock()
+
+    for trader_id in ("buyer", "seller"):
+        await send_action(session, "register_me", trader_id=trader_id, trader_type="NOISE")
+    for trader_id, order_type, price in (("buyer", 1, 999), ("buyer", 1, 999), ("seller", -1, 1001)):
+        await send_action(session, "add_order", trader_id=trader_id, order_type=order_type, price=price, amount=2)
+    first_bid, second_bid, ask = session.all_orders.values()
+    first_timestamp = first_bid["timestamp"]
+    session.send_broadcast.reset_mock()
+
+    await send_action(session, "amend_order", trader_id="buyer", order_id=str(first_bid["id"]), amount=1)
+    assert first_bid["amount"] == 1 and first_bid["timestamp"] == first_timestamp
+    # someone else's order can't be amended, and a refused amend isn't broadcast
+    await send_action(session, "amend_order", trader_id="buyer", order_id=str(ask["id"]), price=999)
+    assert ask["price"] == 1001
+    assert session.send_broadcast.await_count == 1
+
+    # the ask moves down to the bids: it trades with the first one, which is still first in the queue
+    await send_action(session, "amend_order", trader_id="seller", order_id=str(ask["id"]), price=999, amount=1)
+    assert ask["timestamp"] > first_timestamp
+    assert first_bid["status"] == ask["status"] == "executed"
+    assert second_bid["status"] == "active"
+    assert session.send_broadcast.await_count == 2
+    session.persist_transaction.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_broadcast_without_full_subscribers_saves_a_compact_message():
+    session = TradingSession(duration=1)
+    session.market_data_exchange = AsyncMock()
+    session.channel = AsyncMock()
+    with patch("main_platform.trading_platform.Message") as message_model:
+        await session.build_and_send_broadcast({"text": "book is updated"})
+    content = message_model.call_args.kwargs["content"]
+    assert "order_book" in content and "active_orders" not in content
+    message_model.return_value.save.assert_called_once()
+    session.channel.get_exchange.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_amend_takes_the_server_time_and_refuses_malformed_values():
+    session = TradingSession(duration=1)
+    session.active = True
+    session.send_message_to_trader = AsyncMock()
+    session.send_broadcast = AsyncMock()
+    for price in (999, 999):
+        await send_action(session, "add_order", trader_id="buyer", order_type=1, price=price, amount=1)
+    first_bid, second_bid = session.all_orders.values()
+
+    # an old timestamp doesn't move the amended order to the front of the queue
+    await send_action(session, "amend_order", trader_id="buyer", order_id=str(second_bid["id"]), amount=2,
+                      timestamp="2000-01-01T00:00:00+00:00")
+    assert second_bid["timestamp"] > first_bid["timestamp"]
+
+    for bad in ({"price": "abc"}, {"amount": "abc"}, {"price": [1]}):
+        await send_action(session, "amend_order", trader_id="buyer", order_id=str(first_bid["id"]), **bad)
+        response = session.send_message_to_trader.await_args.args[1]
+        assert response["status"] == "failed" and response["reason"] == "Invalid price or amount"
+    assert first_bid["price"] == 999 and first_bid["amount"] == 1
+
+
+@pytest.mark.asyncio
+async def test_new_orders_get_the_id_and_time_of_the_platform():
+    session = TradingSession(duration=1)
+    session.active = True
+    session.send_message_to_trader = AsyncMock()
+    session.send_broadcast = AsyncMock()
+    await send_action(session, "add_order", trader_id="buyer", order_type=1, price=999, amount=1)
+    first_bid = next(iter(session.all_orders.values()))
+    await send_action(session, "add_order", trader_id="buyer", order_type=1, price=999, amount=1,
+                      id=str(first_bid["id"]), timestamp="2000-01-01T00:00:00+00:00")
+    assert len(session.all_orders) == 2
+    assert all(order["timestamp"].year > 2000 for order in session.all_orders.values())
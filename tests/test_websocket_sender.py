@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from main_platform.metrics import get_session_metrics, drop_session_metrics
+from traders.websocket_sender import WebSocketSender
+
+
+def slow_websocket(delay):
+    websocket = MagicMock()
+    sent = []
+
+    async def send_text(frame):
+        await asyncio.sleep(delay)
+        sent.append(frame)
+
+    websocket.send_text = send_text
+    websocket.close = AsyncMock()
+    return websocket, sent
+
+
+@pytest.mark.asyncio
+async def test_market_data_is_conflated_and_fills_are_kept_in_order():
+    websocket, sent = slow_websocket(0.01)
+    sender = WebSocketSender(websocket, session_id="sender-test").start()
+    sender.send("book 1", market_data=True)
+    await asyncio.sleep(0)  # 'book 1' is being written now
+    for frame, market_data in (("book 2", True), ("fill 1", False), ("book 3", True), ("fill 2", False),
+                               ("book 4", True)):
+        sender.send(frame, market_data=market_data)
+    await sender.stop()
+
+    assert sent == ["book 1", "fill 1", "fill 2", "book 4"]
+    frames = get_session_metrics("sender-test").websocket_frames
+    assert frames == {"sent": 4, "conflated": 2, "dropped": 0}
+    drop_session_metrics("sender-test")
+
+
+@pytest.mark.asyncio
+async def test_client_too_far_behind_is_disconnected():
+    websocket, sent = slow_websocket(1)
+    sender = WebSocketSender(websocket, session_id="slow-client", max_frames=2).start()
+    for i in range(4):
+        sender.send(f"fill {i}")
+    await asyncio.sleep(0)
+
+    assert sender.closed
+    websocket.close.assert_awaited_once()
+    assert get_session_metrics("slow-client").websocket_frames["dropped"] == 4
+    drop_session_metrics("slow-client")
@@ -1,12 +1,15 @@
 import asyncio
 import aio_pika
+import copy
 import json
+import time
 import uuid
-from structures.structures import OrderType, ActionType, TraderType
+from structures.structures import OrderType, ActionType, TraderType, MarketDataTopic
 import os
 
-from main_platform.custom_logger import setup_custom_logger
+from main_platform.custom_logger import setup_custom_logger, set_log_session
 from main_platform.utils import (CustomEncoder)
+from main_platform.metrics import get_session_metrics
 
 rabbitmq_url = os.getenv('RABBITMQ_URL', 'amqp://localhost')
 
@@ -21,6 +24,12 @@ class BaseTrader:
     shares = 0
     initial_cash = 0
     initial_shares = 0
+    # Topics of the session's market data exchange the trader listens to (see MarketDataTopic and book_topic).
+    # None means the trader gets the full fanout broadcast with the book, all active orders and the history.
+    subscriptions: list = None
+    # Model-driven traders read the session's shared features (see client_connector/feature_feed.py) instead of
+    # computing them from their own copy of the book.
+    uses_features = False
 
     def __init__(self, trader_type: TraderType, cash=0, shares=0):
 
@@ -34,15 +43,17 @@ class BaseTrader:
         self._stop_requested = asyncio.Event()  # this one we need only for traders which should be kept active in loop. For instance human traders don't need that
         self.trader_type = trader_type.value
         self.id = str(uuid.uuid4())
-        logger.info(f"Trader of type {self.trader_type} created with UUID: {self.id}")
+        logger.info("Trader of type %s created with UUID: %s", self.trader_type, self.id)
         self.connection = None
         self.channel = None
         self.trading_session_uuid = None
         self.trader_queue_name = f'trader_{self.id}'  # unique queue name based on Trader's UUID
-        logger.info(f"Trader queue name: {self.trader_queue_name}")
+        logger.info("Trader queue name: %s", self.trader_queue_name)
         self.queue_name = None
         self.broadcast_exchange_name = None
         self.trading_system_exchange = None
+        self.features = None  # the latest features of the session, for traders with uses_features
+        self.signals = None  # and the signals of the models on them
 
         # PNL BLOCK
         self.DInv = []
@@ -54,14 +65,15 @@ class BaseTrader:
         self.sum_mid_executions = 0
         self.current_pnl = 0
 
-        self.start_time = asyncio.get_event_loop().time()
+        # same clock as the event loop's time(), but doesn't require a running loop when the trader is created
+        self.start_time = time.monotonic()
 
 
         # END PNL BLOCK
 
     def get_elapsed_time(self) -> float:
         """Returns the elapsed time in seconds since the trader was initialized."""
-        current_time = asyncio.get_event_loop().time()
+        current_time = time.monotonic()
         return current_time - self.start_time
 
     def get_vwap(self):
@@ -95,6 +107,23 @@ class BaseTrader:
         return self.current_pnl
 
     
+    # attributes that make up the state of a trader in a session checkpoint
+    checkpoint_attributes = ['id', 'cash', 'shares', 'initial_cash', 'initial_shares', 'orders',
+                             'DInv', 'transaction_prices', 'transaction_relevant_mid_prices', 'general_mid_prices',
+                             'sum_cost', 'sum_dinv', 'sum_mid_executions', 'current_pnl']
+    # what a bot takes into a new session started from a checkpointed book: its id, so that it still owns its resting
+    # orders. The ledger (cash, shares, PnL) starts over
+    book_attributes = ['id', 'orders']
+
+    def get_checkpoint_state(self):
+        return {name: copy.copy(getattr(self, name)) for name in self.checkpoint_attributes}
+
+    def restore_checkpoint_state(self, state: dict, book_only=False):
+        for name in (self.book_attributes if book_only else self.checkpoint_attributes):
+            if name in state:
+                setattr(self, name, state[name])
+        self.trader_queue_name = f'trader_{self.id}'
+
     @property
     def delta_cash(self):
         return self.cash - self.initial_cash
@@ -110,13 +139,13 @@ class BaseTrader:
             # Close the channel and connection
             if self.channel:
                 await self.channel.close()
-                logger.info(f"Trader {self.id} channel closed")
+                logger.info("Trader %s channel closed", self.id)
             if self.connection:
                 await self.connection.close()
-                logger.info(f"Trader {self.id} connection closed")
+                logger.info("Trader %s connection closed", self.id)
 
         except Exception as e:
-            logger.error(f"An error occurred during Trader cleanup: {e}")
+            logger.error("An error occurred during Trader cleanup: %s", e)
 
     async def connect_to_session(self, trading_session_uuid):
         self.trading_session_uuid = trading_session_uuid
@@ -126,12 +155,21 @@ class BaseTrader:
         self.broadcast_exchange_name = f'broadcast_{self.trading_session_uuid}'
 
         # Subscribe to group messages
-        broadcast_exchange = await self.channel.declare_exchange(self.broadcast_exchange_name,
-                                                                 aio_pika.ExchangeType.FANOUT,
-                                                                 auto_delete=True)
-        broadcast_queue = await self.channel.declare_queue("", auto_delete=True)
-        await broadcast_queue.bind(broadcast_exchange)
-        await broadcast_queue.consume(self.on_message_from_system)
+        if self.subscriptions is None:
+            broadcast_exchange = await self.channel.declare_exchange(self.broadcast_exchange_name,
+                                                                     aio_pika.ExchangeType.FANOUT,
+                                                                     auto_delete=True)
+            broadcast_queue = await self.channel.declare_queue("", auto_delete=True)
+            await broadcast_queue.bind(broadcast_exchange)
+            await broadcast_queue.consume(self.on_message_from_system)
+        else:
+            market_data_exchange = await self.channel.declare_exchange(f'market_data_{self.trading_session_uuid}',
+                                                                       aio_pika.ExchangeType.TOPIC,
+                                                                       auto_delete=True)
+            market_data_queue = await self.channel.declare_queue("", auto_delete=True)
+            for topic in self.get_subscriptions():
+                await market_data_queue.bind(market_data_exchange, routing_key=topic)
+            await market_data_queue.consume(self.on_message_from_system)
 
         # For individual messages
         self.trading_system_exchange = await self.channel.declare_exchange(self.queue_name,
@@ -146,11 +184,18 @@ class BaseTrader:
 
         await self.register()  # Register with the trading system
 
+    def get_subscriptions(self):
+        """Returns the routing keys the trader binds to, with the private topics formatted for this trader."""
+        if self.subscriptions is None:
+            return None
+        return [str(getattr(topic, 'value', topic)).format(trader_id=self.id) for topic in self.subscriptions]
+
     async def register(self):
         message = {
             'type': ActionType.REGISTER.value,
             'action': ActionType.REGISTER.value,
-            'trader_type': self.trader_type
+            'trader_type': self.trader_type,
+            'subscriptions': self.get_subscriptions(),
         }
 
         await self.send_to_trading_system(message)
@@ -158,22 +203,29 @@ class BaseTrader:
     async def send_to_trading_system(self, message):
         # front end design means human traders' own_orders will alaways be empty
         message['trader_id'] = self.id
+        message['sent_at'] = time.monotonic()  # for the latency metrics, see main_platform/metrics.py
         await self.trading_system_exchange.publish(
             aio_pika.Message(body=json.dumps(message, cls=CustomEncoder).encode()),
             routing_key=self.queue_name  # Use the dynamic queue_name
         )
 
+    def decode_message(self, body: bytes) -> dict:
+        """Decodes a message from the trading system. The result must be treated as read-only: the subclasses may
+        share one decoded message between several traders."""
+        return json.loads(body.decode())
+
     async def on_message_from_system(self, message):
         """Process incoming messages from trading system.
         For BaseTrader it updates order book and inventory if needed.
 
         """
         try:
-
-            json_message = json.loads(message.body.decode())
+            set_log_session(self.trading_session_uuid)
+            json_message = self.decode_message(message.body)
 
             action_type = json_message.get('type')
             data = json_message
+            self.observe_round_trip(data)
             if data.get('midpoint'):
                 self.update_mid_price(data['midpoint'])
             if data.get('new_transactions'):
@@ -190,16 +242,38 @@ class BaseTrader:
                 own_orders = [order for order in active_orders if order['trader_id'] == self.id]
                 # lets convert the order list to a dictionary with keys as order ids
                 self.orders = own_orders
+            trader_orders = data.get('trader_orders')
+            if trader_orders is not None:
+                # private orders topic: here an empty list means that all our orders are gone
+                self.orders = trader_orders
 
             handler = getattr(self, f'handle_{action_type}', None)
             if handler:
                 await handler(data)
             else:
-                logger.error(f"Invalid message format: {message}")
+                logger.error("Invalid message format: %s", message)
             await self.post_processing_server_message(data)
 
         except json.JSONDecodeError:
-            logger.error(f"Error decoding message: {message}")
+            logger.error("Error decoding message: %s", message)
+
+    def observe_round_trip(self, data):
+        """
+        Records how long it took for our own request to come back. Traders on the full broadcast wait for the
+        broadcast their request caused, the ones on market data topics don't get it, so for them it is the response.
+        """
+        if self.subscriptions is None:
+            incoming_message = data.get('incoming_message') or {}
+            if incoming_message.get('trader_id') != self.id:
+                return
+            sent_at = incoming_message.get('request_sent_at')
+        else:
+            sent_at = data.get('request_sent_at')
+        if sent_at is not None and self.trading_session_uuid:
+            # the session creates its metrics; a response that arrives after they were dropped isn't counted
+            metrics = get_session_metrics(self.trading_session_uuid, create=False)
+            if metrics is not None:
+                metrics.observe_since('round_trip', sent_at)
 
     def update_inventory(self, new_transactions):
         """
@@ -220,7 +294,7 @@ class BaseTrader:
                 self.cash -= transaction['price'] * transaction['amount']
             self.update_data_for_pnl(d_inv, transaction['price'])
         if self.trader_type == TraderType.HUMAN.value:
-            logger.info(f"Trader {self.id} updated inventory: shares: {self.shares}, cash: {self.cash}")
+            logger.info("Trader %s updated inventory: shares: %s, cash: %s", self.id, self.shares, self.cash)
 
     async def post_processing_server_message(self, json_message):
         """for BaseTrader it is not implemented. For human trader we send updated info back to client.
@@ -238,17 +312,17 @@ class BaseTrader:
             "order_type": order_type,
         }
         await self.send_to_trading_system(new_order)
-        logger.debug(f"Trader {self.id} posted new {order_type} order: {new_order}")
+        logger.debug("Trader %s posted new %s order: %s", self.id, order_type, new_order)
 
     async def send_cancel_order_request(self, order_id: uuid.UUID):
         if not order_id:
-            logger.error(f"Order ID is not provided")
+            logger.error("Order ID is not provided")
             return
         if not self.orders:
-            logger.error(f"Trader {self.id} has no active orders")
+            logger.error("Trader %s has no active orders", self.id)
             return
         if order_id not in [order['id'] for order in self.orders]:
-            logger.error(f"Trader {self.id} has no order with ID {order_id}")
+            logger.error("Trader %s has no order with ID %s", self.id, order_id)
             return
 
         cancel_order_request = {
@@ -258,25 +332,81 @@ class BaseTrader:
         }
 
         await self.send_to_trading_system(cancel_order_request)
-        logger.info(f"Trader {self.id} sent cancel order request: {cancel_order_request}")
+        logger.info("Trader %s sent cancel order request: %s", self.id, cancel_order_request)
+
+    async def send_amend_order_request(self, order_id: uuid.UUID, price=None, amount=None):
+        """
+        Moves and/or resizes a resting order in one message instead of a cancel and a new order. Reducing the
+        amount at the same price keeps the order's place in the queue.
+        """
+        if price is None and amount is None:
+            logger.error("Nothing to amend in order %s", order_id)
+            return
+        if order_id not in [order['id'] for order in self.orders]:
+            logger.error("Trader %s has no order with ID %s", self.id, order_id)
+            return
+
+        amend_order_request = {
+            "action": ActionType.AMEND_ORDER.value,
+            "trader_id": self.id,
+            "order_id": order_id,
+        }
+        if price is not None:
+            amend_order_request["price"] = price
+        if amount is not None:
+            amend_order_request["amount"] = amount
+
+        await self.send_to_trading_system(amend_order_request)
+        logger.info("Trader %s sent amend order request: %s", self.id, amend_order_request)
+
+    def on_features(self, features_state):
+        """
+        Called by the session's FeatureFeed after each book update with the EWMAs of the book features (layout of
+        get_features_update). The array is shared by all the traders of the session and is updated in place: read
+        it, or copy what has to be kept.
+        """
+        self.features = features_state
+
+    def on_signals(self, signals_state):
+        """Called by the FeatureFeed with the model signals of the latest features, one value per model."""
+        self.signals = signals_state
+
+    def get_next_activation_delay(self):
+        """
+        Seconds until the trader wants to act again when driven by the session's BotScheduler.
+        None means the trader is not driven by the scheduler (or is done trading).
+        """
+        return None
 
     async def run(self):
         # Placeholder method for compatibility with the trading system
-        logger.info(f"trader {self.id} is waiting")
+        logger.info("trader %s is waiting", self.id)
+        pass
+
+    async def handle_book(self, data):
+        """Book snapshot from the market data exchange. The book itself is stored in on_message_from_system."""
+        pass
+
+    async def handle_trades(self, data):
+        """New trades from the market data exchange. Nothing to do for the BaseTrader."""
+        pass
+
+    async def handle_private_orders(self, data):
+        """Own active orders from the market data exchange. They are stored in on_message_from_system."""
         pass
 
     async def handle_closure(self, data):
         """Handle closure messages from the trading system."""
-        logger.critical(
-            f"Trader {self.id}: type: {self.trader_type}. Closure signal received. Preparing to stop trading activities.")
+        logger.info("Trader %s: type: %s. Closure signal received. Preparing to stop trading activities.",
+                    self.id, self.trader_type)
 
         self._stop_requested.set()
         await self.clean_up()
 
     async def handle_stop_trading(self, data):
         """Handle stop trading messages from the trading system."""
-        logger.critical(
-            f"Trader {self.id}: type: {self.trader_type}. Stop trading signal received. Preparing to stop trading activities.")
+        logger.info("Trader %s: type: %s. Stop trading signal received. Preparing to stop trading activities.",
+                    self.id, self.trader_type)
 
         await self.send_to_trading_system({
             "action": 'inventory_report',
@@ -1,22 +1,97 @@
 from .base_trader import BaseTrader
-from starlette.websockets import WebSocketDisconnect, WebSocketState
+from starlette.websockets import WebSocketState
+from collections import OrderedDict
 import random
 import json
 
 from structures import TraderType, OrderType, GOALS
 from main_platform.custom_logger import setup_custom_logger
+from main_platform.utils import CustomEncoder, splice_json_objects
+from .websocket_sender import WebSocketSender
 
 logger = setup_custom_logger(__name__)
 
+# fields of a websocket message that are specific to the trader; everything else comes from the trading system
+ENVELOPE_KEYS = ('type', 'shares', 'cash', 'pnl', 'inventory', 'trader_orders', 'initial_cash', 'initial_shares',
+                 'sum_dinv', 'vwap')
+
+
+def is_market_data(message: dict) -> bool:
+    """Book updates broadcast by the session can be conflated; fills, acknowledgements and control messages can't."""
+    return (message.get('type') == 'update' and 'incoming_message' in message
+            and not message.get('new_transactions'))
+
+
+def cut_order_book(order_book, depth):
+    if depth is None or not order_book:
+        return order_book
+    return {'bids': order_book.get('bids', [])[:depth], 'asks': order_book.get('asks', [])[:depth]}
+
+
+class SharedPayloadCache:
+    """
+    The human traders of a session all get the same broadcast, each from their own queue. This cache decodes each
+    broadcast once and encodes its market data part (book, active orders, history...) once per book depth, so that
+    with N humans the big part of the websocket message is serialized once and not N times. Each trader only adds
+    a small envelope with its own fields (see HumanTrader.send_payload).
+    The decoded messages are shared, so nobody should modify them.
+    """
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self._decoded = OrderedDict()  # raw body -> decoded message
+        self._encoded = {}  # (id of a decoded message, depth) -> encoded market data part
+
+    def decode(self, body: bytes) -> dict:
+        data = self._decoded.get(body)
+        if data is not None:
+            self._decoded.move_to_end(body)
+            return data
+        data = json.loads(body)
+        self._decoded[body] = data
+        if len(self._decoded) > self.maxsize:
+            _, evicted = self._decoded.popitem(last=False)
+            for key in [key for key in self._encoded if key[0] == id(evicted)]:
+                del self._encoded[key]
+        return data
+
+    def encode_market_data(self, data: dict, depth=None) -> str:
+        key = (id(data), depth)
+        encoded = self._encoded.get(key)
+        if encoded is None:
+            encoded = encode_market_data(data, depth)
+            # only messages that are held by the cache can be shared, otherwise their id could be reused
+            if any(cached is data for cached in self._decoded.values()):
+                self._encoded[key] = encoded
+        return encoded
+
+
+def encode_market_data(data: dict, depth=None) -> str:
+    market_data = {k: v for k, v in data.items() if k not in ENVELOPE_KEYS}
+    if 'order_book' in market_data:
+        market_data['order_book'] = cut_order_book(market_data['order_book'], depth)
+    return json.dumps(market_data, cls=CustomEncoder)
+
+
+shared_payloads = SharedPayloadCache()
+
 
 class HumanTrader(BaseTrader):
     websocket = None
     socket_status = False
+    sender: WebSocketSender = None
     inventory = {'shares': 0, 'cash': 1000}  # TODO.PHILIPP. WRite something sensible here. placeholder for now.
+    checkpoint_attributes = BaseTrader.checkpoint_attributes + ['goal']
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, depth_book_shown=None, **kwargs):
         super().__init__(trader_type=TraderType.HUMAN, *args, **kwargs)
         self.goal = random.choice(GOALS)
+        self.depth_book_shown = depth_book_shown
+
+    def get_order_book_to_show(self):
+        """The book cut to the number of levels the human is allowed to see (all of them if depth is not set)."""
+        return cut_order_book(self.order_book or {'bids': [], 'asks': []}, self.depth_book_shown)
+
     def get_trader_params_as_dict(self):
         return {
             'id': self.id,
@@ -26,53 +101,67 @@ class HumanTrader(BaseTrader):
             'goal': self.goal
         }
 
+    def decode_message(self, body: bytes) -> dict:
+        return shared_payloads.decode(body)
+
     async def post_processing_server_message(self, json_message):
-        message_type = json_message.pop('type', None)
+        message_type = json_message.get('type')
         if message_type:
-            await self.send_message_to_client(message_type, **json_message)
+            market_data = shared_payloads.encode_market_data(json_message, self.depth_book_shown)
+            await self.send_payload(message_type, market_data, has_order_book='order_book' in json_message,
+                                    conflatable=is_market_data(json_message))
 
     async def connect_to_socket(self, websocket):
+        if self.sender:
+            self.sender.close(close_websocket=False)  # the old socket of a reconnecting client
         self.websocket = websocket
         self.socket_status = True
+        self.sender = WebSocketSender(websocket, session_id=self.trading_session_uuid).start()
         await self.register()
 
+    async def clean_up(self):
+        if self.sender:
+            await self.sender.stop()
+        await super().clean_up()
+
     async def send_message_to_client(self, message_type, **kwargs):
+        await self.send_payload(message_type, encode_market_data(kwargs, self.depth_book_shown),
+                                has_order_book='order_book' in kwargs)
+
+    def get_envelope(self, message_type, has_order_book=True):
+        envelope = {
+            'type': message_type,
+            'shares': self.shares,
+            'cash': self.cash,
+            'pnl': self.get_current_pnl(),
+            'inventory': dict(shares=self.shares, cash=self.cash),
+            'trader_orders': self.orders or [],
+            'initial_cash': self.initial_cash,
+            'initial_shares': self.initial_shares,
+            'sum_dinv': self.sum_dinv,
+            'vwap': self.get_vwap(),
+        }
+        if not has_order_book:
+            envelope['order_book'] = self.get_order_book_to_show()  # the client always gets the latest book we know
+        return envelope
 
+    async def send_payload(self, message_type, market_data: str, has_order_book=True, conflatable=False):
+        """
+        Queues the encoded market data part together with this trader's envelope as one JSON text frame. The socket
+        is written by the trader's WebSocketSender, so a slow client doesn't hold up the handling of the messages.
+        Conflatable frames may be replaced by a newer one if the client hasn't got them yet.
+        """
         if not self.websocket or self.websocket.client_state != WebSocketState.CONNECTED:
             logger.warning("WebSocket is closed or not set yet. Skipping message send.")
             return
 
-        if not self.socket_status:
+        if not self.socket_status or self.sender is None or self.sender.closed:
+            self.socket_status = False
             logger.warning("WebSocket is closed. Skipping message send.")
             return  # Skip sending the message or handle accordingly
 
-        trader_orders = self.orders or []
-        order_book = self.order_book or {'bids': [], 'asks': []}
-        kwargs['trader_orders'] = trader_orders
-        try:
-            return await self.websocket.send_json(
-                {"shares": self.shares,
-                 "cash": self.cash,
-                 "pnl": self.get_current_pnl(),
-
-                 'type': message_type,
-                 'inventory': dict(shares=self.shares, cash=self.cash),
-
-                 **kwargs,
-                 'order_book': order_book,
-                 'initial_cash': self.initial_cash,
-                 'initial_shares': self.initial_shares,
-                 'sum_dinv': self.sum_dinv,
-                 'vwap': self.get_vwap()
-                 }
-            )
-        except WebSocketDisconnect:
-            self.socket_status = False
-            logger.warning("WebSocket is disconnected. Unable to send message.")
-
-        except Exception as e:
-            logger.error(f"An error occurred while sending a message: {e}")
-            # Handle other potential exceptions
+        envelope = json.dumps(self.get_envelope(message_type, has_order_book), cls=CustomEncoder)
+        self.sender.send(splice_json_objects(envelope, market_data), market_data=conflatable)
 
     async def on_message_from_client(self, message):
         """
@@ -87,9 +176,9 @@ class HumanTrader(BaseTrader):
             if handler:
                 await handler(data)
             else:
-                logger.critical(f"Do not recognice the type: {action_type}. Invalid message format: {message}")
+                logger.warning("Do not recognice the type: %s. Invalid message format: %s", action_type, message)
         except json.JSONDecodeError:
-            logger.critical(f"Error decoding message: {message}")
+            logger.error("Error decoding message: %s", message)
 
     async def handle_add_order(self, data):
         order_type = data.get('type')  # TODO: Philipp. This is a string. We need to convert it to an enum.
@@ -102,15 +191,24 @@ class HumanTrader(BaseTrader):
 
     async def handle_cancel_order(self, data):
         order_uuid = data.get('id')
-        logger.info(f"Cancel order request received: {data}")
+        logger.info("Cancel order request received: %s", data)
 
         if order_uuid in [order['id'] for order in self.orders]:
             await self.send_cancel_order_request(order_uuid)
         else:
             # Handle the case where the order UUID does not exist
-            logger.warning(f"Order with UUID {order_uuid} not found.")
+            logger.warning("Order with UUID %s not found.", order_uuid)
+
+    async def handle_amend_order(self, data):
+        order_uuid = data.get('id')
+        logger.info("Amend order request received: %s", data)
+
+        if order_uuid in [order['id'] for order in self.orders]:
+            await self.send_amend_order_request(order_uuid, price=data.get('price'), amount=data.get('amount'))
+        else:
+            logger.warning("Order with UUID %s not found.", order_uuid)
 
     async def handle_closure(self, data):
-        logger.critical('Human trader is closing')
+        logger.info('Human trader is closing')
         await self.post_processing_server_message(data)
         await super().handle_closure(data)
@@ -1,15 +1,19 @@
-import asyncio
 import random
 from datetime import datetime
-from structures import OrderType, TraderType
+from external_traders.informed_naive import ExecutionSchedule
+from structures import OrderType, TraderType, MarketDataTopic, str_to_order_type
 from main_platform.custom_logger import setup_custom_logger
-from main_platform.utils import convert_to_book_format
+from main_platform.utils import convert_order_book_to_book_format
 from .base_trader import BaseTrader
 
 logger = setup_custom_logger(__name__)
 
 
 class InformedTrader(BaseTrader):
+    # the informed trader only hits the best bid or the best ask, of the BotScheduler's snapshot
+    subscriptions = [MarketDataTopic.CONTROL]
+    checkpoint_attributes = BaseTrader.checkpoint_attributes + ['informed_state', 'schedule_cursor']
+
     def __init__(
         self,
         activity_frequency: int,
@@ -28,24 +32,45 @@ class InformedTrader(BaseTrader):
         self.settings = settings
         self.settings_informed = settings_informed
         self.informed_time_plan = informed_time_plan
+        # the plan is turned into a schedule once; its cursor is this trader's progress through the plan
+        self.schedule = ExecutionSchedule(informed_time_plan["period"], informed_time_plan.get("shares"))
         self.informed_state = informed_state
         self.get_signal_informed = get_signal_informed
         self.get_order_to_match = get_order_to_match
 
+    def get_next_activation_delay(self):
+        """
+        wakes up at the next time of the precomputed plan. None when the plan is over or nothing is left to trade.
+        """
+        if self.informed_state.get("inv") == 0:
+            return None
+        next_time = self.schedule.next_time()
+        if next_time is None:
+            return None
+        return max(next_time - self.get_elapsed_time(), 0)
+
+    @property
+    def schedule_cursor(self):
+        return self.schedule.cursor
+
+    @schedule_cursor.setter
+    def schedule_cursor(self, cursor):
+        self.schedule.cursor = cursor
+
     async def act(self):
         """
         Loads signal and generates orders.
         """
-        # prep the order book based on active orders
-        book = convert_to_book_format(self.active_orders)
+        # prep the order book based on the best levels
+        book = convert_order_book_to_book_format(self.order_book)
 
-        elapsed_time_sec = int(self.get_elapsed_time())
+        elapsed_time_sec = self.get_elapsed_time()
 
         try:
             signal_informed = self.get_signal_informed(
                 self.informed_state,
                 self.settings_informed,
-                self.informed_time_plan,
+                self.schedule,
                 elapsed_time_sec,
             )
             order_dict = self.get_order_to_match(
@@ -57,7 +82,8 @@ class InformedTrader(BaseTrader):
                 elapsed_time_sec,
             )
 
-            for order_type, orders in order_dict.items():
+            for side, orders in order_dict.items():
+                order_type = str_to_order_type[side]
                 for price, amounts in orders.items():
                     for amount in amounts:
                         # if the order to be matched is a bid, we send an ask order to match that bid
@@ -66,7 +92,7 @@ class InformedTrader(BaseTrader):
                         # if the order to be matched is an ask, we send a bid order to match that ask
                         elif order_type == OrderType.ASK:
                             await self.post_new_order(amount, price, OrderType.BID)
-                        logger.critical(
+                        logger.info(
                             "MATCHING %s AT %s AMOUNT %s AT TIME %s",
                             order_type,
                             price,
@@ -74,24 +100,4 @@ class InformedTrader(BaseTrader):
                             elapsed_time_sec,
                         )
         except Exception as e:
-            print(e)
-
-    async def run(self):
-        """
-        trades at each step.
-        """
-        while not self._stop_requested.is_set():
-            try:
-                await self.act()
-                await asyncio.sleep(1)
-
-            except asyncio.CancelledError:
-                logger.info(
-                    "Run method cancelled, performing cleanup of %s...",
-                    self.trader_type,
-                )
-                await self.clean_up()
-                raise
-            except Exception as e:
-                logger.error("An error occurred in InformedTrader run loop: %s", e)
-                break
+            logger.error("Informed trader %s failed to act: %s", self.id, e)
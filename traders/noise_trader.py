@@ -1,9 +1,8 @@
-import asyncio
 import random
 import numpy as np
-from structures import OrderType, TraderType
+from structures import OrderType, TraderType, MarketDataTopic
 from main_platform.utils import (
-    convert_to_book_format,
+    convert_order_book_to_book_format,
     convert_to_noise_state,
     convert_to_trader_actions,
 )
@@ -14,6 +13,13 @@ logger = setup_custom_logger(__name__)
 
 
 class NoiseTrader(BaseTrader):
+    # the noise rule looks at 10 levels of the book and at own orders (for cancellations) only. The book comes from
+    # the BotScheduler's snapshot, so only the own orders are subscribed to
+    subscriptions = [
+        MarketDataTopic.CONTROL,
+        MarketDataTopic.PRIVATE_ORDERS,
+    ]
+
     def __init__(
         self,
         activity_frequency: float,
@@ -43,11 +49,19 @@ class NoiseTrader(BaseTrader):
         interval = np.random.exponential(target)
         return interval
 
+    def get_next_activation_delay(self):
+        """
+        noise traders arrive as a poisson process, so the time to the next activation is exponential.
+        """
+        return self.cooling_interval(target=self.activity_frequency)
+
     async def act(self):
         """
-        generates action based on active orders in the market.
+        generates action based on the current state of the order book.
         """
-        if not self.active_orders:
+        bid_levels = self.order_book.get("bids", [])
+        ask_levels = self.order_book.get("asks", [])
+        if not bid_levels and not ask_levels:
             await self.post_new_order(
                 self.order_amount,
                 self.settings["initial_price"],
@@ -55,7 +69,9 @@ class NoiseTrader(BaseTrader):
             )
             return
 
-        book_format = convert_to_book_format(self.active_orders)
+        book_format = convert_order_book_to_book_format(
+            self.order_book, levels_n=10, default_price=self.settings["initial_price"]
+        )
         noise_state = convert_to_noise_state(self.orders)
         signal_noise = self.get_signal_noise(
             signal_state=None, settings_noise=self.settings_noise
@@ -65,12 +81,7 @@ class NoiseTrader(BaseTrader):
         )
         orders = convert_to_trader_actions(noise_orders)
 
-        bid_count, ask_count = 0, 0
-        for order in self.active_orders:
-            if order["order_type"] == OrderType.BID:
-                bid_count += 1
-            elif order["order_type"] == OrderType.ASK:
-                ask_count += 1
+        bid_count, ask_count = len(bid_levels), len(ask_levels)
 
         order_type_override = None
         order_type = None
@@ -117,33 +128,3 @@ class NoiseTrader(BaseTrader):
                 order_id = random.choice(matching_orders)["id"]
                 await self.send_cancel_order_request(order_id)
                 logger.info("CANCELLED %s ID %s", order["order_type"], order_id[:10])
-
-    async def warm_up(self, number_of_warmup_orders: int):
-        """
-        places warmup orders to poulate order book.
-        """
-        for _ in range(number_of_warmup_orders):
-            await self.act()
-
-    async def run(self):
-        """
-        trades at cooling intervals.
-        """
-        while not self._stop_requested.is_set():
-            try:
-                await self.act()
-
-                await asyncio.sleep(
-                    self.cooling_interval(target=self.activity_frequency)
-                )
-
-            except asyncio.CancelledError:
-                logger.info(
-                    "Run method cancelled, performing cleanup of %s...",
-                    self.trader_type,
-                )
-                await self.clean_up()
-                raise
-            except Exception as e:
-                logger.error("An error occurred in NoiseTrader run loop: %s", e)
-                break
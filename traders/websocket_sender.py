@@ -0,0 +1,117 @@
+"""
+Outbound queue of one human trader's websocket.
+
+Handling a message from the trading system only puts the frame to the queue, and a separate task writes the frames
+to the socket, so a slow browser never holds up the trader's consumer (and, behind it, the broker queue).
+
+Market data frames are conflated: if the previous market data frame is still waiting when a new one comes, the old
+one is thrown away and the new one takes the end of the queue, so a slow client gets the latest state rather than a
+backlog of stale books. All other frames (fills, order acknowledgements, control messages) are always delivered,
+in order. If a client falls so far behind that more than `max_frames` of these are waiting, it is disconnected; the
+frames are counted as dropped and the client gets a fresh snapshot when it reconnects.
+"""
+import asyncio
+from collections import deque
+
+from main_platform.custom_logger import setup_custom_logger
+from main_platform.metrics import get_session_metrics
+
+logger = setup_custom_logger(__name__)
+
+MAX_PENDING_FRAMES = 1000
+
+
+class WebSocketSender:
+    def __init__(self, websocket, session_id=None, max_frames=MAX_PENDING_FRAMES):
+        self.websocket = websocket
+        self.max_frames = max_frames
+        self.metrics = get_session_metrics(session_id) if session_id else None
+        self._frames = deque()  # [frame, is_market_data]; a conflated frame is set to None in place
+        self._pending_market_data = None
+        self._n_frames = 0
+        self._wakeup = asyncio.Event()
+        self._sending = False
+        self._task = None
+        self.closed = False
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+        return self
+
+    def count(self, outcome, n=1):
+        if self.metrics and n:
+            self.metrics.count_websocket_frames(outcome, n)
+
+    def send(self, frame: str, market_data=False):
+        """Queues the frame; it never waits for the socket."""
+        if self.closed:
+            self.count('dropped')
+            return
+        entry = [frame, market_data]
+        if market_data:
+            if self._pending_market_data is not None:
+                self._pending_market_data[0] = None
+                self._n_frames -= 1
+                self.count('conflated')
+            self._pending_market_data = entry
+        self._frames.append(entry)
+        self._n_frames += 1
+        if self._n_frames > self.max_frames:
+            logger.warning('Websocket client is %s frames behind, disconnecting it', self._n_frames)
+            self.close()
+            return
+        self._wakeup.set()
+
+    async def run(self):
+        try:
+            while not self.closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._frames and not self.closed:
+                    entry = self._frames.popleft()
+                    if entry[0] is None:
+                        continue  # conflated with a newer one
+                    self._n_frames -= 1
+                    if entry is self._pending_market_data:
+                        self._pending_market_data = None
+                    self._sending = True
+                    try:
+                        await self.websocket.send_text(entry[0])
+                    finally:
+                        self._sending = False
+                    self.count('sent')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning('Websocket sender stopped: %s', e)
+            self.close(close_websocket=False)
+
+    async def stop(self, timeout=5):
+        """Gives the sender up to `timeout` seconds to write out what is waiting (the closure message, for instance)
+        and stops it. The websocket itself is left to its endpoint."""
+        if self._task and not self.closed:
+            deadline = asyncio.get_running_loop().time() + timeout
+            while (self._n_frames or self._sending) and not self._task.done() and asyncio.get_running_loop().time() < deadline:
+                await asyncio.sleep(0.01)
+        self.close(close_websocket=False)
+
+    def close(self, close_websocket=True):
+        """Stops sending right away. The frames that were still waiting are counted as dropped."""
+        if self.closed:
+            return
+        self.closed = True
+        self.count('dropped', self._n_frames)
+        self._frames.clear()
+        self._n_frames = 0
+        self._pending_market_data = None
+        self._wakeup.set()
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
+        if close_websocket:
+            asyncio.ensure_future(self.close_websocket())
+
+    async def close_websocket(self):
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass  # it is already gone